@@ -5,7 +5,7 @@ import numpy as np
 import statistics
 from byzantine_mab_results import *
 from byzantine_mab_configs import *
-from collections import defaultdict
+from fault_schedules import *
 
 
 def getAverageLatencyOverObsPeriodForEachRound(latencies, observationPeriodStarts):
@@ -311,7 +311,7 @@ if __name__ == "__main__":
 
     res = joblib.load(res_fname)
 
-    superConfig = readSuperConfigYaml(configFileName)
+    superConfig = readSuperConfig(configFileName)
     runConfig = superConfig.getRunConfig()
     mabConfig = superConfig.getMultiArmedBanditConfig()
     roundConfig = superConfig.getRoundConfig()
@@ -377,12 +377,8 @@ if __name__ == "__main__":
     # trueMValues = res.trueFaultyNodesCount
     # print(trueMValues)
 
-    trueMValues = []
-    trueMValue = 0
-    for i in range(len(res.perRoundResults)):
-        if (i in byzantineErrorConfig.consensusRoundToSetMValue.keys()):
-            trueMValue = byzantineErrorConfig.consensusRoundToSetMValue[i]
-        trueMValues.append(trueMValue)
+    trueMValues = getTrueFaultyCounts(byzantineErrorConfig.consensusRoundToSetMValue,
+                                      len(res.perRoundResults)).tolist()
 
     selectedMValues = []
     for singleRoundResult in res.perRoundResults:
@@ -400,54 +396,20 @@ if __name__ == "__main__":
     plotChosenMValuesAgainstTrueFaultyNodes(trueMValues, selectedMValues, observationPeriodStarts)
 
 
-    # Plot failures (maybe with time with different y axis?) TODO (how?)
-    percentFailuresByMValue = {}
-
-    failuresByMValue = defaultdict(int)
-    successesByMValue = defaultdict(int)
-    totalFailures = 0
     didFailByRound = []
     for singleRoundResult in res.perRoundResults:
         didFailByM = singleRoundResult.didFail
         if (len(didFailByM) != 1):
             print("There should only be 1 m value in the results")
             exit(1)
-        didFail = None
-        mVal = None
-        for indivMVal, didFailForM in didFailByM.items():
-            didFail = didFailForM
-            mVal = indivMVal
-
-        if (didFail):
-            totalFailures += 1
-            failuresByMValue[mVal] += 1
-        else:
-            successesByMValue[mVal] += 1
-        didFailByRound.append(didFail)
-
-    mValues = list(failuresByMValue.keys())
-    mValues.extend(successesByMValue.keys())
-
-    for mVal in set(mValues):
-        numFailures = failuresByMValue[mVal]
-        percentFailuresByMValue[mVal] = numFailures / (numFailures + successesByMValue[mVal])
+        didFailByRound.append(list(didFailByM.values())[0])
 
     # Plot the percentage of failed consensus rounds per observation period along with the chosen m value
     # plt.figure()
     plotPercentFailuresPerObservationPeriod(didFailByRound, selectedMValues, observationPeriodStarts)
 
-    # Compute % of time that m value is greater than true value of m (safe)
-
-    numSafeMValues = 0
-
-    for i in range(numConsensusRounds):
-        trueM = trueMValues[i]
-        selectedMValue = selectedMValues[i]
-        if (selectedMValue >= trueM):
-            numSafeMValues += 1
-
-    percentSafeMValues = numSafeMValues / numConsensusRounds
-    print("Percent of Consensus Rounds Where M was Sufficiently Conservative: " + str(percentSafeMValues))
+    # Failure rates by m value, % of time that m value is greater than true value of m (safe), regret, etc.
+    print(res.getRoundMetrics().getReport(mabConfig))
 
     # TODO do we actually need this
     # TODO Number of observation periods to converge to ideal value -- can this be a CDF?
@@ -0,0 +1,171 @@
+import asyncio
+import queue
+from network_manager import *
+
+# Seconds between checks of a channel that can't be waited on directly (shared memory ring buffers)
+ASYNC_POLL_INTERVAL_SEC = 0.0005
+
+# Seconds between checks while waiting for a node to consume its queue
+ASYNC_DRAIN_CHECK_INTERVAL_SEC = 0.001
+
+# Seconds to wait before retrying a delivery to a node whose channel is full
+ASYNC_FULL_RETRY_INTERVAL_SEC = 0.001
+
+
+def getQueueReaderFileno(channel):
+    """
+    Get the file descriptor of the pipe that a multiprocessing.Queue is read from, so that the event loop can wait for
+    the queue to become readable.
+
+    multiprocessing.Queue doesn't expose its pipe publicly: this relies on the private _reader attribute of CPython's
+    implementation (a multiprocessing.connection.Connection). This is the only place that touches it. If it is missing
+    or has no usable file descriptor (another Python implementation or version, or a channel that isn't a
+    multiprocessing.Queue, like the shared memory ring buffers), the channel is polled instead.
+
+    :param channel: Channel to read messages from.
+
+    :return: File descriptor, or None if the channel can't be waited on (and must be polled).
+    """
+    reader = getattr(channel, "_reader", None)
+    if (reader is None):
+        return None
+    try:
+        return reader.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class AsyncNetworkManager(NetworkManager):
+    """
+    Version of the network manager that runs its control loop on an asyncio event loop instead of repeatedly polling
+    every node.
+
+    Each node has a reader coroutine that sleeps until the node's queue is readable, delayed deliveries are scheduled
+    with call_at on the event loop instead of being re-put into a priority queue until they are due, and result
+    collection waits on a future that is completed when the last node reports. The manager uses almost no CPU while
+    waiting and delivers messages as soon as their delay has elapsed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the network. Takes the same arguments as NetworkManager.
+        """
+        NetworkManager.__init__(self, *args, **kwargs)
+        self.eventLoop = asyncio.new_event_loop()
+        # Future that is completed once every node has delivered results for the current round
+        self.allResultsFuture = None
+        self.readerTasks = [self.eventLoop.create_task(self.readNodeMessages(i)) for i in range(self.numNodes)]
+
+    def getReaderFileno(self, nodeNum):
+        """
+        Get the file descriptor that becomes readable when the given node sends a message.
+
+        :param nodeNum: Node to get the file descriptor for.
+
+        :return: File descriptor, or None if the channel from the node can't be waited on (and must be polled).
+        """
+        return getQueueReaderFileno(self.fromNodeQueues[nodeNum])
+
+    async def waitUntilReadable(self, fileno):
+        """
+        Wait until the given file descriptor is readable.
+
+        :param fileno:  File descriptor to wait on.
+        """
+        readableFuture = self.eventLoop.create_future()
+        self.eventLoop.add_reader(fileno, readableFuture.set_result, None)
+        try:
+            await readableFuture
+        finally:
+            self.eventLoop.remove_reader(fileno)
+
+    async def readNodeMessages(self, nodeNum):
+        """
+        Coroutine that handles messages from a node as they arrive.
+
+        :param nodeNum: Node to read messages from.
+        """
+        fileno = self.getReaderFileno(nodeNum)
+        while True:
+            if (fileno is not None):
+                await self.waitUntilReadable(fileno)
+            else:
+                await asyncio.sleep(ASYNC_POLL_INTERVAL_SEC)
+            self.readMessagesFromNode(nodeNum)
+
+    def handleMessageFromNode(self, nodeNum, incomingMsg):
+        NetworkManager.handleMessageFromNode(self, nodeNum, incomingMsg)
+        if ((self.allResultsFuture is not None) and (not self.allResultsFuture.done()) and
+                self.checkAllNodesDeliveredResults()):
+            self.allResultsFuture.set_result(None)
+
+    def scheduleDelivery(self, dest, msgDelay, passMsg):
+        """
+        Schedule a message to be delivered to a node after the given delay.
+
+        :param dest:        Id of the node that should receive the message.
+        :param msgDelay:    Milliseconds to wait before delivering the message.
+        :param passMsg:     Message to deliver (with any corruption already applied).
+        """
+        self.eventLoop.call_at(self.eventLoop.time() + (msgDelay / 1000.0), self.deliverMessage, dest, passMsg)
+
+    def deliverMessage(self, dest, passMsg):
+        """
+        Deliver a message whose delay has elapsed.
+
+        :param dest:        Id of the node that should receive the message.
+        :param passMsg:     Message to deliver.
+        """
+        if (not self.isMessageFromCurrentRound(passMsg)):
+            # Scheduled during an earlier round; no longer relevant to the node
+            return
+        try:
+            self.toNodeQueues[dest].put_nowait(passMsg)
+        except queue.Full:
+            self.eventLoop.call_later(ASYNC_FULL_RETRY_INTERVAL_SEC, self.deliverMessage, dest, passMsg)
+
+    async def collectNodeResults(self):
+        """
+        Wait until every node has delivered results for the current round.
+        """
+        if (self.checkAllNodesDeliveredResults()):
+            return
+        self.allResultsFuture = self.eventLoop.create_future()
+        try:
+            await self.allResultsFuture
+        finally:
+            self.allResultsFuture = None
+
+    def waitForNodeResponses(self):
+        """
+        Run the event loop (handling node messages and deliveries) until we have results for all nodes.
+        """
+        self.eventLoop.run_until_complete(self.collectNodeResults())
+
+    async def waitForQueueToDrainAsync(self, toNodeQueue):
+        """
+        Wait until the node reading from the given queue has consumed everything in it, handling node messages in the
+        meantime.
+
+        :param toNodeQueue: Queue from the network manager to a node.
+        """
+        while (not toNodeQueue.empty()):
+            await asyncio.sleep(ASYNC_DRAIN_CHECK_INTERVAL_SEC)
+
+    def waitForQueueToDrain(self, toNodeQueue):
+        """
+        Wait until the node reading from the given queue has consumed everything in it.
+
+        :param toNodeQueue: Queue from the network manager to a node.
+        """
+        self.eventLoop.run_until_complete(self.waitForQueueToDrainAsync(toNodeQueue))
+
+    def shutdown(self):
+        """
+        Stop the event loop and shutdown the node processes.
+        """
+        for readerTask in self.readerTasks:
+            readerTask.cancel()
+        self.eventLoop.run_until_complete(asyncio.gather(*self.readerTasks, return_exceptions=True))
+        self.eventLoop.close()
+        NetworkManager.shutdown(self)
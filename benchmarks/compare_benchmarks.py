@@ -0,0 +1,68 @@
+"""
+Compare two result files written by benchmarks/consensus_round_benchmark.py (e.g. from two commits).
+
+Run from the repository root:
+
+    python -m benchmarks.compare_benchmarks baseline.json candidate.json [regressionThreshold]
+
+Exits with status 1 if any grid point's mean round wall time regressed by more than the threshold (default 0.1, i.e.
+10%).
+"""
+import json
+import sys
+
+DEFAULT_REGRESSION_THRESHOLD = 0.1
+
+
+def loadResultsByGridPoint(fileName):
+    """
+    Load benchmark results keyed by grid point.
+
+    :param fileName:    JSON file written by the consensus round benchmark.
+
+    :return: Tuple of (git commit of the run, dictionary of (n, m) to the results for that grid point).
+    """
+    with open(fileName) as resultsFile:
+        benchmarkResults = json.load(resultsFile)
+    return benchmarkResults["gitCommit"], {(gridPoint["numNodes"], gridPoint["mValue"]): gridPoint for gridPoint in
+                                           benchmarkResults["results"]}
+
+
+def getRatio(baselineValue, candidateValue):
+    if ((baselineValue is None) or (candidateValue is None) or (baselineValue == 0)):
+        return None
+    return candidateValue / baselineValue
+
+
+def formatRatio(ratio):
+    return "     n/a" if (ratio is None) else ("%7.2fx" % ratio)
+
+
+if __name__ == "__main__":
+    if ((len(sys.argv) != 3) and (len(sys.argv) != 4)):
+        print("Need arguments: baseline results file, candidate results file, optional regression threshold")
+        exit(1)
+    baselineCommit, baselineResults = loadResultsByGridPoint(sys.argv[1])
+    candidateCommit, candidateResults = loadResultsByGridPoint(sys.argv[2])
+    regressionThreshold = float(sys.argv[3]) if (len(sys.argv) == 4) else DEFAULT_REGRESSION_THRESHOLD
+
+    print("Baseline:  " + str(baselineCommit))
+    print("Candidate: " + str(candidateCommit))
+    print("  n  m   wall time   messages   bytes   manager cpu   manager rss")
+    regressions = []
+    for gridPoint in sorted(set(baselineResults.keys()) & set(candidateResults.keys())):
+        baseline = baselineResults[gridPoint]
+        candidate = candidateResults[gridPoint]
+        wallTimeRatio = getRatio(baseline["meanRoundWallTimeSec"], candidate["meanRoundWallTimeSec"])
+        print("%3d %2d    %s  %s %s %s      %s" % (
+            gridPoint[0], gridPoint[1], formatRatio(wallTimeRatio),
+            formatRatio(getRatio(baseline["messagesRelayedPerRound"], candidate["messagesRelayedPerRound"])),
+            formatRatio(getRatio(baseline["bytesPickledPerRound"], candidate["bytesPickledPerRound"])),
+            formatRatio(getRatio(baseline["managerCpuSec"], candidate["managerCpuSec"])),
+            formatRatio(getRatio(baseline.get("managerPeakRssKb"), candidate.get("managerPeakRssKb")))))
+        if ((wallTimeRatio is not None) and (wallTimeRatio > (1 + regressionThreshold))):
+            regressions.append(gridPoint)
+
+    if (regressions):
+        print("Wall time regressions at (n, m): " + str(regressions))
+        exit(1)
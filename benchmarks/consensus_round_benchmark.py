@@ -0,0 +1,279 @@
+"""
+End-to-end benchmark of consensus rounds over a grid of node counts (n) and m values.
+
+For each (n, m) this starts a network, runs a warm-up round and then the measured rounds through
+NetworkManager.startConsensusAndGetNodeLatenciesAndDecisions, and records:
+
+ - wall time per round
+ - messages relayed by the network manager and bytes pickled for them (estimated from a sample of the messages,
+   pickled after the measured rounds)
+ - peak RSS of the network manager (over the grid point only) and of each node process
+ - CPU time of the network manager and of each node process over the measured rounds
+
+Results are written as JSON so that runs from different commits can be compared with
+benchmarks/compare_benchmarks.py.
+
+Run from the repository root:
+
+    python -m benchmarks.consensus_round_benchmark --output output/bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import subprocess
+import time
+
+from byzantine_mab_configs import *
+from network_manager import *
+from async_network_manager import *
+
+DEFAULT_NODE_COUNTS = [4, 7, 10, 13, 16]
+DEFAULT_M_VALUES = [0, 1, 2, 3, 4]
+
+# Grid points that would relay more messages than this per round are skipped unless the limit is raised
+DEFAULT_MAX_MESSAGES_PER_ROUND = 200000
+
+
+# One in this many relayed messages is kept to estimate the bytes pickled per message from
+RELAY_BYTES_SAMPLE_INTERVAL = 64
+
+
+class RelayCountingMixin:
+    """
+    Counts the consensus messages the network manager relays and estimates the bytes they take up when pickled.
+
+    Only a reference to every RELAY_BYTES_SAMPLE_INTERVAL-th message is kept while relaying; the samples are pickled
+    afterwards (see getRelayedMessageBytes), so that measuring the bytes doesn't add to the wall and CPU time measured.
+    """
+
+    def resetRelayCounters(self):
+        self.relayedMessageCount = 0
+        self.sampledRelayedMessages = []
+
+    def scheduleDelivery(self, dest, msgDelay, passMsg):
+        if ((self.relayedMessageCount % RELAY_BYTES_SAMPLE_INTERVAL) == 0):
+            self.sampledRelayedMessages.append(passMsg)
+        self.relayedMessageCount += 1
+        super().scheduleDelivery(dest, msgDelay, passMsg)
+
+    def getRelayedMessageBytes(self):
+        """
+        Estimate the bytes pickled for the messages relayed since the counters were reset, from the sampled messages.
+        Call outside of the measured region.
+
+        :return: Estimated number of bytes.
+        """
+        if (len(self.sampledRelayedMessages) == 0):
+            return 0
+        sampledBytes = sum(len(pickle.dumps(sampledMsg, pickle.HIGHEST_PROTOCOL)) for sampledMsg in
+                           self.sampledRelayedMessages)
+        return (sampledBytes / len(self.sampledRelayedMessages)) * self.relayedMessageCount
+
+
+class BenchmarkNetworkManager(RelayCountingMixin, NetworkManager):
+    pass
+
+
+class BenchmarkAsyncNetworkManager(RelayCountingMixin, AsyncNetworkManager):
+    pass
+
+
+def getMessagesPerRound(numNodes, mValue):
+    """
+    Get the number of consensus messages sent in one round of OM(m).
+
+    :param numNodes:    Number of nodes.
+    :param mValue:      M value used in consensus.
+
+    :return: Number of messages exchanged between the nodes in one round.
+    """
+    totalMessages = 0
+    messagesAtDepth = 1
+    for depth in range(1, mValue + 2):
+        messagesAtDepth *= (numNodes - depth)
+        totalMessages += messagesAtDepth
+    return totalMessages
+
+
+def readProcessStats(pid):
+    """
+    Read the peak RSS and CPU time of a process from /proc.
+
+    :param pid: Process id.
+
+    :return: Tuple of (peak RSS in KB, CPU seconds). Entries are None if they couldn't be read (e.g. not on Linux).
+    """
+    peakRssKb = None
+    cpuSec = None
+    try:
+        with open("/proc/" + str(pid) + "/status") as statusFile:
+            for line in statusFile:
+                if (line.startswith("VmHWM:")):
+                    peakRssKb = int(line.split()[1])
+        with open("/proc/" + str(pid) + "/stat") as statFile:
+            # The command name can contain spaces, so split after it
+            statFields = statFile.read().rsplit(")", 1)[1].split()
+            clockTicks = os.sysconf("SC_CLK_TCK")
+            cpuSec = (int(statFields[11]) + int(statFields[12])) / clockTicks
+    except (OSError, ValueError, IndexError):
+        pass
+    return peakRssKb, cpuSec
+
+
+def resetPeakRss():
+    """
+    Reset the peak RSS (VmHWM) of this process to its current RSS, so that the peak of each grid point can be read
+    instead of the peak over the whole run.
+
+    :return: True if it was reset, False if it couldn't be (e.g. not on Linux).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clearRefsFile:
+            clearRefsFile.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def getGitCommit():
+    """
+    Get the commit of the working tree being benchmarked.
+
+    :return: Commit hash, or None if it couldn't be determined.
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmarkGridPoint(numNodes, mValue, args):
+    """
+    Benchmark consensus rounds for one (n, m).
+
+    :param numNodes:    Number of nodes.
+    :param mValue:      M value used in consensus.
+    :param args:        Parsed command line arguments.
+
+    :return: Dictionary of results for the grid point.
+    """
+    isPeakRssReset = resetPeakRss()
+    networkLatencyConfig = NetworkLatencyConfig(args.average_latency_ms, args.latency_std_dev_ms,
+                                                args.max_latency_ms)
+    networkManagerClass = BenchmarkAsyncNetworkManager if args.use_async else BenchmarkNetworkManager
+    networkManager = networkManagerClass(networkLatencyConfig, numNodes, False, mValue, 0.0, True,
+                                         args.sleep_between_node_processing_ms, args.transport, args.peer_delivery,
+                                         precomputeRoundFaults=(not args.draw_faults_per_message))
+    networkManager.resetRelayCounters()
+    networkManager.changeNumFaultyNodes(min(args.faulty, (numNodes - 1) // 3))
+
+    # Warm-up round (process startup and first imports dominate the first round)
+    networkManager.updateFaultyNodes()
+    networkManager.startConsensusAndGetNodeLatenciesAndDecisions(True)
+
+    nodePids = [nodeProcess.pid for nodeProcess in networkManager.processes]
+    startNodeCpuSec = [readProcessStats(pid)[1] for pid in nodePids]
+    startManagerCpuSec = time.process_time()
+    networkManager.resetRelayCounters()
+
+    roundWallTimesSec = []
+    maxNodeLatenciesMs = []
+    for i in range(args.rounds):
+        networkManager.updateFaultyNodes()
+        roundStartTime = time.perf_counter()
+        latencies, consensuses, currentFaultyNodes = \
+            networkManager.startConsensusAndGetNodeLatenciesAndDecisions(bool(i % 2))
+        roundWallTimesSec.append(time.perf_counter() - roundStartTime)
+        maxNodeLatenciesMs.append(max(latencies[mValue].values()))
+
+    managerCpuSec = time.process_time() - startManagerCpuSec
+    nodeStats = [readProcessStats(pid) for pid in nodePids]
+    # Node processes are started for each grid point, but the manager's peak is only its own if it could be reset
+    managerPeakRssKb = readProcessStats(os.getpid())[0] if isPeakRssReset else None
+    nodeCpuSec = [(None if ((endStats[1] is None) or (startCpuSec is None)) else (endStats[1] - startCpuSec))
+                  for endStats, startCpuSec in zip(nodeStats, startNodeCpuSec)]
+    relayedMessageCount = networkManager.relayedMessageCount
+    relayedMessageBytes = networkManager.getRelayedMessageBytes()
+    networkManager.shutdown()
+
+    return {
+        "numNodes": numNodes,
+        "mValue": mValue,
+        "rounds": args.rounds,
+        "expectedMessagesPerRound": getMessagesPerRound(numNodes, mValue),
+        "roundWallTimesSec": roundWallTimesSec,
+        "meanRoundWallTimeSec": sum(roundWallTimesSec) / len(roundWallTimesSec),
+        "maxNodeLatenciesMs": maxNodeLatenciesMs,
+        "messagesRelayedPerRound": relayedMessageCount / args.rounds,
+        "bytesPickledPerRound": relayedMessageBytes / args.rounds,
+        "managerPeakRssKb": managerPeakRssKb,
+        "nodePeakRssKb": [stats[0] for stats in nodeStats],
+        "managerCpuSec": managerCpuSec,
+        "nodeCpuSec": nodeCpuSec,
+    }
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Benchmark consensus rounds over a grid of n and m values.")
+    parser.add_argument("--n", type=int, nargs="+", default=DEFAULT_NODE_COUNTS, help="Node counts to benchmark.")
+    parser.add_argument("--m", type=int, nargs="+", default=DEFAULT_M_VALUES, help="M values to benchmark.")
+    parser.add_argument("--rounds", type=int, default=3, help="Measured rounds per grid point.")
+    parser.add_argument("--faulty", type=int, default=0,
+                        help="Number of faulty nodes (capped at (n - 1) // 3 for each n).")
+    parser.add_argument("--max-messages", type=int, default=DEFAULT_MAX_MESSAGES_PER_ROUND,
+                        help="Skip grid points that exchange more messages than this per round.")
+    parser.add_argument("--transport", default=QUEUE_MESSAGE_TRANSPORT,
+                        choices=[QUEUE_MESSAGE_TRANSPORT, SHARED_MEMORY_MESSAGE_TRANSPORT])
+    parser.add_argument("--use-async", action="store_true", help="Use the asyncio network manager.")
+    parser.add_argument("--peer-delivery", action="store_true", help="Deliver consensus messages peer-to-peer.")
+    parser.add_argument("--draw-faults-per-message", action="store_true",
+                        help="Draw each message's latency and faults as it is sent instead of when the round starts.")
+    parser.add_argument("--average-latency-ms", type=float, default=20)
+    parser.add_argument("--latency-std-dev-ms", type=float, default=7)
+    parser.add_argument("--max-latency-ms", type=float, default=50)
+    parser.add_argument("--sleep-between-node-processing-ms", type=float, default=0.1)
+    parser.add_argument("--output", help="File to write the JSON results to.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method('spawn')
+    args = parseArgs()
+
+    gridResults = []
+    for numNodes in args.n:
+        for mValue in args.m:
+            if (mValue > (numNodes - 2)):
+                # A chain of commanding generals can't be longer than the number of other nodes
+                print("Skipping n=" + str(numNodes) + ", m=" + str(mValue) + ": m must be at most n - 2")
+                continue
+            messagesPerRound = getMessagesPerRound(numNodes, mValue)
+            if (messagesPerRound > args.max_messages):
+                print("Skipping n=" + str(numNodes) + ", m=" + str(mValue) + ": " + str(
+                    messagesPerRound) + " messages per round (raise --max-messages to include)")
+                continue
+            gridPointResults = benchmarkGridPoint(numNodes, mValue, args)
+            gridResults.append(gridPointResults)
+            print("n=%-3d m=%d  %9.3f s/round  %9.0f msgs/round  %11.0f bytes/round  manager cpu %.2f s" % (
+                numNodes, mValue, gridPointResults["meanRoundWallTimeSec"],
+                gridPointResults["messagesRelayedPerRound"], gridPointResults["bytesPickledPerRound"],
+                gridPointResults["managerCpuSec"]), flush=True)
+
+    benchmarkResults = {
+        "gitCommit": getGitCommit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "cpuCount": os.cpu_count(),
+        "settings": vars(args),
+        "results": gridResults,
+    }
+    if (args.output is not None):
+        outputDir = os.path.dirname(args.output)
+        if (outputDir):
+            os.makedirs(outputDir, exist_ok=True)
+        with open(args.output, "w") as outputFile:
+            json.dump(benchmarkResults, outputFile, indent=1)
+        print("Wrote results to " + args.output)
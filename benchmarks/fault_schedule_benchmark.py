@@ -0,0 +1,72 @@
+"""
+Benchmark for generating the true number of faulty nodes in each round for a sweep of many configs.
+
+Compares the old per-config loop (draw a count and a persistence length at a time into a dict of changes, then expand
+the dict round by round) against the vectorized generators in fault_schedules, which draw every schedule of the sweep at
+once.
+
+Run from the repository root:
+
+    python -m benchmarks.fault_schedule_benchmark [numSchedules] [numRounds] [maxFaulty]
+"""
+import sys
+import time
+
+import numpy as np
+
+from fault_schedules import *
+
+DEFAULT_NUM_SCHEDULES = 10000
+DEFAULT_NUM_ROUNDS = 2000
+DEFAULT_MAX_FAULTY = 3
+
+# Rounds per observation period and observation periods that a count persists for, as in byzantine_mab_config_writer
+ROUNDS_PER_OBSERVATION_PERIOD = 15
+PERSISTENCE_LENGTHS = (np.arange(12, 20) * ROUNDS_PER_OBSERVATION_PERIOD).tolist()
+
+PROCESS_PARAMS = {
+    STEP_FAULT_SCHEDULE: {"persistenceLengths": PERSISTENCE_LENGTHS},
+    MARKOV_FAULT_SCHEDULE: {"switchProbability": 0.005},
+    PERIODIC_BURST_FAULT_SCHEDULE: {"period": 500, "burstLength": 100},
+    DRIFT_FAULT_SCHEDULE: {"driftStdDev": 0.1},
+}
+
+
+def generateLoopStepSchedule(randomGenerator, numRounds, maxFaulty):
+    consensusRoundToSetMValue = {}
+    roundForNextM = 0
+    while (roundForNextM < numRounds):
+        consensusRoundToSetMValue[roundForNextM] = int(randomGenerator.integers(0, maxFaulty + 1))
+        roundForNextM += int(PERSISTENCE_LENGTHS[randomGenerator.integers(len(PERSISTENCE_LENGTHS))])
+
+    trueFaultyCounts = []
+    trueFaultyCount = 0
+    for i in range(numRounds):
+        if (i in consensusRoundToSetMValue.keys()):
+            trueFaultyCount = consensusRoundToSetMValue[i]
+        trueFaultyCounts.append(trueFaultyCount)
+    return trueFaultyCounts
+
+
+if __name__ == "__main__":
+    numSchedules = int(sys.argv[1]) if (len(sys.argv) > 1) else DEFAULT_NUM_SCHEDULES
+    numRounds = int(sys.argv[2]) if (len(sys.argv) > 2) else DEFAULT_NUM_ROUNDS
+    maxFaulty = int(sys.argv[3]) if (len(sys.argv) > 3) else DEFAULT_MAX_FAULTY
+    randomGenerator = np.random.default_rng(0)
+
+    # The loop is slow, so time it on a sample of the schedules
+    loopSchedules = min(numSchedules, 500)
+    startTime = time.perf_counter()
+    for i in range(loopSchedules):
+        generateLoopStepSchedule(randomGenerator, numRounds, maxFaulty)
+    loopSec = time.perf_counter() - startTime
+    print("%-8s loop        %10.0f schedules/s" % (STEP_FAULT_SCHEDULE, loopSchedules / loopSec))
+
+    for process in FAULT_SCHEDULE_PROCESSES:
+        startTime = time.perf_counter()
+        faultSchedules = generateFaultSchedules(process, randomGenerator, numSchedules, numRounds, maxFaulty,
+                                                **PROCESS_PARAMS[process])
+        vectorizedSec = time.perf_counter() - startTime
+        meanChanges = np.count_nonzero(np.diff(faultSchedules, axis=1)) / numSchedules
+        print("%-8s vectorized  %10.0f schedules/s  (%.1f changes per schedule)" % (
+            process, numSchedules / vectorizedSec, meanChanges))
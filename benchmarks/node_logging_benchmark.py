@@ -0,0 +1,112 @@
+"""
+Benchmark for the cost of debug logging on the node's hot path when debug output is disabled.
+
+Runs a single node in-process (no network manager, no other processes) through complete consensus rounds by feeding it
+every consensus message it would receive in OM(m) with a loyal commanding general. The node logs with deferred
+formatting; the eager variant reproduces the old behavior of building every debug string (including the str() of the
+whole results tree on each hasReceivedAllExpectedMessages call) before the debug check discarded it.
+
+Run from the repository root:
+
+    python -m benchmarks.node_logging_benchmark [numNodes] [mValue] [rounds]
+"""
+import itertools
+import logging
+import queue
+import sys
+import time
+
+from network_node import *
+
+DEFAULT_NUM_NODES = 13
+DEFAULT_M_VALUE = 3
+DEFAULT_ROUNDS = 5
+
+# The node being benchmarked and the commanding general
+BENCHMARK_NODE_NUM = 1
+COMMANDING_GENERAL_NUM = 0
+
+
+class EagerNodeLoggerAdapter(NodeLoggerAdapter):
+    """
+    Node logger that builds every message before checking whether its level is enabled.
+    """
+
+    def log(self, level, msg, *args, **kwargs):
+        formattedMsg = self.prefix + (str(msg) % args if args else str(msg))
+        if (self.isEnabledFor(level)):
+            self.logger.log(level, formattedMsg, **kwargs)
+
+
+def getRoundMessages(numNodes, mValue, roundId):
+    """
+    Get the consensus messages that the benchmarked node receives in one round, in the order of the recursion.
+
+    :param numNodes:    Number of nodes.
+    :param mValue:      M value used in consensus.
+    :param roundId:     Id of the round.
+
+    :return: List of ConsensusMessages addressed to the benchmarked node.
+    """
+    relayingNodes = [i for i in range(numNodes) if i not in (COMMANDING_GENERAL_NUM, BENCHMARK_NODE_NUM)]
+    roundMessages = []
+    for chainLength in range(mValue + 1):
+        for relayChain in itertools.permutations(relayingNodes, chainLength):
+            commandingGeneralChain = [COMMANDING_GENERAL_NUM] + list(relayChain)
+            roundMessages.append(ConsensusMessage(commandingGeneralChain[-1], BENCHMARK_NODE_NUM, True,
+                                                  commandingGeneralChain, roundId))
+    return roundMessages
+
+
+def runRounds(node, numNodes, mValue, rounds):
+    """
+    Run the node through the given number of consensus rounds.
+
+    :param node:        Node to run.
+    :param numNodes:    Number of nodes.
+    :param mValue:      M value used in consensus.
+    :param rounds:      Number of rounds to run.
+
+    :return: Seconds spent processing each round.
+    """
+    roundTimesSec = []
+    for roundId in range(rounds):
+        roundMessages = getRoundMessages(numNodes, mValue, roundId)
+        startTime = time.perf_counter()
+        node.processControlMessage(ConsensusStartMessage(COMMANDING_GENERAL_NUM, roundId))
+        for msg in roundMessages:
+            node.handleConsensusMsg(msg)
+        roundTimesSec.append(time.perf_counter() - startTime)
+
+        if (not isinstance(node.pendingOutgoingMessages[-1], ConsensusResultMessage)):
+            print("Node didn't reach a decision in round " + str(roundId))
+            exit(1)
+        node.pendingOutgoingMessages.clear()
+    return roundTimesSec
+
+
+def createNode(numNodes, mValue, eagerLogging):
+    node = NetworkNode(BENCHMARK_NODE_NUM, queue.Queue(), queue.Queue(), False, 0, [mValue], float("inf"), numNodes)
+    if (eagerLogging):
+        node.logger = EagerNodeLoggerAdapter(logging.getLogger(NODE_LOGGER_NAME), BENCHMARK_NODE_NUM)
+    return node
+
+
+if __name__ == "__main__":
+    numNodes = int(sys.argv[1]) if (len(sys.argv) > 1) else DEFAULT_NUM_NODES
+    mValue = int(sys.argv[2]) if (len(sys.argv) > 2) else DEFAULT_M_VALUE
+    rounds = int(sys.argv[3]) if (len(sys.argv) > 3) else DEFAULT_ROUNDS
+
+    configureNodeLogging(False)
+    # The per-round "sending result" info message isn't part of what's being measured
+    logging.getLogger(NODE_LOGGER_NAME).setLevel(logging.WARNING)
+
+    print("n=" + str(numNodes) + ", m=" + str(mValue) + ": " + str(
+        len(getRoundMessages(numNodes, mValue, 0))) + " messages per round")
+    results = {}
+    for eagerLogging in (True, False):
+        label = "eager formatting" if eagerLogging else "lazy formatting"
+        roundTimesSec = runRounds(createNode(numNodes, mValue, eagerLogging), numNodes, mValue, rounds)
+        results[eagerLogging] = sum(roundTimesSec) / len(roundTimesSec)
+        print("%-17s %9.4f s/round" % (label, results[eagerLogging]))
+    print("Saving per round: %.4f s (%.1fx faster)" % (results[True] - results[False], results[True] / results[False]))
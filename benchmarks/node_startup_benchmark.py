@@ -0,0 +1,75 @@
+"""
+Benchmark for how long a network takes to start: the time from creating a network manager until the first message
+from a node reaches it, and until the nodes have finished a first m=0 round.
+
+Compares node processes that import the main module (this benchmark, which imports everything run_simulation does),
+as spawned processes did before node_process, against node processes that only import node_process and the modules
+the nodes are unpickled from, and against nodes started on an already running NodeWorkerPool.
+
+Run from the repository root:
+
+    python -m benchmarks.node_startup_benchmark [numNodes] [repetitions]
+"""
+import multiprocessing
+import sys
+import time
+
+import node_process
+from run_simulation import *
+
+DEFAULT_NUM_NODES = 13
+DEFAULT_REPETITIONS = 5
+
+MAIN_MODULE_STARTUP = "main module"
+MINIMAL_STARTUP = "node_process"
+POOLED_STARTUP = "worker pool"
+
+
+class FirstMessageTimingNetworkManager(NetworkManager):
+    """
+    Network manager that records when the first message from any node arrives.
+    """
+
+    firstMessageTime = None
+
+    def handleMessageFromNode(self, nodeNum, incomingMsg):
+        if (self.firstMessageTime is None):
+            self.firstMessageTime = time.perf_counter()
+        NetworkManager.handleMessageFromNode(self, nodeNum, incomingMsg)
+
+
+def timeStartup(numNodes, nodeWorkerPool=None):
+    """
+    Start a network, run one m=0 round and shut the network down.
+
+    :param numNodes:        Number of nodes.
+    :param nodeWorkerPool:  NodeWorkerPool to run the nodes on, or None to start a process for each node.
+
+    :return: Tuple of the seconds until the first message from a node arrived and until the round finished.
+    """
+    startTime = time.perf_counter()
+    networkManager = FirstMessageTimingNetworkManager(NetworkLatencyConfig(1, 0.5, 5), numNodes, False, 0, 0.0, True,
+                                                      0.1, nodeWorkerPool=nodeWorkerPool)
+    networkManager.updateFaultyNodes()
+    networkManager.startConsensusAndGetNodeLatenciesAndDecisions(True)
+    roundEndTime = time.perf_counter()
+    networkManager.shutdown()
+    return (networkManager.firstMessageTime - startTime, roundEndTime - startTime)
+
+
+if __name__ == "__main__":
+
+    multiprocessing.set_start_method('spawn')
+
+    numNodes = int(sys.argv[1]) if (len(sys.argv) > 1) else DEFAULT_NUM_NODES
+    repetitions = int(sys.argv[2]) if (len(sys.argv) > 2) else DEFAULT_REPETITIONS
+
+    with NodeWorkerPool(numNodes) as nodeWorkerPool:
+        for startup in [MAIN_MODULE_STARTUP, MINIMAL_STARTUP, POOLED_STARTUP]:
+            node_process.NODE_PROCESSES_IMPORT_MAIN_MODULE = (startup == MAIN_MODULE_STARTUP)
+            timings = [timeStartup(numNodes, nodeWorkerPool if (startup == POOLED_STARTUP) else None) for i in
+                       range(repetitions)]
+            firstMessageSec = sorted(timing[0] for timing in timings)[len(timings) // 2]
+            firstRoundSec = sorted(timing[1] for timing in timings)[len(timings) // 2]
+            print("%-12s n=%d  first message %7.3f s  first round %7.3f s  (median of %d)" % (
+                startup, numNodes, firstMessageSec, firstRoundSec, repetitions))
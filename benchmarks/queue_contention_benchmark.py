@@ -0,0 +1,128 @@
+"""
+Benchmark for contention on the node <-> network manager queues.
+
+Compares the old messaging pattern, where every multiprocessing.Queue was wrapped with its own multiprocessing.Lock
+that was held for whole drain and flush loops, against the lock-free pattern that relies on the queue's own
+synchronization. Each producer process plays the role of a node flushing batches of ConsensusMessages and the main
+process plays the role of the network manager draining every node's queue. On a single core the two patterns are at
+parity within the noise between trials; the locks were dropped for simplicity rather than throughput.
+
+Run from the repository root:
+
+    python -m benchmarks.queue_contention_benchmark [numNodes] [messagesPerNode] [batchSize]
+"""
+import multiprocessing
+import queue
+import sys
+import time
+from contextlib import contextmanager
+
+from network_messages import *
+
+DEFAULT_NUM_NODES = 13
+DEFAULT_MESSAGES_PER_NODE = 20000
+DEFAULT_BATCH_SIZE = 500
+
+
+@contextmanager
+def acquireTimeout(lock, timeout):
+    result = lock.acquire(timeout=timeout)
+    yield result
+    if result:
+        lock.release()
+
+
+def runProducer(nodeNum, numNodes, outgoingQueue, outgoingQueueLock, messagesPerNode, batchSize, startEvent):
+    """
+    Send messagesPerNode consensus messages to the consumer in batches, the way a node flushes its pending outgoing
+    messages.
+
+    :param nodeNum:             Number of the simulated node.
+    :param numNodes:            Total number of simulated nodes.
+    :param outgoingQueue:       Queue to the consumer.
+    :param outgoingQueueLock:   Lock held while flushing a batch, or None to rely on the queue's own synchronization.
+    :param messagesPerNode:     Number of messages to send.
+    :param batchSize:           Number of messages per flush.
+    :param startEvent:          Event that is set once all producers should start sending.
+    """
+    batch = [ConsensusMessage(nodeNum, (nodeNum + 1 + (i % (numNodes - 1))) % numNodes, bool(i % 2), [0, nodeNum], 1)
+             for i in range(batchSize)]
+    startEvent.wait()
+    sent = 0
+    while (sent < messagesPerNode):
+        toSend = batch[:min(batchSize, messagesPerNode - sent)]
+        if (outgoingQueueLock is not None):
+            with outgoingQueueLock:
+                for msg in toSend:
+                    outgoingQueue.put(msg)
+        else:
+            for msg in toSend:
+                outgoingQueue.put(msg)
+        sent += len(toSend)
+
+
+def runTrial(numNodes, messagesPerNode, batchSize, useLocks):
+    """
+    Run one trial of the benchmark.
+
+    :param numNodes:        Number of simulated nodes (producer processes).
+    :param messagesPerNode: Number of messages sent by each producer.
+    :param batchSize:       Number of messages per producer flush.
+    :param useLocks:        True to wrap each queue with a lock held for whole drain/flush loops.
+
+    :return: Tuple of (seconds to receive every message, number of times a lock was not available).
+    """
+    queues = [multiprocessing.Queue() for i in range(numNodes)]
+    locks = [(multiprocessing.Lock() if useLocks else None) for i in range(numNodes)]
+    startEvent = multiprocessing.Event()
+    producers = [multiprocessing.Process(target=runProducer, args=(
+        i, numNodes, queues[i], locks[i], messagesPerNode, batchSize, startEvent)) for i in range(numNodes)]
+    for producer in producers:
+        producer.start()
+
+    expectedMessages = numNodes * messagesPerNode
+    receivedMessages = 0
+    lockUnavailableCount = 0
+    startTime = time.perf_counter()
+    startEvent.set()
+    while (receivedMessages < expectedMessages):
+        for i in range(numNodes):
+            if (useLocks):
+                with acquireTimeout(locks[i], 0.5) as acquired:
+                    if acquired:
+                        while not queues[i].empty():
+                            queues[i].get()
+                            receivedMessages += 1
+                    else:
+                        lockUnavailableCount += 1
+            else:
+                while True:
+                    try:
+                        queues[i].get_nowait()
+                    except queue.Empty:
+                        break
+                    receivedMessages += 1
+    elapsedSeconds = time.perf_counter() - startTime
+
+    for producer in producers:
+        producer.join()
+    return elapsedSeconds, lockUnavailableCount
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method('spawn')
+
+    numNodes = int(sys.argv[1]) if (len(sys.argv) > 1) else DEFAULT_NUM_NODES
+    messagesPerNode = int(sys.argv[2]) if (len(sys.argv) > 2) else DEFAULT_MESSAGES_PER_NODE
+    batchSize = int(sys.argv[3]) if (len(sys.argv) > 3) else DEFAULT_BATCH_SIZE
+
+    print("Nodes: " + str(numNodes) + ", messages per node: " + str(messagesPerNode) + ", batch size: " + str(
+        batchSize))
+    results = {}
+    for useLocks in [True, False]:
+        label = "locked" if useLocks else "lock-free"
+        elapsedSeconds, lockUnavailableCount = runTrial(numNodes, messagesPerNode, batchSize, useLocks)
+        results[label] = elapsedSeconds
+        print("%-10s %8.3f s  %10.0f msgs/s  lock not available: %d" % (
+            label, elapsedSeconds, (numNodes * messagesPerNode) / elapsedSeconds, lockUnavailableCount))
+    print("Speedup: %.2fx" % (results["locked"] / results["lock-free"]))
@@ -0,0 +1,89 @@
+"""
+Validation of the Monte Carlo surrogate (latency_surrogate) against the full simulator.
+
+Runs the same (n, m, faulty count) through node processes and through the surrogate and compares the distribution of
+the round latency (max over nodes), the failure rate and the time taken per round.
+
+Run from the repository root:
+
+    python -m benchmarks.surrogate_validation_benchmark [numNodes] [mValue] [numFaulty] [simulatedRounds] [surrogateRounds]
+"""
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from byzantine_mab_configs import *
+from latency_surrogate import *
+from network_manager import *
+from run_simulation import createSingleRoundResults
+
+DEFAULT_NUM_NODES = 7
+DEFAULT_M_VALUE = 2
+DEFAULT_NUM_FAULTY = 2
+DEFAULT_SIMULATED_ROUNDS = 20
+DEFAULT_SURROGATE_ROUNDS = 10000
+
+NETWORK_LATENCY_CONFIG = NetworkLatencyConfig(20, 7, 50)
+SLEEP_BETWEEN_NODE_PROCESSING_MS = 0.1
+
+
+def summarizeRounds(perRoundResults, mValue, totalSec):
+    roundLatencies = [max(results.latenciesByNode[mValue].values()) for results in perRoundResults]
+    failureRate = np.mean([results.didFail[mValue] for results in perRoundResults])
+    return "mean latency %7.1f ms  p95 %7.1f ms  failure rate %.3f  %.5f s/round" % (
+        np.mean(roundLatencies), np.percentile(roundLatencies, 95), failureRate, totalSec / len(perRoundResults))
+
+
+def runSimulatedRounds(numNodes, mValue, numFaulty, rounds, randomStreams):
+    networkManager = NetworkManager(NETWORK_LATENCY_CONFIG, numNodes, False, mValue, 0.0, True,
+                                    SLEEP_BETWEEN_NODE_PROCESSING_MS, randomStreams=randomStreams)
+    networkManager.changeNumFaultyNodes(numFaulty)
+    consensusValueRandom = randomStreams.getGenerator(CONSENSUS_VALUE_STREAM)
+
+    # Warm-up round (process startup dominates the first round)
+    networkManager.updateFaultyNodes()
+    networkManager.startConsensusAndGetNodeLatenciesAndDecisions(True)
+
+    perRoundResults = []
+    startTime = time.perf_counter()
+    for i in range(rounds):
+        networkManager.updateFaultyNodes()
+        trueConsensusValue = bool(consensusValueRandom.random() < 0.5)
+        latencies, consensuses, currentFaultyNodes = networkManager.startConsensusAndGetNodeLatenciesAndDecisions(
+            trueConsensusValue)
+        perRoundResults.append(createSingleRoundResults(latencies, consensuses, currentFaultyNodes,
+                                                        trueConsensusValue))
+    totalSec = time.perf_counter() - startTime
+    networkManager.shutdown()
+    return perRoundResults, totalSec
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method('spawn')
+    numNodes = int(sys.argv[1]) if (len(sys.argv) > 1) else DEFAULT_NUM_NODES
+    mValue = int(sys.argv[2]) if (len(sys.argv) > 2) else DEFAULT_M_VALUE
+    numFaulty = int(sys.argv[3]) if (len(sys.argv) > 3) else DEFAULT_NUM_FAULTY
+    simulatedRounds = int(sys.argv[4]) if (len(sys.argv) > 4) else DEFAULT_SIMULATED_ROUNDS
+    surrogateRounds = int(sys.argv[5]) if (len(sys.argv) > 5) else DEFAULT_SURROGATE_ROUNDS
+    randomStreams = RandomStreams(0)
+
+    simulatedResults, simulatedSec = runSimulatedRounds(numNodes, mValue, numFaulty, simulatedRounds, randomStreams)
+
+    startTime = time.perf_counter()
+    surrogate = OralMessagesSurrogate(numNodes, mValue, NETWORK_LATENCY_CONFIG, False,
+                                      randomStreams.getGenerator(SURROGATE_STREAM))
+    trueConsensusValues = randomStreams.getGenerator(CONSENSUS_VALUE_STREAM).random(surrogateRounds) < 0.5
+    surrogateResults = [results for results, faultyNodes in surrogate.sampleRounds(trueConsensusValues, numFaulty)]
+    surrogateSec = time.perf_counter() - startTime
+
+    print("n=" + str(numNodes) + ", m=" + str(mValue) + ", faulty=" + str(numFaulty))
+    print("simulator (%6d rounds): %s" % (simulatedRounds, summarizeRounds(simulatedResults, mValue, simulatedSec)))
+    print("surrogate (%6d rounds): %s" % (surrogateRounds, summarizeRounds(surrogateResults, mValue, surrogateSec)))
+    # Every node's latency is the latest of its chains of m + 1 hops, so a fixed overhead per hop shifts the mean latency
+    # by m + 1 times the overhead
+    simulatedMeanMs = np.mean([max(results.latenciesByNode[mValue].values()) for results in simulatedResults])
+    surrogateMeanMs = np.mean([max(results.latenciesByNode[mValue].values()) for results in surrogateResults])
+    print("per-hop overhead matching the simulator's mean latency: %.1f ms (pass as %s<ms> to latency_surrogate.py)"
+          % ((simulatedMeanMs - surrogateMeanMs) / (mValue + 1), PER_HOP_OVERHEAD_FLAG_PREFIX))
@@ -0,0 +1,36 @@
+import numpy as np
+
+
+def sampleMessageDelay(networkLatencyConfig, randomGenerator=np.random):
+    """
+    Get the delay that should be used for the next message. Based on sampling from a normal distribution (with bounds
+    added for min/max).
+
+    :param networkLatencyConfig:    Configuration for the network latency.
+    :param randomGenerator:         numpy Generator to sample with (see random_streams).
+
+    :return: Delay that should be imposed before delivering a message.
+    """
+    avgLatency = networkLatencyConfig.averageLatencyMs
+    stdDevLatency = networkLatencyConfig.latencyStdDevMs
+    maxLatency = networkLatencyConfig.maxLatencyMs
+    randomLatency = randomGenerator.normal(avgLatency, stdDevLatency)
+
+    return max(0, min(maxLatency, randomLatency))
+
+
+def shouldDropMessage(message, dropMessagePercent, randomGenerator=np.random):
+    """
+    Decide whether a faulty node drops a message instead of sending it. The commanding general's own messages are never
+    dropped, since the round would otherwise never start for the nodes that miss it.
+
+    :param message:             Consensus message being sent.
+    :param dropMessagePercent:  Fraction (0 to 1) of a faulty node's relayed messages that should be dropped.
+    :param randomGenerator:     numpy Generator to sample with (see random_streams).
+
+    :return: True if the message should be dropped.
+    """
+    if ((dropMessagePercent <= 0) or (len(message.commandingGeneralChain) == 1)):
+        return False
+    return bool(randomGenerator.random() < dropMessagePercent)
+
@@ -4,12 +4,19 @@ import sys
 from byzantine_mab_configs import *
 import yaml
 import math
-import random
 import numpy as np
+from random_streams import *
+from fault_schedules import *
 
 YAML_FILE_SUFFIX = "_super_config"
 YAML_FILE_EXT = ".yaml"
 PKL_FILE_EXT = ".pkl"
+# Suffix of a single-file config (see writeSingleFileConfig)
+SINGLE_FILE_CONFIG_SUFFIX = "_config"
+# Flag to write a single-file config instead of a pickle per sub-config
+SINGLE_FILE_FLAG = "--single-file"
+# Prefix of the flag that chooses the process generating the true number of faulty nodes in each round
+FAULT_SCHEDULE_FLAG_PREFIX = "--fault-schedule="
 RUN_CONFIG_FILE_SUFFIX = "_run_config_file"
 MULTI_ARMED_BANDIT_CONFIG_FILE_SUFFIX = "_multi_armed_bandit_config_file"
 ROUND_CONFIG_FILE_SUFFIX = "_round_config_file"
@@ -28,8 +35,15 @@ def writeConfig(fileName, configObj):
     joblib.dump(configObj, fileName)
 
 
-def createConfigs():
+def createConfigs(seed=None, faultScheduleProcess=STEP_FAULT_SCHEDULE):
     """
+    Create the configuration objects for an experiment.
+
+    :param seed:                    Seed for the random choices made here (the true m values and how long they persist).
+                                    Also used as the run's random seed, so the whole experiment can be repeated. If
+                                    None, a seed is drawn.
+    :param faultScheduleProcess:    Process that generates the true number of faulty nodes in each round (one of
+                                    FAULT_SCHEDULE_PROCESSES in fault_schedules).
 
     :return: Tuple of (RunConfig, MultiArmedBanditConfig, RoundConfig, NetworkLatencyConfig, ByzantineErrorConfig, DistributedMABConfig)
     """
@@ -71,24 +85,30 @@ def createConfigs():
     # numberOfTrueMs = 16  # TODO replace this
     numberOfTrueMs = 8
 
-    roundForNextM = 0
-    consensusRoundToSetMValue = {}
+    randomStreams = RandomStreams(seed)
+    configRandom = randomStreams.getGenerator(CONFIG_WRITER_STREAM)
     possibleMValuePersistenceLengths = list(np.array(range(conservativeObsPeriodsToConvergence - (averageObsPeriodsToConvergence // 2),
                                              conservativeObsPeriodsToConvergence + (averageObsPeriodsToConvergence // 2)), dtype=int)\
                                                  * roundsPerObservationPeriod)
-    for mValIdx in range(numberOfTrueMs):
-        nextMValue = random.randint(0, maxFaulty)
-        # nextMValue = 4
-        consensusRoundToSetMValue[roundForNextM] = nextMValue
-        roundForNextM += random.choice(possibleMValuePersistenceLengths)
+    numConsensusRounds = roundsPerObservationPeriod * conservativeObsPeriodsToConvergence * numberOfTrueMs
+
+    # Parameters of each fault schedule process, scaled so that the true m value changes about numberOfTrueMs times
+    faultScheduleParams = {
+        STEP_FAULT_SCHEDULE: {"persistenceLengths": possibleMValuePersistenceLengths},
+        MARKOV_FAULT_SCHEDULE: {"switchProbability": numberOfTrueMs / numConsensusRounds},
+        PERIODIC_BURST_FAULT_SCHEDULE: {"period": numConsensusRounds // (numberOfTrueMs // 2),
+                                        "burstLength": numConsensusRounds // numberOfTrueMs},
+        DRIFT_FAULT_SCHEDULE: {"driftStdDev": maxFaulty * math.sqrt(numberOfTrueMs / numConsensusRounds)},
+    }
+    faultSchedule = generateFaultSchedules(faultScheduleProcess, configRandom, 1, numConsensusRounds, maxFaulty,
+                                           **faultScheduleParams.get(faultScheduleProcess, {}))[0]
+    consensusRoundToSetMValue = getFaultScheduleChanges(faultSchedule)
 
     print("Rounds to set m values: " + str(consensusRoundToSetMValue))
 
-    numConsensusRounds = max(roundForNextM,
-                             roundsPerObservationPeriod * conservativeObsPeriodsToConvergence * numberOfTrueMs)
-
     runConfig = RunConfig(numConsensusRounds, numNodes, possibleMValues, useCentralizedMultiArmedBandit,
                           sleepBetweenNodeProcessingMs)
+    runConfig.randomSeed = randomStreams.seed
     
     # Config for n=10, m=3
     multiArmedBanditConfig = MultiArmedBanditConfig(
@@ -116,14 +136,28 @@ def createConfigs():
             distributedMABConfig)
 
 if __name__ == "__main__":
-    if (len(sys.argv) != 3):
-        print("Expected arg for directory for configs and arg for config file prefix")
+    writeSingleFile = SINGLE_FILE_FLAG in sys.argv
+    faultScheduleProcess = STEP_FAULT_SCHEDULE
+    for arg in sys.argv:
+        if (arg.startswith(FAULT_SCHEDULE_FLAG_PREFIX)):
+            faultScheduleProcess = arg[len(FAULT_SCHEDULE_FLAG_PREFIX):]
+    args = [arg for arg in sys.argv if ((arg != SINGLE_FILE_FLAG) and (not arg.startswith(FAULT_SCHEDULE_FLAG_PREFIX)))]
+    if ((len(args) != 3) and (len(args) != 4)):
+        print("Expected arg for directory for configs, arg for config file prefix, optionally a random seed, "
+              "optionally " + SINGLE_FILE_FLAG + " to write one YAML file instead of a pickle per config and "
+              "optionally " + FAULT_SCHEDULE_FLAG_PREFIX + "<process> with one of " + str(FAULT_SCHEDULE_PROCESSES))
 
     (runConfig, multiArmedBanditConfig, roundConfig, networkLatencyConfig, byzantineErrorConfig,
-     distributedMABConfig) = createConfigs()
+     distributedMABConfig) = createConfigs(int(args[3]) if (len(args) == 4) else None, faultScheduleProcess)
+
+    configDir = args[1]
+    baseFilePrefix = args[2]
 
-    configDir = sys.argv[1]
-    baseFilePrefix = sys.argv[2]
+    if (writeSingleFile):
+        singleFileConfigName = os.path.join(configDir, baseFilePrefix + SINGLE_FILE_CONFIG_SUFFIX + YAML_FILE_EXT)
+        writeSingleFileConfig(singleFileConfigName, runConfig, multiArmedBanditConfig, roundConfig,
+                              networkLatencyConfig, byzantineErrorConfig, distributedMABConfig)
+        exit(0)
 
     runConfigBaseName = baseFilePrefix + RUN_CONFIG_FILE_SUFFIX + PKL_FILE_EXT
     runConfigFileName = os.path.join(configDir, runConfigBaseName)
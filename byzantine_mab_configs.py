@@ -1,5 +1,20 @@
+"""
+Configuration of an experiment, split into sub-configs (see SuperConfig), and reading them from pickles, YAML or TOML.
+
+Settings added after the first experiments are optional: each config class declares them as class-level defaults,
+so configs pickled before a setting existed still load, and config files may leave them out.
+"""
+import os
 import joblib  # https://joblib.readthedocs.io/en/latest/persistence.html
 import yaml
+try:
+    import tomllib
+except ImportError:
+    # TOML configs need Python 3.11+ (or the tomli package)
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
 
 RUN_CONFIG_FILE_YAML_NAME = "run_config_file"
 MULTI_ARMED_BANDIT_CONFIG_FILE_YAML_NAME = "multi_armed_bandit_config_file"
@@ -8,6 +23,28 @@ NETWORK_LATENCY_CONFIG_FILE_YAML_NAME = "network_latency_config_file"
 BYZANTINE_ERROR_CONFIG_FILE_YAML_NAME = "byzantine_error_config_file"
 DISTRIBUTED_MAB_CONFIG_FILE_YAML_NAME = "distributed_mab_config_file"
 
+# Sections of a single-file config (see readSuperConfig)
+RUN_CONFIG_SECTION = "run"
+MULTI_ARMED_BANDIT_CONFIG_SECTION = "multi_armed_bandit"
+ROUND_CONFIG_SECTION = "round"
+NETWORK_LATENCY_CONFIG_SECTION = "network_latency"
+BYZANTINE_ERROR_CONFIG_SECTION = "byzantine_error"
+DISTRIBUTED_MAB_CONFIG_SECTION = "distributed_mab"
+CONFIG_SECTIONS = [RUN_CONFIG_SECTION, MULTI_ARMED_BANDIT_CONFIG_SECTION, ROUND_CONFIG_SECTION,
+                   NETWORK_LATENCY_CONFIG_SECTION, BYZANTINE_ERROR_CONFIG_SECTION, DISTRIBUTED_MAB_CONFIG_SECTION]
+
+# Key of a super-config in loadedConfigFiles
+SUPER_CONFIG_CACHE_KEY = "super_config"
+
+PICKLE_CONFIG_FILE_EXTS = [".pkl"]
+YAML_CONFIG_FILE_EXTS = [".yaml", ".yml"]
+TOML_CONFIG_FILE_EXTS = [".toml"]
+
+# Configs read from files so far in this process, keyed by absolute file name and what was read from the file (a
+# section name or SUPER_CONFIG_CACHE_KEY). Each entry is a tuple of the file's modification time when it was read and
+# the config, so a file is only read again if it changes.
+loadedConfigFiles = {}
+
 
 class SuperConfig:
     """
@@ -34,23 +71,70 @@ class SuperConfig:
         self.byzantineErrorConfigFile = byzantineErrorConfigFile
         self.distributedMABConfigFile = distributedMABConfigFile
 
+    # Each sub-config is read once per process (see loadSubConfigFile), so the getters return the same object every
+    # time they are called.
+
     def getRunConfig(self):
-        return joblib.load(self.runConfigFile)
+        return loadSubConfigFile(self.runConfigFile, RUN_CONFIG_SECTION)
 
     def getMultiArmedBanditConfig(self):
-        return joblib.load(self.multiArmedBanditConfigFile)
+        return loadSubConfigFile(self.multiArmedBanditConfigFile, MULTI_ARMED_BANDIT_CONFIG_SECTION)
 
     def getRoundConfig(self):
-        return joblib.load(self.roundConfigFile)
+        return loadSubConfigFile(self.roundConfigFile, ROUND_CONFIG_SECTION)
 
     def getNetworkLatencyConfig(self):
-        return joblib.load(self.networkLatencyConfigFile)
+        return loadSubConfigFile(self.networkLatencyConfigFile, NETWORK_LATENCY_CONFIG_SECTION)
 
     def getByzantineErrorConfig(self):
-        return joblib.load(self.byzantineErrorConfigFile)
+        return loadSubConfigFile(self.byzantineErrorConfigFile, BYZANTINE_ERROR_CONFIG_SECTION)
 
     def getDistributedMABConfig(self):
-        return joblib.load(self.distributedMABConfigFile)
+        return loadSubConfigFile(self.distributedMABConfigFile, DISTRIBUTED_MAB_CONFIG_SECTION)
+
+
+class SingleFileSuperConfig(SuperConfig):
+    """
+    Super-config whose sub-configs are all given in one mapping of section name (CONFIG_SECTIONS) to the fields of the
+    sub-config, e.g. read from a single YAML or TOML file or generated in memory for a parameter sweep.
+    """
+
+    def __init__(self, configData, sourceName="<config>"):
+        """
+        Validate the config data and create the sub-configs. Prints every problem found and exits if the data isn't
+        valid.
+
+        :param configData:  Map of section name to map of field name to value.
+        :param sourceName:  Name of where the data came from (e.g. the file name), used in error messages and as the
+                            file name of every sub-config.
+        """
+        SuperConfig.__init__(self, sourceName, sourceName, sourceName, sourceName, sourceName, sourceName)
+        errors = validateConfigData(configData)
+        if (len(errors) != 0):
+            print("Invalid config " + str(sourceName) + ":")
+            for error in errors:
+                print("  " + error)
+            exit(1)
+        self.configsBySection = {section: createConfigFromSection(section, configData[section]) for section in
+                                 CONFIG_SECTIONS}
+
+    def getRunConfig(self):
+        return self.configsBySection[RUN_CONFIG_SECTION]
+
+    def getMultiArmedBanditConfig(self):
+        return self.configsBySection[MULTI_ARMED_BANDIT_CONFIG_SECTION]
+
+    def getRoundConfig(self):
+        return self.configsBySection[ROUND_CONFIG_SECTION]
+
+    def getNetworkLatencyConfig(self):
+        return self.configsBySection[NETWORK_LATENCY_CONFIG_SECTION]
+
+    def getByzantineErrorConfig(self):
+        return self.configsBySection[BYZANTINE_ERROR_CONFIG_SECTION]
+
+    def getDistributedMABConfig(self):
+        return self.configsBySection[DISTRIBUTED_MAB_CONFIG_SECTION]
 
 
 class RunConfig:
@@ -58,6 +142,44 @@ class RunConfig:
     Configuration object containing the core parameters needed to execute the experiments.
     """
 
+    # Optional settings
+
+    # How the network manager and nodes exchange messages ("queue" or "shared_memory", see network_manager)
+    messageTransport = "queue"
+
+    # True if nodes should deliver consensus messages directly to each other instead of through the network manager
+    useDirectPeerDelivery = False
+
+    # True if the network manager should run its control loop on asyncio (AsyncNetworkManager)
+    useAsyncNetworkManager = False
+
+    # True if the latency and faults of every message of a round should be drawn when the round starts (see
+    # round_fault_tables), false if they should be drawn as each message is sent
+    precomputeRoundFaults = True
+
+    # True if the hot-path methods of the network manager and nodes should be timed and the per-phase stats recorded in
+    # the results for each round
+    enablePhaseInstrumentation = False
+
+    # File to record a binary trace of the consensus messages to (see message_trace), or None to not record a trace
+    messageTraceFile = None
+
+    # Seed that every random stream in the run is derived from (see random_streams), or None to draw a new seed
+    randomSeed = None
+
+    # Type of the values the nodes agree on ("bool", "int" or "bytes", see consensus_values)
+    consensusValueType = "bool"
+
+    # Number of distinct values when the nodes agree on integers
+    consensusValueDomainSize = 2
+
+    # Number of bytes in each value when the nodes agree on byte strings
+    consensusValuePayloadLength = 32
+
+    # Number of values the commanding general proposes in each consensus round. With more than 1, the nodes agree on a
+    # batch (tuple) of values in one execution of the protocol.
+    consensusBatchSize = 1
+
     def __init__(self, numConsensusRounds, numNodes, possibleMValues, useCentralizedMultiArmedBandit,
                  sleepBetweenNodeProcessingMs):
         """
@@ -85,6 +207,27 @@ class MultiArmedBanditConfig:
     failures and latencies in consensus rounds.
     """
 
+    # Optional settings
+
+    # Latency that rewards are based on: the mean latency of each observation period ("mean"), or the 95th or 99th
+    # percentile latency of each m value's discounted rounds ("p95" or "p99", see multiarmed_bandit_executor)
+    reward_mode = "mean"
+
+    # How the m value is chosen: upper confidence bounds on each m value's reward ("ucb"), or the same with each m
+    # value's chance of failures predicted from the fault signals of the last observation period ("contextual"), or the
+    # lowest latency m value whose failure rate is bounded under a threshold ("safe", see multiarmed_bandit_executor)
+    policy = "ucb"
+
+    # For the contextual policy: strength of the L2 regularization of the failure model's weights
+    context_regularization = 1.0
+
+    # For the safe policy: highest upper confidence bound on an m value's failure rate (per round) for it to be chosen,
+    # the discount of an m value's failure counts each time it is chosen, and the number of observation periods before a
+    # lower m value is explored again
+    failure_rate_threshold = 0.05
+    failure_bound_gamma = 0.9
+    safe_exploration_interval = 10
+
     def __init__(self, **kwargs):
         self.latency_scale = kwargs['latency_scale']
         self.gamma = kwargs['gamma']
@@ -113,6 +256,15 @@ class NetworkLatencyConfig:
     Network latency configuration.
     """
 
+    # Optional settings
+
+    # Slack in milliseconds per hop allowed on top of the network latency before a relayed message is treated as
+    # dropped, when messages can be dropped (see chain_deadlines), until the slack for the m value has been learned from
+    # the messages' arrival times. The slack starts at timeoutSlackMs plus timeoutSlackMsPerMessage for each consensus
+    # message of a round, since relaying takes longer the more messages a round has.
+    timeoutSlackMs = 20.0
+    timeoutSlackMsPerMessage = 0.1
+
     def __init__(self, averageLatencyMs, latencyStdDevMs, maxLatencyMs):
         """
         Initialize the network latency configuration.
@@ -132,6 +284,14 @@ class ByzantineErrorConfig:
     Byzantine error configuration.
     """
 
+    # Optional settings
+
+    # How faulty nodes corrupt their messages (one of FAULT_STRATEGIES in fault_models)
+    faultStrategy = "random"
+
+    # How the faulty nodes are chosen for each round (one of FAULTY_SET_POLICIES in fault_models)
+    faultySetPolicy = "resample"
+
     def __init__(self, consensusRoundToSetMValue, percentDropMessage, defaultConsensusValue):
         """
 
@@ -140,8 +300,9 @@ class ByzantineErrorConfig:
                                             m should be used.
         :param percentDropMessage:          Percent of the time that, when a node should exhibit byzantine failure, it
                                             will simply not publish a message. The remaining percent of the time, it
-                                            will give random output. We won't have the primary general ever drop the
-                                            message, because then the consensus round would not ever begin.
+                                            will corrupt the message according to faultStrategy. We won't have the
+                                            primary general ever drop the message, because then the consensus round
+                                            would not ever begin.
         :param defaultConsensusValue:       Value that should be used if there is no majority vote in consensus.
         """
         self.consensusRoundToSetMValue = consensusRoundToSetMValue
@@ -188,3 +349,292 @@ def readSuperConfigYaml(yamlConfigFileName):
                            data_loaded[NETWORK_LATENCY_CONFIG_FILE_YAML_NAME],
                            data_loaded[BYZANTINE_ERROR_CONFIG_FILE_YAML_NAME],
                            data_loaded[DISTRIBUTED_MAB_CONFIG_FILE_YAML_NAME])
+
+
+class ConfigSectionSchema:
+    """
+    Fields of one section of a single-file config and how to create the sub-config from them.
+    """
+
+    def __init__(self, configClass, requiredFieldTypes, fieldConverters=None):
+        """
+        Create the schema.
+
+        :param configClass:         Class of the sub-config. Called with the required fields as keyword arguments.
+        :param requiredFieldTypes:  Map of the name of each required field to the type (or tuple of types) it must have,
+                                    or object for any type. The optional fields are the class-level defaults of the
+                                    config class, and must have the type of their default (unless it is None).
+        :param fieldConverters:     Map of field name to a function applied to the value read for the field, for values
+                                    that the file formats can't represent directly.
+        """
+        self.configClass = configClass
+        self.requiredFieldTypes = requiredFieldTypes
+        self.fieldConverters = {} if (fieldConverters is None) else fieldConverters
+
+    def getOptionalFieldDefaults(self):
+        """
+        Get the optional fields of the section.
+
+        :return: Map of field name to the default value.
+        """
+        return {name: value for name, value in vars(self.configClass).items() if
+                ((not name.startswith("__")) and (not callable(value)))}
+
+
+def convertRoundToSetMValue(consensusRoundToSetMValue):
+    # TOML keys are always strings, so convert the round numbers back to integers
+    return {int(roundNum): faultyNodeCount for roundNum, faultyNodeCount in consensusRoundToSetMValue.items()}
+
+
+NUMBER_TYPES = (int, float)
+
+CONFIG_SECTION_SCHEMAS = {
+    RUN_CONFIG_SECTION: ConfigSectionSchema(RunConfig, {"numConsensusRounds": int, "numNodes": int,
+                                                        "possibleMValues": list,
+                                                        "useCentralizedMultiArmedBandit": bool,
+                                                        "sleepBetweenNodeProcessingMs": NUMBER_TYPES}),
+    MULTI_ARMED_BANDIT_CONFIG_SECTION: ConfigSectionSchema(MultiArmedBanditConfig, {"latency_scale": NUMBER_TYPES,
+                                                                                    "gamma": NUMBER_TYPES,
+                                                                                    "lat_rew_bias": NUMBER_TYPES,
+                                                                                    "failure_penalty": NUMBER_TYPES}),
+    ROUND_CONFIG_SECTION: ConfigSectionSchema(RoundConfig, {"roundsPerObservationPeriod": int}),
+    NETWORK_LATENCY_CONFIG_SECTION: ConfigSectionSchema(NetworkLatencyConfig, {"averageLatencyMs": NUMBER_TYPES,
+                                                                              "latencyStdDevMs": NUMBER_TYPES,
+                                                                              "maxLatencyMs": NUMBER_TYPES}),
+    BYZANTINE_ERROR_CONFIG_SECTION: ConfigSectionSchema(ByzantineErrorConfig, {"consensusRoundToSetMValue": dict,
+                                                                              "percentDropMessage": NUMBER_TYPES,
+                                                                              "defaultConsensusValue": object},
+                                                        {"consensusRoundToSetMValue": convertRoundToSetMValue}),
+    DISTRIBUTED_MAB_CONFIG_SECTION: ConfigSectionSchema(DistributedMABConfig,
+                                                        {"minMValueMargin": int,
+                                                         "decentralizedMultiArmedBanditFaultToleranceValue": int,
+                                                         "defaultMValuePair": list}),
+}
+
+
+def isValueOfType(value, expectedTypes):
+    """
+    Check if a config value has the expected type. Booleans are not accepted as numbers.
+
+    :param value:           Value read from the config.
+    :param expectedTypes:   Type or tuple of types.
+
+    :return: True if the value has one of the types.
+    """
+    if (isinstance(value, bool) and (bool not in (expectedTypes if isinstance(expectedTypes, tuple) else
+                                                   (expectedTypes,)))):
+        return expectedTypes is object
+    return isinstance(value, expectedTypes)
+
+
+def validateConfigSection(section, sectionData):
+    """
+    Check the fields of one section of a single-file config against its schema.
+
+    :param section:     Name of the section (one of CONFIG_SECTIONS).
+    :param sectionData: Map of field name to value.
+
+    :return: List of descriptions of the problems found (empty if the section is valid).
+    """
+    if (not isinstance(sectionData, dict)):
+        return [section + ": expected a mapping of field names to values"]
+    schema = CONFIG_SECTION_SCHEMAS[section]
+    optionalFieldDefaults = schema.getOptionalFieldDefaults()
+    errors = []
+    for fieldName, expectedTypes in schema.requiredFieldTypes.items():
+        if (fieldName not in sectionData):
+            errors.append(section + "." + fieldName + ": missing required field")
+        elif (not isValueOfType(sectionData[fieldName], expectedTypes)):
+            errors.append(section + "." + fieldName + ": expected " + str(expectedTypes) + ", got " + repr(
+                sectionData[fieldName]))
+    for fieldName, value in sectionData.items():
+        if (fieldName in schema.requiredFieldTypes):
+            continue
+        if (fieldName not in optionalFieldDefaults):
+            errors.append(section + "." + fieldName + ": unknown field")
+            continue
+        defaultValue = optionalFieldDefaults[fieldName]
+        if ((defaultValue is not None) and (value is not None)):
+            expectedTypes = NUMBER_TYPES if isinstance(defaultValue, float) else type(defaultValue)
+            if (not isValueOfType(value, expectedTypes)):
+                errors.append(section + "." + fieldName + ": expected " + str(expectedTypes) + ", got " + repr(value))
+    return errors
+
+
+def validateConfigData(configData):
+    """
+    Check the data of a single-file config against the schema of every section.
+
+    :param configData:  Map of section name to map of field name to value.
+
+    :return: List of descriptions of the problems found (empty if the config is valid).
+    """
+    if (not isinstance(configData, dict)):
+        return ["expected a mapping of section names to sections"]
+    errors = []
+    for section in CONFIG_SECTIONS:
+        if (section not in configData):
+            errors.append(section + ": missing section")
+        else:
+            errors.extend(validateConfigSection(section, configData[section]))
+    for section in configData.keys():
+        if (section not in CONFIG_SECTIONS):
+            errors.append(str(section) + ": unknown section")
+    return errors
+
+
+def createConfigFromSection(section, sectionData):
+    """
+    Create a sub-config from a validated section of a single-file config.
+
+    :param section:     Name of the section (one of CONFIG_SECTIONS).
+    :param sectionData: Map of field name to value.
+
+    :return: Sub-config object.
+    """
+    schema = CONFIG_SECTION_SCHEMAS[section]
+    fieldValues = {fieldName: schema.fieldConverters.get(fieldName, lambda value: value)(value) for fieldName, value in
+                   sectionData.items()}
+    config = schema.configClass(**{fieldName: fieldValues[fieldName] for fieldName in schema.requiredFieldTypes})
+    for fieldName, value in fieldValues.items():
+        if (fieldName not in schema.requiredFieldTypes):
+            setattr(config, fieldName, value)
+    return config
+
+
+def getConfigToSectionData(config):
+    """
+    Get the fields of a sub-config in the form used by single-file configs.
+
+    :param config:  Sub-config object.
+
+    :return: Map of field name to value (see convertToPlainValue).
+    """
+    return {fieldName: convertToPlainValue(value) for fieldName, value in vars(config).items()}
+
+
+def convertToPlainValue(value):
+    """
+    Convert a config value to one that YAML can represent, replacing NumPy scalars (including ones nested in lists and
+    dicts) with plain Python values.
+
+    :param value:   Config value.
+
+    :return: Equivalent value made of plain Python types.
+    """
+    if (isinstance(value, dict)):
+        return {convertToPlainValue(key): convertToPlainValue(item) for key, item in value.items()}
+    elif (isinstance(value, (list, tuple))):
+        return [convertToPlainValue(item) for item in value]
+    elif (hasattr(value, "item")):
+        return value.item()
+    return value
+
+
+def loadCachedFile(fileName, cacheKey, loadFunction):
+    """
+    Load a config from a file, reusing the config loaded earlier in this process if the file hasn't changed since.
+
+    :param fileName:        Name of the file.
+    :param cacheKey:        What is read from the file (a section name or SUPER_CONFIG_CACHE_KEY).
+    :param loadFunction:    Function that takes the absolute file name and returns the config.
+
+    :return: Config loaded from the file.
+    """
+    absoluteFileName = os.path.abspath(fileName)
+    if (not os.path.isfile(absoluteFileName)):
+        print("Config file " + fileName + " does not exist")
+        exit(1)
+    modificationTime = os.stat(absoluteFileName).st_mtime_ns
+    cachedFile = loadedConfigFiles.get((absoluteFileName, cacheKey))
+    if ((cachedFile is None) or (cachedFile[0] != modificationTime)):
+        cachedFile = (modificationTime, loadFunction(absoluteFileName))
+        loadedConfigFiles[(absoluteFileName, cacheKey)] = cachedFile
+    return cachedFile[1]
+
+
+def readConfigDataFile(fileName):
+    """
+    Read the data in a YAML or TOML config file.
+
+    :param fileName:    Name of the file. The format is chosen by its extension.
+
+    :return: Data in the file.
+    """
+    fileExt = os.path.splitext(fileName)[1].lower()
+    if (fileExt in TOML_CONFIG_FILE_EXTS):
+        if (tomllib is None):
+            print("Reading TOML config " + fileName + " requires Python 3.11+ or the tomli package")
+            exit(1)
+        with open(fileName, "rb") as stream:
+            return tomllib.load(stream)
+    elif (fileExt in YAML_CONFIG_FILE_EXTS):
+        with open(fileName, "r") as stream:
+            return yaml.safe_load(stream)
+    else:
+        print("Unknown config file format " + fileName)
+        exit(1)
+
+
+def loadSubConfigFile(fileName, section):
+    """
+    Load a sub-config file: a joblib pickle of the config object, or a YAML or TOML file with the fields of the given
+    section. Each file is only read once per process unless it changes.
+
+    :param fileName:    Name of the file.
+    :param section:     Section (one of CONFIG_SECTIONS) that the file holds the fields of, if it isn't a pickle.
+
+    :return: Sub-config object.
+    """
+    if (os.path.splitext(fileName)[1].lower() in PICKLE_CONFIG_FILE_EXTS):
+        return loadCachedFile(fileName, section, joblib.load)
+
+    def loadSection(absoluteFileName):
+        sectionData = readConfigDataFile(absoluteFileName)
+        errors = validateConfigSection(section, sectionData)
+        if (len(errors) != 0):
+            print("Invalid config " + fileName + ":")
+            for error in errors:
+                print("  " + error)
+            exit(1)
+        return createConfigFromSection(section, sectionData)
+
+    return loadCachedFile(fileName, section, loadSection)
+
+
+def readSuperConfig(configFileName):
+    """
+    Read a super-config in any of the supported layouts: a single YAML or TOML file with a section for every sub-config
+    (see SingleFileSuperConfig), or a YAML file with the file names of the sub-configs (see readSuperConfigYaml).
+
+    :param configFileName:  Name of the config file.
+
+    :return: SuperConfig.
+    """
+    def loadSuperConfig(absoluteFileName):
+        configData = readConfigDataFile(absoluteFileName)
+        if (isinstance(configData, dict) and (RUN_CONFIG_FILE_YAML_NAME in configData)):
+            return readSuperConfigYaml(absoluteFileName)
+        return SingleFileSuperConfig(configData, configFileName)
+
+    return loadCachedFile(configFileName, SUPER_CONFIG_CACHE_KEY, loadSuperConfig)
+
+
+def writeSingleFileConfig(configFileName, runConfig, multiArmedBanditConfig, roundConfig, networkLatencyConfig,
+                          byzantineErrorConfig, distributedMABConfig):
+    """
+    Write the sub-configs to a single YAML config file that can be read with readSuperConfig.
+
+    :param configFileName:          Name of the file to write.
+    :param runConfig:               RunConfig to write.
+    :param multiArmedBanditConfig:  MultiArmedBanditConfig to write.
+    :param roundConfig:             RoundConfig to write.
+    :param networkLatencyConfig:    NetworkLatencyConfig to write.
+    :param byzantineErrorConfig:    ByzantineErrorConfig to write.
+    :param distributedMABConfig:    DistributedMABConfig to write.
+    """
+    configs = [runConfig, multiArmedBanditConfig, roundConfig, networkLatencyConfig, byzantineErrorConfig,
+               distributedMABConfig]
+    configData = {section: getConfigToSectionData(config) for section, config in zip(CONFIG_SECTIONS, configs)}
+    with open(configFileName, "w") as outfile:
+        yaml.safe_dump(configData, outfile, sort_keys=False)
@@ -1,9 +1,25 @@
+"""
+Results of an experiment, round by round.
+
+Fields added after the first experiments are class-level defaults, so results pickled before a field existed still
+load.
+"""
+import statistics
+from collections import Counter
+from round_metrics import *
 
 class SingleRoundResults:
     """
     Results for a single round of communication.
     """
 
+    # Number of values agreed on in the round (see RunConfig.consensusBatchSize)
+    batchSize = 1
+
+    # Map of node # to the number of messages it timed out waiting for in the round, or None if not recorded (e.g. by
+    # the surrogate)
+    timeoutsByNode = None
+
     def __init__(self, latenciesByNode, consensusesByNode, trueConsensus, didFail):
         """
         Results for a single round of consensus
@@ -19,12 +35,64 @@ class SingleRoundResults:
         self.trueConsensus = trueConsensus
         self.didFail = didFail
 
+    def getRoundLatency(self):
+        """
+        Get the latency of the round: the time until the last node decided, for the first m value.
+
+        :return: Latency in milliseconds.
+        """
+        return max(list(self.latenciesByNode.values())[0].values())
+
+    def getLatencyPerValue(self):
+        """
+        Get the latency of the round divided among the values agreed on in it.
+
+        :return: Latency in milliseconds per value.
+        """
+        return self.getRoundLatency() / self.batchSize
+
+    def getNumNodes(self):
+        return len(list(self.latenciesByNode.values())[0])
+
+    def getDisagreeingNodesCount(self):
+        """
+        Get the number of nodes whose decision differs from the decision most nodes reached, for the first m value.
+
+        :return: Number of nodes.
+        """
+        decisionCounts = Counter(list(self.consensusesByNode.values())[0].values())
+        return sum(decisionCounts.values()) - decisionCounts.most_common(1)[0][1]
+
+    def getTimeoutCount(self):
+        """
+        Get the number of messages that the nodes timed out waiting for.
+
+        :return: Number of messages, or 0 if they weren't recorded.
+        """
+        return 0 if (self.timeoutsByNode is None) else sum(self.timeoutsByNode.values())
+
+    def getLatencySpread(self):
+        """
+        Get how much the nodes' latencies vary: their coefficient of variation (standard deviation divided by mean),
+        leaving out the commanding general (the lowest latency), for the first m value.
+
+        :return: Coefficient of variation, or 0 with fewer than 2 other nodes.
+        """
+        nodeLatencies = sorted(list(self.latenciesByNode.values())[0].values())[1:]
+        if ((len(nodeLatencies) < 2) or (sum(nodeLatencies) == 0)):
+            return 0.0
+        return statistics.pstdev(nodeLatencies) / statistics.mean(nodeLatencies)
+
 
 class FullResults:
     """
     Results for the full experiment.
     """
 
+    # Statistics updated as each round is added (see RoundMetricsStream), or None for results pickled before the stream
+    # existed (see getRoundMetrics)
+    roundMetrics = None
+
     def __init__(self):
         # Each of these contain the information for the round corresponding to the list index
         # Results (SingleRoundResults) for each round of consensus
@@ -36,31 +104,50 @@ class FullResults:
         # Value of M used by the consensus algorithm
         self.consensusFaultToleranceChosen = []
 
-        # List of results (SingleRoundResults) since the last time an m-value was chosen
-        self.resultsSinceLastDecision = []
+        # Per-phase timing stats for the round (see NetworkManager.lastRoundPhaseStats). None for rounds run without
+        # instrumentation.
+        self.perRoundPhaseStats = []
+
+        # Seed that the random streams for the run were derived from (see random_streams)
+        self.randomSeed = None
 
-    def addRoundResults(self, singleRoundResults, trueFaultyNodesCount, consensusFaultToleranceChosen):
+        self.roundMetrics = RoundMetricsStream()
+
+    def addRoundResults(self, singleRoundResults, trueFaultyNodesCount, consensusFaultToleranceChosen,
+                        phaseStats=None):
         """
         Add results for a round of consensus.
 
         :param singleRoundResults:              SingleRoundResults object for the consensus round.
         :param trueFaultyNodesCount:            Number of faulty nodes.
         :param consensusFaultToleranceChosen:   Value of m used by the consensus algorithm.
+        :param phaseStats:                      Per-phase timing stats for the round, if instrumentation was enabled.
         """
         self.perRoundResults.append(singleRoundResults)
+        self.perRoundPhaseStats.append(phaseStats)
         self.trueFaultyNodesCount.append(trueFaultyNodesCount)
         self.consensusFaultToleranceChosen.append(consensusFaultToleranceChosen)
 
-        self.resultsSinceLastDecision.append(singleRoundResults)
+        self.getRoundMetrics().addRound(singleRoundResults, trueFaultyNodesCount)
+
+    def getRoundMetrics(self):
+        """
+        Get the statistics of the experiment's rounds, building them from the rounds for results pickled before they
+        were kept.
+
+        :return: RoundMetricsStream of the experiment.
+        """
+        if (self.roundMetrics is None):
+            self.roundMetrics = RoundMetricsStream()
+            for singleRoundResults, trueFaultyNodesCount in zip(self.perRoundResults, self.trueFaultyNodesCount):
+                self.roundMetrics.addRound(singleRoundResults, trueFaultyNodesCount)
+        return self.roundMetrics
 
-    def getAndResetResultsSinceLastDecision(self):
+    def getCommittedValuesPerSecond(self):
         """
-        Get the results since the last m value chosen and clear the results since the last m value (assumes we will have
-        incorporated all information from these rounds into our learning approach).
+        Get the throughput of the experiment: the number of values agreed on in rounds that didn't fail, divided by the
+        total latency of all rounds (for the first m value of each round).
 
-        :return: List of results (SingleRoundResults) since the last m value chosen and clear the results since the
-        last m value
+        :return: Committed values per second, or 0 if no rounds were run.
         """
-        resultsToReturn = list(self.resultsSinceLastDecision)
-        self.resultsSinceLastDecision.clear()
-        return resultsToReturn
\ No newline at end of file
+        return self.getRoundMetrics().getCommittedValuesPerSecond()
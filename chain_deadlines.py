@@ -0,0 +1,122 @@
+import math
+
+# Number of standard deviations above the average network latency allowed for each hop (capped at the maximum latency)
+DEADLINE_LATENCY_STD_DEVS = 3.0
+
+# Multiple of the largest per-hop overhead seen in a round that is allowed as slack on every hop
+SLACK_SAFETY_FACTOR = 2.0
+
+# Factor applied each round to the slack learned in earlier rounds, so that slack learned during a burst of load decays
+# back towards what recent rounds needed
+SLACK_DECAY_PER_ROUND = 0.9
+
+# Smallest slack in milliseconds per hop that can be learned
+MIN_SLACK_MS = 5.0
+
+
+def getConsensusMessagesPerRound(numNodes, mValue):
+    """
+    Get the number of consensus messages sent in a round of OM(m): (n - 1)(n - 2)...(n - L) for each commanding general
+    chain length L from 1 to m + 1.
+
+    :param numNodes:    Number of nodes in the network.
+    :param mValue:      M value of the round.
+
+    :return: Number of messages.
+    """
+    return sum(math.perm(max(numNodes - 1, 0), chainLength) for chainLength in range(1, mValue + 2))
+
+
+class AdaptiveChainDeadlines:
+    """
+    Deadlines for the relayed messages a node waits for in OM(m).
+
+    A message whose commanding general chain has length L has travelled L hops since the commanding general sent the
+    first message of the round, and the node received that first message no earlier than it was sent. So once the node
+    has received the general's message (the anchor), every message with a chain of length L should arrive within
+    L * (hop latency + slack) of the anchor. Messages that haven't arrived by then are treated as dropped.
+
+    The hop latency comes from the network latency distribution: DEADLINE_LATENCY_STD_DEVS standard deviations above
+    the average, capped at the maximum latency. The slack covers the time nodes and the network manager take to process
+    and relay each message (and the rare hops slower than the hop latency), which grows with the number of messages in
+    a round. It is learned from the arrival times of the relayed messages, separately for each m value. Each m value
+    starts from the configured slack plus a slack per message of the round (see NetworkLatencyConfig). Each later
+    round's slack is SLACK_SAFETY_FACTOR times the largest per-hop overhead seen, decaying by SLACK_DECAY_PER_ROUND from
+    what earlier rounds needed and never below MIN_SLACK_MS. A message that arrives later than the slack allows grows
+    the slack straight away, for the messages the node starts waiting for after it.
+    """
+
+    def __init__(self, networkLatencyConfig, numNodes):
+        """
+        Create the deadlines.
+
+        :param networkLatencyConfig:    Network latency configuration, for the latency distribution and the initial
+                                        slack.
+        :param numNodes:                Number of nodes in the network.
+        """
+        self.hopLatencyMs = min(networkLatencyConfig.averageLatencyMs +
+                                (DEADLINE_LATENCY_STD_DEVS * networkLatencyConfig.latencyStdDevMs),
+                                networkLatencyConfig.maxLatencyMs)
+        self.initialSlackMs = networkLatencyConfig.timeoutSlackMs
+        self.initialSlackMsPerMessage = networkLatencyConfig.timeoutSlackMsPerMessage
+        self.numNodes = numNodes
+        # Slack for each m value that has been run
+        self.slackByMValue = {}
+        # M value of the current round
+        self.mValue = None
+        # Largest per-hop overhead of the relayed messages received in the current round, or None if none have been
+        self.roundMaxOverheadMs = None
+        # Time at which the general's message for the current round was received (or timed out), or None if it hasn't
+        # been yet
+        self.anchorTime = None
+
+    def startRound(self, mValue):
+        """
+        Learn the slack from the round that just finished, and reset the anchor for a new round.
+
+        :param mValue:  M value (deepest recursion) of the new round.
+        """
+        if ((self.mValue is not None) and (self.roundMaxOverheadMs is not None)):
+            self.slackByMValue[self.mValue] = max(MIN_SLACK_MS, SLACK_SAFETY_FACTOR * self.roundMaxOverheadMs,
+                                                  self.slackByMValue[self.mValue] * SLACK_DECAY_PER_ROUND)
+        if (mValue not in self.slackByMValue):
+            self.slackByMValue[mValue] = self.initialSlackMs + (
+                    self.initialSlackMsPerMessage * getConsensusMessagesPerRound(self.numNodes, mValue))
+        self.mValue = mValue
+        self.roundMaxOverheadMs = None
+        self.anchorTime = None
+
+    def setAnchor(self, anchorTime):
+        """
+        Set the time at which the general's message for the current round was received.
+
+        :param anchorTime:  Time in milliseconds.
+        """
+        self.anchorTime = anchorTime
+
+    def getDeadline(self, chainLength):
+        """
+        Get the time by which a message with the given chain length should have arrived.
+
+        :param chainLength: Length of the commanding general chain of the message.
+
+        :return: Deadline in milliseconds, or None if the general's message hasn't been received yet.
+        """
+        if (self.anchorTime is None):
+            return None
+        return self.anchorTime + (chainLength * (self.hopLatencyMs + self.slackByMValue[self.mValue]))
+
+    def recordArrival(self, chainLength, arrivalTime):
+        """
+        Learn from the arrival time of a relayed message, growing the slack if the message took longer per hop than
+        the slack allows for.
+
+        :param chainLength: Length of the commanding general chain of the message.
+        :param arrivalTime: Time in milliseconds at which the message arrived.
+        """
+        if (self.anchorTime is None):
+            return
+        perHopOverheadMs = ((arrivalTime - self.anchorTime) / chainLength) - self.hopLatencyMs
+        if ((self.roundMaxOverheadMs is None) or (perHopOverheadMs > self.roundMaxOverheadMs)):
+            self.roundMaxOverheadMs = perHopOverheadMs
+        self.slackByMValue[self.mValue] = max(self.slackByMValue[self.mValue], SLACK_SAFETY_FACTOR * perHopOverheadMs)
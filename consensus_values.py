@@ -0,0 +1,297 @@
+import numbers
+import struct
+import sys
+from collections import Counter
+
+# Types of value that the nodes can agree on
+# True/false (the original setup)
+BOOL_VALUE_TYPE = "bool"
+# Integers from 0 to domainSize - 1
+INT_VALUE_TYPE = "int"
+# Byte strings of payloadLength bytes
+BYTES_VALUE_TYPE = "bytes"
+CONSENSUS_VALUE_TYPES = [BOOL_VALUE_TYPE, INT_VALUE_TYPE, BYTES_VALUE_TYPE]
+
+# Code stored for each value type in binary files (see message_trace). These must not change.
+VALUE_TYPE_CODES = {BOOL_VALUE_TYPE: 0, INT_VALUE_TYPE: 1, BYTES_VALUE_TYPE: 2}
+
+BOOL_VALUE_STRUCT = struct.Struct("<?")
+INT_VALUE_STRUCT = struct.Struct("<q")
+# Length of a bytes value. Followed by the bytes.
+BYTES_LENGTH_STRUCT = struct.Struct("<H")
+
+
+def isBoolValue(value):
+    """
+    Check whether a value is a boolean, including a NumPy boolean.
+
+    Node processes only import NumPy once they aggregate integer values (see getMajorityValue), and a NumPy boolean
+    can't exist in a process that hasn't imported NumPy, so this doesn't import it.
+
+    :param value:   Value to check.
+
+    :return: True if the value is a boolean.
+    """
+    if (isinstance(value, bool)):
+        return True
+    numpyModule = sys.modules.get("numpy")
+    return (numpyModule is not None) and isinstance(value, numpyModule.bool_)
+
+
+def isIntValue(value):
+    """
+    Check whether a value is an integer (including a NumPy integer) that isn't a boolean.
+
+    :param value:   Value to check.
+
+    :return: True if the value is an integer.
+    """
+    return isinstance(value, numbers.Integral) and (not isBoolValue(value))
+
+
+def getMajorityValue(tiebreakerValue, values):
+    """
+    Get the value held by a strict majority of a list of values (as used by the oral messages algorithm), or the
+    tiebreaker value if no value is held by more than half of the list.
+
+    The counting method depends on the type of the tiebreaker value, which must be the type of the values: booleans
+    are counted directly, integers (which must be non-negative, see ConsensusValueSpace) with np.bincount and any other
+    hashable values with a Counter.
+
+    :param tiebreakerValue: Value to use if no value occurs in more than half of the list.
+    :param values:          List of values to get the majority value of.
+
+    :return: Value that occurred in more than half of the list, or the tiebreaker value if there wasn't one.
+    """
+    if (isinstance(tiebreakerValue, tuple)):
+        return getMajorityOfBatches(tiebreakerValue, values)
+
+    if (isBoolValue(tiebreakerValue)):
+        trueCount = values.count(True)
+        if ((trueCount * 2) == len(values)):
+            return tiebreakerValue
+        return (trueCount * 2) > len(values)
+
+    if (isIntValue(tiebreakerValue)):
+        # Imported here so that node processes of the default boolean setup never import NumPy
+        import numpy as np
+        valueCounts = np.bincount(values)
+        majorityValue = int(valueCounts.argmax())
+        majorityCount = valueCounts[majorityValue]
+    else:
+        majorityValue, majorityCount = Counter(values).most_common(1)[0]
+
+    if ((majorityCount * 2) > len(values)):
+        return majorityValue
+    return tiebreakerValue
+
+
+def getMajorityOfBatches(tiebreakerBatch, batches):
+    """
+    Get the majority of each position of a list of batches (see ConsensusBatchValueSpace), computed for all positions
+    at once with NumPy for boolean and integer values.
+
+    :param tiebreakerBatch: Batch of the values to use in each position where no value occurs in more than half of the
+                            list.
+    :param batches:         List of batches (tuples of equal length) to get the majority of.
+
+    :return: Batch (tuple) with the majority value of each position.
+    """
+    import numpy as np
+    firstValue = tiebreakerBatch[0]
+    if (isBoolValue(firstValue)):
+        trueCounts = np.count_nonzero(np.array(batches, dtype=bool), axis=0)
+        majorityValues = np.where((trueCounts * 2) == len(batches), np.array(tiebreakerBatch, dtype=bool),
+                                  (trueCounts * 2) > len(batches))
+    elif (isIntValue(firstValue)):
+        valueArray = np.array(batches, dtype=np.int64)
+        batchSize = valueArray.shape[1]
+        domainSize = int(valueArray.max()) + 1
+        # Offset each position into its own range of bins so one bincount counts every position
+        valueCounts = np.bincount((valueArray + (np.arange(batchSize) * domainSize)).ravel(),
+                                  minlength=batchSize * domainSize).reshape(batchSize, domainSize)
+        majorityValues = valueCounts.argmax(axis=1)
+        hasMajority = (valueCounts[np.arange(batchSize), majorityValues] * 2) > len(batches)
+        majorityValues = np.where(hasMajority, majorityValues, np.array(tiebreakerBatch, dtype=np.int64))
+    else:
+        return tuple(getMajorityValue(tiebreakerBatch[i], [batch[i] for batch in batches]) for i in
+                     range(len(tiebreakerBatch)))
+    return tuple(majorityValues.tolist())
+
+
+def createConsensusValueSpace(valueType=BOOL_VALUE_TYPE, domainSize=2, payloadLength=32, batchSize=1):
+    """
+    Create the value space for single values, or for batches of values if the batch size is more than 1.
+
+    :param valueType:       Type of the values (one of CONSENSUS_VALUE_TYPES).
+    :param domainSize:      Number of distinct values (integer values only).
+    :param payloadLength:   Number of bytes in each value (bytes values only).
+    :param batchSize:       Number of values agreed on in each round.
+
+    :return: ConsensusValueSpace or ConsensusBatchValueSpace.
+    """
+    if (batchSize == 1):
+        return ConsensusValueSpace(valueType, domainSize, payloadLength)
+    return ConsensusBatchValueSpace(valueType, domainSize, payloadLength, batchSize)
+
+
+class ConsensusValueSpace:
+    """
+    Set of values that the nodes agree on: how true values are drawn, what lying nodes send and how values are stored
+    in binary files.
+    """
+
+    # Number of values agreed on in each round
+    batchSize = 1
+
+    def __init__(self, valueType=BOOL_VALUE_TYPE, domainSize=2, payloadLength=32):
+        """
+        Create the value space.
+
+        :param valueType:       Type of the values (one of CONSENSUS_VALUE_TYPES).
+        :param domainSize:      Number of distinct values (integer values only).
+        :param payloadLength:   Number of bytes in each value (bytes values only).
+        """
+        if (valueType not in CONSENSUS_VALUE_TYPES):
+            print("Unknown consensus value type " + str(valueType) + ". Must be one of " + str(CONSENSUS_VALUE_TYPES))
+            exit(1)
+        if ((valueType == INT_VALUE_TYPE) and (domainSize < 2)):
+            print("Integer consensus values need a domain of at least 2 values, not " + str(domainSize))
+            exit(1)
+        if ((valueType == BYTES_VALUE_TYPE) and (payloadLength < 1)):
+            print("Bytes consensus values need a payload of at least 1 byte, not " + str(payloadLength))
+            exit(1)
+        self.valueType = valueType
+        self.domainSize = domainSize
+        self.payloadLength = payloadLength
+
+    def convertValue(self, value):
+        """
+        Convert a value from a config (e.g. a boolean default consensus value) to this value space.
+
+        :param value:   Value to convert.
+
+        :return: Value of this space's type.
+        """
+        if (self.valueType == BOOL_VALUE_TYPE):
+            return bool(value)
+        elif (self.valueType == INT_VALUE_TYPE):
+            return int(value) % self.domainSize
+        elif (isinstance(value, bytes)):
+            return value
+        else:
+            # Repeat the byte for the integer value (e.g. False becomes all zeros)
+            return bytes([int(value) % 256]) * self.payloadLength
+
+    def sampleValue(self, randomGenerator):
+        """
+        Draw a value uniformly from the space.
+
+        :param randomGenerator: numpy Generator to draw the value with.
+
+        :return: Value.
+        """
+        if (self.valueType == BOOL_VALUE_TYPE):
+            return bool(randomGenerator.random() < 0.5)
+        elif (self.valueType == INT_VALUE_TYPE):
+            return int(randomGenerator.integers(self.domainSize))
+        else:
+            return randomGenerator.bytes(self.payloadLength)
+
+    def getLieValue(self, value, randomGenerator=None):
+        """
+        Get a value that a lying node sends in place of the real one.
+
+        :param value:           Real value.
+        :param randomGenerator: numpy Generator to draw the lie with, or None to always return the same lie for the
+                                same value (so that colluding nodes agree on it).
+
+        :return: Value different from the real one.
+        """
+        if (self.valueType == BOOL_VALUE_TYPE):
+            return not value
+        elif (self.valueType == INT_VALUE_TYPE):
+            offset = 1 if (randomGenerator is None) else int(randomGenerator.integers(1, self.domainSize))
+            return (value + offset) % self.domainSize
+        elif (randomGenerator is None):
+            return bytes([value[0] ^ 0xFF]) + value[1:]
+        else:
+            lieValue = randomGenerator.bytes(len(value))
+            # Equal to the real value with negligible probability for realistic payloads, but make sure of it
+            return lieValue if (lieValue != value) else self.getLieValue(value)
+
+    def packValue(self, value):
+        """
+        Encode a value for a binary file.
+
+        :param value:   Value to encode.
+
+        :return: Bytes encoding the value.
+        """
+        if (self.valueType == BOOL_VALUE_TYPE):
+            return BOOL_VALUE_STRUCT.pack(value)
+        elif (self.valueType == INT_VALUE_TYPE):
+            return INT_VALUE_STRUCT.pack(value)
+        else:
+            return BYTES_LENGTH_STRUCT.pack(len(value)) + value
+
+    def readValue(self, valueFile):
+        """
+        Read a value encoded by packValue.
+
+        :param valueFile:   Binary file positioned at the start of the value.
+
+        :return: Value.
+        """
+        if (self.valueType == BOOL_VALUE_TYPE):
+            return BOOL_VALUE_STRUCT.unpack(valueFile.read(BOOL_VALUE_STRUCT.size))[0]
+        elif (self.valueType == INT_VALUE_TYPE):
+            return INT_VALUE_STRUCT.unpack(valueFile.read(INT_VALUE_STRUCT.size))[0]
+        else:
+            (valueLength,) = BYTES_LENGTH_STRUCT.unpack(valueFile.read(BYTES_LENGTH_STRUCT.size))
+            return valueFile.read(valueLength)
+
+
+class ConsensusBatchValueSpace(ConsensusValueSpace):
+    """
+    Space of batches of values, so that one execution of the consensus protocol commits several values. A batch is a
+    tuple of batchSize values of the element type, and is aggregated position by position (see getMajorityOfBatches).
+    """
+
+    def __init__(self, valueType, domainSize, payloadLength, batchSize):
+        """
+        Create the value space.
+
+        :param valueType:       Type of the values in each batch (one of CONSENSUS_VALUE_TYPES).
+        :param domainSize:      Number of distinct values (integer values only).
+        :param payloadLength:   Number of bytes in each value (bytes values only).
+        :param batchSize:       Number of values in each batch.
+        """
+        ConsensusValueSpace.__init__(self, valueType, domainSize, payloadLength)
+        if (batchSize < 1):
+            print("The consensus batch size must be at least 1, not " + str(batchSize))
+            exit(1)
+        self.batchSize = batchSize
+
+    def convertValue(self, value):
+        if (isinstance(value, (tuple, list))):
+            return tuple(ConsensusValueSpace.convertValue(self, element) for element in value)
+        # A single value from a config is used in every position
+        return (ConsensusValueSpace.convertValue(self, value),) * self.batchSize
+
+    def sampleValue(self, randomGenerator):
+        if (self.valueType == BOOL_VALUE_TYPE):
+            return tuple((randomGenerator.random(self.batchSize) < 0.5).tolist())
+        elif (self.valueType == INT_VALUE_TYPE):
+            return tuple(randomGenerator.integers(self.domainSize, size=self.batchSize).tolist())
+        else:
+            return tuple(randomGenerator.bytes(self.payloadLength) for i in range(self.batchSize))
+
+    def getLieValue(self, value, randomGenerator=None):
+        return tuple(ConsensusValueSpace.getLieValue(self, element, randomGenerator) for element in value)
+
+    def packValue(self, value):
+        return b"".join(ConsensusValueSpace.packValue(self, element) for element in value)
+
+    def readValue(self, valueFile):
+        return tuple(ConsensusValueSpace.readValue(self, valueFile) for i in range(self.batchSize))
@@ -0,0 +1,225 @@
+import numpy as np
+from byzantine_faults import *
+from consensus_values import *
+
+# How faulty nodes corrupt the messages they send
+# Each message is corrupted independently with probability 0.5 (to a random wrong value)
+RANDOM_FAULT_STRATEGY = "random"
+# Every message carries a wrong value (the opposite of the value the node should send for booleans)
+ALWAYS_LIE_FAULT_STRATEGY = "always_lie"
+# Each faulty node lies to a random half of the nodes and tells the truth to the other half (equivocation). The half is
+# chosen each round.
+LIE_TO_HALF_FAULT_STRATEGY = "lie_to_half"
+# All faulty nodes send the same wrong value (a lie about the true consensus value) in every message
+COLLUDE_FAULT_STRATEGY = "collude"
+# Messages carry the correct value, but the ones to a random half of the nodes take the maximum latency
+SELECTIVE_DELAY_FAULT_STRATEGY = "selective_delay"
+# Each faulty node stops sending messages at a random depth of the recursion and stays crashed for as long as it is
+# faulty
+CRASH_STOP_FAULT_STRATEGY = "crash_stop"
+FAULT_STRATEGIES = [RANDOM_FAULT_STRATEGY, ALWAYS_LIE_FAULT_STRATEGY, LIE_TO_HALF_FAULT_STRATEGY,
+                    COLLUDE_FAULT_STRATEGY, SELECTIVE_DELAY_FAULT_STRATEGY, CRASH_STOP_FAULT_STRATEGY]
+
+# How the faulty nodes are chosen for each round
+# A new set of faulty nodes is drawn uniformly each round
+RESAMPLE_FAULTY_SET_POLICY = "resample"
+# The same nodes stay faulty until the number of faulty nodes changes
+PERSISTENT_FAULTY_SET_POLICY = "persistent"
+# The faulty nodes are a window of consecutive node numbers that moves forward by one node each round
+ROTATING_FAULTY_SET_POLICY = "rotating"
+FAULTY_SET_POLICIES = [RESAMPLE_FAULTY_SET_POLICY, PERSISTENT_FAULTY_SET_POLICY, ROTATING_FAULTY_SET_POLICY]
+
+# Number of uniform samples drawn at a time for the random strategy
+RANDOM_LIE_BLOCK_SIZE = 4096
+
+# Crash chain length for nodes that don't crash (longer than any commanding general chain)
+NO_CRASH_CHAIN_LENGTH = np.iinfo(np.int64).max
+
+
+class RoundFaultPlan:
+    """
+    Faults that the faulty nodes inject in one consensus round.
+
+    Every decision that doesn't depend on the individual message is made when the round starts and stored in arrays
+    indexed by node number, so applying the faults to a message is a few array lookups.
+    """
+
+    def __init__(self, numNodes, faultyNodes, strategy, maxLatencyMs, valueSpace):
+        """
+        Create a plan in which the faulty nodes don't do anything wrong yet (see ByzantineFaultModel.planRound).
+
+        :param numNodes:        Number of nodes in the network.
+        :param faultyNodes:     Node numbers of the nodes that are faulty in the round.
+        :param strategy:        Fault strategy (one of FAULT_STRATEGIES).
+        :param maxLatencyMs:    Maximum latency of a message, used for delayed messages.
+        :param valueSpace:      ConsensusValueSpace that lies are drawn from.
+        """
+        self.strategy = strategy
+        self.valueSpace = valueSpace
+        self.maxLatencyMs = maxLatencyMs
+        self.isFaulty = np.zeros(numNodes, dtype=bool)
+        self.isFaulty[list(faultyNodes)] = True
+        # [sender, dest] True if the sender lies in its messages to dest
+        self.liesTo = np.zeros((numNodes, numNodes), dtype=bool)
+        # [sender, dest] True if the sender's messages to dest take the maximum latency
+        self.delaysTo = np.zeros((numNodes, numNodes), dtype=bool)
+        # Shortest commanding general chain of the messages that each node doesn't send because it has crashed
+        self.crashChainLength = np.full(numNodes, NO_CRASH_CHAIN_LENGTH)
+        # Value sent in place of the real one by lying nodes, or None if they send a lie about the real one
+        self.colludingValue = None
+        # Uniform samples used to decide which messages are corrupted with the random strategy
+        self.randomLieUniforms = np.empty(0)
+        self.randomLieIdx = 0
+
+    def applyFaults(self, message, sender, dest, delayMs, randomGenerator):
+        """
+        Apply the faults of a faulty sender to a message.
+
+        :param message:         Message being sent (uncorrupted).
+        :param sender:          Node number of the sender. Must be faulty in this round.
+        :param dest:            Node number of the receiver.
+        :param delayMs:         Latency the message would have without faults.
+        :param randomGenerator: numpy Generator used for the decisions made per message (random strategy).
+
+        :return: Tuple of the content to deliver and the delay in milliseconds before delivering it. The delay is None
+        if the message isn't sent.
+        """
+        if (len(message.commandingGeneralChain) >= self.crashChainLength[sender]):
+            return message.content, None
+
+        content = message.content
+        if (self.strategy == RANDOM_FAULT_STRATEGY):
+            if (self.getNextRandomLieUniform(randomGenerator) < 0.5):
+                content = self.getLieContent(content, randomGenerator)
+        elif (self.liesTo[sender, dest]):
+            content = self.getLieContent(content, randomGenerator)
+
+        if (self.delaysTo[sender, dest]):
+            delayMs = self.maxLatencyMs
+        return content, delayMs
+
+    def getLieContent(self, content, randomGenerator):
+        """
+        Get the content that a faulty sender puts in a message that it lies in.
+
+        :param content:         Real content of the message.
+        :param randomGenerator: numpy Generator to draw the lie with (random strategy only).
+
+        :return: Content to deliver.
+        """
+        if (self.colludingValue is not None):
+            return self.colludingValue
+        if (self.strategy == RANDOM_FAULT_STRATEGY):
+            return self.valueSpace.getLieValue(content, randomGenerator)
+        return self.valueSpace.getLieValue(content)
+
+    def getNextRandomLieUniform(self, randomGenerator):
+        """
+        Get the next uniform sample for the random strategy, drawing a new block of samples when they run out.
+
+        :param randomGenerator: numpy Generator to draw the samples with.
+
+        :return: Sample from [0, 1).
+        """
+        if (self.randomLieIdx >= len(self.randomLieUniforms)):
+            self.randomLieUniforms = randomGenerator.random(RANDOM_LIE_BLOCK_SIZE)
+            self.randomLieIdx = 0
+        sample = self.randomLieUniforms[self.randomLieIdx]
+        self.randomLieIdx += 1
+        return sample
+
+
+class ByzantineFaultModel:
+    """
+    Chooses which nodes are faulty in each round and plans the faults that they inject.
+    """
+
+    def __init__(self, numNodes, strategy, faultySetPolicy, maxLatencyMs, randomGenerator, valueSpace):
+        """
+        Create the fault model.
+
+        :param numNodes:        Number of nodes in the network.
+        :param strategy:        How faulty nodes corrupt their messages (one of FAULT_STRATEGIES).
+        :param faultySetPolicy: How the faulty nodes are chosen for each round (one of FAULTY_SET_POLICIES).
+        :param maxLatencyMs:    Maximum latency of a message.
+        :param randomGenerator: numpy Generator used to choose the faulty nodes and plan each round.
+        :param valueSpace:      ConsensusValueSpace of the values the nodes agree on.
+        """
+        if (strategy not in FAULT_STRATEGIES):
+            print("Unknown fault strategy " + str(strategy) + ". Must be one of " + str(FAULT_STRATEGIES))
+            exit(1)
+        if (faultySetPolicy not in FAULTY_SET_POLICIES):
+            print("Unknown faulty set policy " + str(faultySetPolicy) + ". Must be one of " + str(
+                FAULTY_SET_POLICIES))
+            exit(1)
+        self.numNodes = numNodes
+        self.strategy = strategy
+        self.faultySetPolicy = faultySetPolicy
+        self.maxLatencyMs = maxLatencyMs
+        self.randomGenerator = randomGenerator
+        self.valueSpace = valueSpace
+
+        self.faultyNodes = []
+        # First node of the window of faulty nodes (rotating policy)
+        self.rotationOffset = None
+        # Faulty nodes that have crashed (crash-stop strategy). A node recovers once it is no longer faulty.
+        self.crashedNodes = set()
+
+    def selectFaultyNodes(self, numFaultyNodes):
+        """
+        Choose the nodes that are faulty in the next round.
+
+        :param numFaultyNodes:  Number of faulty nodes.
+
+        :return: List of the node numbers of the faulty nodes.
+        """
+        if (self.faultySetPolicy == ROTATING_FAULTY_SET_POLICY):
+            if (self.rotationOffset is None):
+                self.rotationOffset = int(self.randomGenerator.integers(self.numNodes))
+            else:
+                self.rotationOffset = (self.rotationOffset + 1) % self.numNodes
+            self.faultyNodes = ((self.rotationOffset + np.arange(numFaultyNodes)) % self.numNodes).tolist()
+        elif ((self.faultySetPolicy == RESAMPLE_FAULTY_SET_POLICY) or (len(self.faultyNodes) != numFaultyNodes)):
+            self.faultyNodes = self.randomGenerator.choice(self.numNodes, numFaultyNodes, replace=False).tolist()
+        return self.faultyNodes
+
+    def planRound(self, faultyNodes, trueConsensusValue, maxChainLength):
+        """
+        Plan the faults for a round.
+
+        :param faultyNodes:         Node numbers of the nodes that are faulty in the round.
+        :param trueConsensusValue:  Value that a non-faulty commanding general sends.
+        :param maxChainLength:      Length of the longest commanding general chain in the round (largest m value + 1).
+
+        :return: RoundFaultPlan for the round.
+        """
+        plan = RoundFaultPlan(self.numNodes, faultyNodes, self.strategy, self.maxLatencyMs, self.valueSpace)
+        faultyNodes = list(faultyNodes)
+        # Each faulty node's targets for the strategies that only affect half of the nodes
+        halfOfNodes = np.arange(self.numNodes) < (self.numNodes // 2)
+
+        if (self.strategy == ALWAYS_LIE_FAULT_STRATEGY):
+            plan.liesTo[faultyNodes] = True
+        elif (self.strategy == LIE_TO_HALF_FAULT_STRATEGY):
+            plan.liesTo[faultyNodes] = self.randomGenerator.permuted(
+                np.tile(halfOfNodes, (len(faultyNodes), 1)), axis=1)
+        elif (self.strategy == COLLUDE_FAULT_STRATEGY):
+            plan.liesTo[faultyNodes] = True
+            plan.colludingValue = self.valueSpace.getLieValue(trueConsensusValue)
+        elif (self.strategy == SELECTIVE_DELAY_FAULT_STRATEGY):
+            plan.delaysTo[faultyNodes] = self.randomGenerator.permuted(
+                np.tile(halfOfNodes, (len(faultyNodes), 1)), axis=1)
+        elif (self.strategy == CRASH_STOP_FAULT_STRATEGY):
+            self.crashedNodes.intersection_update(faultyNodes)
+            for nodeNum in faultyNodes:
+                if (nodeNum in self.crashedNodes):
+                    # Crashed in an earlier round, so it only ever sends messages as the commanding general
+                    plan.crashChainLength[nodeNum] = 2
+                    continue
+                # The commanding general's message is always sent (see shouldDropMessage). maxChainLength + 1 means
+                # the node doesn't crash during this round.
+                crashChainLength = int(self.randomGenerator.integers(2, maxChainLength + 2))
+                if (crashChainLength <= maxChainLength):
+                    plan.crashChainLength[nodeNum] = crashChainLength
+                    self.crashedNodes.add(nodeNum)
+        return plan
@@ -0,0 +1,173 @@
+import numpy as np
+
+# Processes that generate the true number of faulty nodes in each round
+# Piecewise constant: each count is drawn uniformly and held for a length drawn from a list of persistence lengths (the
+# original schedule written by byzantine_mab_config_writer)
+STEP_FAULT_SCHEDULE = "step"
+# Markov switching: each round the count switches with a fixed probability to a count drawn uniformly from the others
+MARKOV_FAULT_SCHEDULE = "markov"
+# Periodic bursts: a base count, raised to a burst count for a fixed number of rounds in every period. Each schedule
+# gets a random phase.
+PERIODIC_BURST_FAULT_SCHEDULE = "burst"
+# Drift: the count follows a Gaussian random walk, reflected at 0 and the maximum count, and rounded to an integer
+DRIFT_FAULT_SCHEDULE = "drift"
+FAULT_SCHEDULE_PROCESSES = [STEP_FAULT_SCHEDULE, MARKOV_FAULT_SCHEDULE, PERIODIC_BURST_FAULT_SCHEDULE,
+                            DRIFT_FAULT_SCHEDULE]
+
+# Smallest integer type that holds any faulty node count of a schedule
+FAULT_SCHEDULE_DTYPE = np.int16
+
+
+def generateStepFaultSchedules(randomGenerator, numSchedules, numRounds, maxFaulty, persistenceLengths):
+    """
+    Generate piecewise constant schedules.
+
+    :param randomGenerator:     numpy Generator to draw the schedules with.
+    :param numSchedules:        Number of schedules to generate.
+    :param numRounds:           Number of rounds in each schedule.
+    :param maxFaulty:           Largest number of faulty nodes.
+    :param persistenceLengths:  Numbers of rounds that a count can be held for. Each count's length is drawn uniformly
+                                from these.
+
+    :return: Array of shape (numSchedules, numRounds) with the number of faulty nodes in each round of each schedule.
+    """
+    persistenceLengths = np.asarray(persistenceLengths, dtype=np.int64)
+    # Enough segments to cover every round even if every segment has the shortest length
+    maxSegments = -(-numRounds // int(persistenceLengths.min()))
+    segmentLengths = persistenceLengths[randomGenerator.integers(len(persistenceLengths),
+                                                                 size=(numSchedules, maxSegments))]
+    segmentCounts = randomGenerator.integers(0, maxFaulty + 1, size=(numSchedules, maxSegments))
+
+    # Mark the first round of every segment after the first, then number the segments with a running sum
+    segmentStarts = np.cumsum(segmentLengths, axis=1)[:, :-1]
+    isSegmentStart = np.zeros((numSchedules, numRounds + 1), dtype=np.int64)
+    scheduleIdxs = np.broadcast_to(np.arange(numSchedules)[:, None], segmentStarts.shape)
+    np.add.at(isSegmentStart, (scheduleIdxs, np.minimum(segmentStarts, numRounds)), 1)
+    segmentIdxs = np.cumsum(isSegmentStart[:, :numRounds], axis=1)
+    return np.take_along_axis(segmentCounts, segmentIdxs, axis=1).astype(FAULT_SCHEDULE_DTYPE)
+
+
+def generateMarkovFaultSchedules(randomGenerator, numSchedules, numRounds, maxFaulty, switchProbability):
+    """
+    Generate Markov switching schedules.
+
+    :param randomGenerator:     numpy Generator to draw the schedules with.
+    :param numSchedules:        Number of schedules to generate.
+    :param numRounds:           Number of rounds in each schedule.
+    :param maxFaulty:           Largest number of faulty nodes.
+    :param switchProbability:   Probability that the count changes after each round.
+
+    :return: Array of shape (numSchedules, numRounds) with the number of faulty nodes in each round of each schedule.
+    """
+    numCounts = maxFaulty + 1
+    initialCounts = randomGenerator.integers(0, numCounts, size=(numSchedules, 1))
+    if (numCounts == 1):
+        return np.broadcast_to(initialCounts, (numSchedules, numRounds)).astype(FAULT_SCHEDULE_DTYPE)
+    # Adding an offset from 1 to maxFaulty (mod the number of counts) moves to a uniformly drawn different count, so
+    # the whole chain is a running sum of the offsets of the rounds that switch
+    switches = randomGenerator.random((numSchedules, numRounds)) < switchProbability
+    switches[:, 0] = False
+    offsets = randomGenerator.integers(1, numCounts, size=(numSchedules, numRounds)) * switches
+    return ((initialCounts + np.cumsum(offsets, axis=1)) % numCounts).astype(FAULT_SCHEDULE_DTYPE)
+
+
+def generatePeriodicBurstFaultSchedules(randomGenerator, numSchedules, numRounds, maxFaulty, period, burstLength,
+                                        baseFaulty=0):
+    """
+    Generate periodic burst schedules.
+
+    :param randomGenerator: numpy Generator to draw the phase of each schedule with.
+    :param numSchedules:    Number of schedules to generate.
+    :param numRounds:       Number of rounds in each schedule.
+    :param maxFaulty:       Number of faulty nodes during a burst.
+    :param period:          Number of rounds from the start of one burst to the start of the next.
+    :param burstLength:     Number of rounds in each burst.
+    :param baseFaulty:      Number of faulty nodes outside of bursts.
+
+    :return: Array of shape (numSchedules, numRounds) with the number of faulty nodes in each round of each schedule.
+    """
+    phases = randomGenerator.integers(0, period, size=(numSchedules, 1))
+    isBurst = ((np.arange(numRounds)[None, :] + phases) % period) < burstLength
+    return np.where(isBurst, maxFaulty, baseFaulty).astype(FAULT_SCHEDULE_DTYPE)
+
+
+def generateDriftFaultSchedules(randomGenerator, numSchedules, numRounds, maxFaulty, driftStdDev):
+    """
+    Generate drifting schedules.
+
+    :param randomGenerator: numpy Generator to draw the schedules with.
+    :param numSchedules:    Number of schedules to generate.
+    :param numRounds:       Number of rounds in each schedule.
+    :param maxFaulty:       Largest number of faulty nodes.
+    :param driftStdDev:     Standard deviation of the change in the (unrounded) count after each round.
+
+    :return: Array of shape (numSchedules, numRounds) with the number of faulty nodes in each round of each schedule.
+    """
+    if (maxFaulty == 0):
+        return np.zeros((numSchedules, numRounds), dtype=FAULT_SCHEDULE_DTYPE)
+    steps = randomGenerator.normal(0.0, driftStdDev, size=(numSchedules, numRounds))
+    steps[:, 0] = randomGenerator.uniform(0, maxFaulty, size=numSchedules)
+    levels = np.cumsum(steps, axis=1)
+    # Reflect the walk into [0, maxFaulty]: fold it into one period of a triangle wave
+    levels = np.mod(levels, 2 * maxFaulty)
+    levels = np.where(levels > maxFaulty, (2 * maxFaulty) - levels, levels)
+    return np.rint(levels).astype(FAULT_SCHEDULE_DTYPE)
+
+
+def generateFaultSchedules(process, randomGenerator, numSchedules, numRounds, maxFaulty, **processParams):
+    """
+    Generate schedules of the true number of faulty nodes in each round. All schedules are drawn at once, so a sweep
+    can generate thousands of them in a single call.
+
+    :param process:         Process to generate the schedules with (one of FAULT_SCHEDULE_PROCESSES).
+    :param randomGenerator: numpy Generator to draw the schedules with.
+    :param numSchedules:    Number of schedules to generate.
+    :param numRounds:       Number of rounds in each schedule.
+    :param maxFaulty:       Largest number of faulty nodes.
+    :param processParams:   Parameters of the process (see the generate*FaultSchedules function for the process).
+
+    :return: Array of shape (numSchedules, numRounds) with the number of faulty nodes in each round of each schedule.
+    """
+    if (process == STEP_FAULT_SCHEDULE):
+        return generateStepFaultSchedules(randomGenerator, numSchedules, numRounds, maxFaulty, **processParams)
+    elif (process == MARKOV_FAULT_SCHEDULE):
+        return generateMarkovFaultSchedules(randomGenerator, numSchedules, numRounds, maxFaulty, **processParams)
+    elif (process == PERIODIC_BURST_FAULT_SCHEDULE):
+        return generatePeriodicBurstFaultSchedules(randomGenerator, numSchedules, numRounds, maxFaulty,
+                                                   **processParams)
+    elif (process == DRIFT_FAULT_SCHEDULE):
+        return generateDriftFaultSchedules(randomGenerator, numSchedules, numRounds, maxFaulty, **processParams)
+    print("Unknown fault schedule process " + str(process) + ". Must be one of " + str(FAULT_SCHEDULE_PROCESSES))
+    exit(1)
+
+
+def getFaultScheduleChanges(faultSchedule):
+    """
+    Get the rounds at which a schedule changes the number of faulty nodes, in the form used by
+    ByzantineErrorConfig.consensusRoundToSetMValue.
+
+    :param faultSchedule:   Array with the number of faulty nodes in each round.
+
+    :return: Map of round number to the number of faulty nodes from that round on. Always has an entry for round 0.
+    """
+    faultSchedule = np.asarray(faultSchedule)
+    changeRounds = np.concatenate(([0], np.flatnonzero(np.diff(faultSchedule)) + 1))
+    return dict(zip(changeRounds.tolist(), faultSchedule[changeRounds].tolist()))
+
+
+def getTrueFaultyCounts(consensusRoundToSetMValue, numRounds):
+    """
+    Expand the changes in the number of faulty nodes from a config into the number in every round.
+
+    :param consensusRoundToSetMValue:   Map of round number to the number of faulty nodes from that round on (see
+                                        ByzantineErrorConfig). Rounds before the first change have no faulty nodes.
+    :param numRounds:                   Number of rounds.
+
+    :return: Array with the number of faulty nodes in each round.
+    """
+    changeRounds = np.array(sorted(consensusRoundToSetMValue.keys()), dtype=np.int64)
+    changeRounds = changeRounds[changeRounds < numRounds]
+    counts = np.concatenate(([0], [consensusRoundToSetMValue[changeRound] for changeRound in changeRounds]))
+    # Number of changes at or before each round, which indexes the count in effect
+    countIdxs = np.searchsorted(changeRounds, np.arange(numRounds), side="right")
+    return counts[countIdxs].astype(FAULT_SCHEDULE_DTYPE)
@@ -0,0 +1,321 @@
+import sys
+import time
+import joblib
+import numpy as np
+from byzantine_mab_configs import *
+from byzantine_mab_results import *
+from multiarmed_bandit_executor import *
+from random_streams import *
+from consensus_values import *
+from fault_schedules import *
+from fault_models import *
+
+# Command line flag giving the milliseconds added to every hop (see OralMessagesSurrogate), e.g. as suggested by
+# benchmarks.surrogate_validation_benchmark
+PER_HOP_OVERHEAD_FLAG_PREFIX = "--per-hop-overhead-ms="
+
+
+class OralMessagesLevel:
+    """
+    Messages exchanged at one level of the OM(m) recursion (all messages whose commanding general chain has the same
+    length), in a canonical labelling where the commanding general is node 0.
+    """
+
+    def __init__(self, relayers, receivers, aggregationOrder):
+        """
+        Create the level.
+
+        :param relayers:            Node that sends each message (the last general in its chain).
+        :param receivers:           Node that receives each message.
+        :param aggregationOrder:    Order that sorts this level's messages by the previous level's message that they
+                                    are aggregated into (the message the receiver got with the chain minus its last
+                                    general). Every previous-level message has the same number of these children. None
+                                    for the first level.
+        """
+        self.relayers = relayers
+        self.receivers = receivers
+        self.aggregationOrder = aggregationOrder
+
+
+class OralMessagesSurrogate:
+    """
+    Monte Carlo model of rounds of OM(m) consensus that samples whole rounds as array operations instead of exchanging
+    messages between node processes.
+
+    The message structure of a round doesn't depend on the faults or delays, so it is built once. Each sampled round
+    then draws a delay for every message (clamped normal, as in the simulator) and a content for every message sent by
+    a faulty node. A node's latency is the latest arrival time over the chains of m + 1 hops that end at it. Its decision
+    is the majority aggregation over its results tree used by the nodes (ties go to the default value). Node
+    processing time is not modelled beyond an optional fixed overhead per hop.
+    """
+
+    def __init__(self, numNodes, mValue, networkLatencyConfig, defaultConsensusValue, randomGenerator,
+                 perHopOverheadMs=0.0):
+        """
+        Build the message structure for OM(m).
+
+        :param numNodes:                Number of nodes.
+        :param mValue:                  M value used in consensus.
+        :param networkLatencyConfig:    Configuration for the network latency.
+        :param defaultConsensusValue:   Value used when there is a tie.
+        :param randomGenerator:         numpy Generator to sample rounds with.
+        :param perHopOverheadMs:        Milliseconds added to every hop (e.g. to calibrate against the simulator's
+                                        processing time).
+        """
+        if ((mValue < 0) or (mValue > (numNodes - 2))):
+            raise ValueError("m must be between 0 and n - 2 (got n=" + str(numNodes) + ", m=" + str(mValue) + ")")
+        self.numNodes = numNodes
+        self.mValue = mValue
+        self.networkLatencyConfig = networkLatencyConfig
+        self.defaultConsensusValue = defaultConsensusValue
+        self.randomGenerator = randomGenerator
+        self.perHopOverheadMs = perHopOverheadMs
+        self.levels = self.buildLevels()
+
+        # Order that groups the messages of the last level by receiver (every node other than the general receives the
+        # same number)
+        self.lastLevelReceiverOrder = np.argsort(self.levels[-1].receivers, kind="stable")
+
+    def buildLevels(self):
+        """
+        Build the messages of every level of the recursion.
+
+        :return: List of OralMessagesLevel, one for each chain length from 1 to m + 1.
+        """
+        numNodes = self.numNodes
+        # Commanding general chains of the messages at the current level, one row per message
+        chains = np.zeros((numNodes - 1, 1), dtype=np.int64)
+        receivers = np.arange(1, numNodes, dtype=np.int64)
+        levels = [OralMessagesLevel(chains[:, -1], receivers, None)]
+        previousKeys = self.getMessageKeys(chains, receivers)
+
+        for chainLength in range(2, self.mValue + 2):
+            # Each receiver relays what it got to every node that isn't in the chain yet
+            relayChains = np.concatenate([chains, receivers[:, None]], axis=1)
+            inChain = np.zeros((len(relayChains), numNodes), dtype=bool)
+            np.put_along_axis(inChain, relayChains, True, axis=1)
+            messageIdx, newReceivers = np.nonzero(~inChain)
+            chains = relayChains[messageIdx]
+            receivers = newReceivers.astype(np.int64)
+
+            # The receiver aggregates this message into the one it got with the chain minus its last general. Messages
+            # are generated in key order, so the previous level's keys are sorted.
+            aggregationParents = np.searchsorted(previousKeys, self.getMessageKeys(chains[:, :-1], receivers))
+            levels.append(OralMessagesLevel(chains[:, -1], receivers, np.argsort(aggregationParents, kind="stable")))
+            previousKeys = self.getMessageKeys(chains, receivers)
+        return levels
+
+    def getMessageKeys(self, chains, receivers):
+        """
+        Get an integer key that uniquely identifies each message (its chain and receiver, as digits in base n).
+
+        :param chains:      Commanding general chains, one row per message.
+        :param receivers:   Receiver of each message.
+
+        :return: Array of keys.
+        """
+        keys = np.zeros(len(receivers), dtype=np.int64)
+        for chainPosition in range(chains.shape[1]):
+            keys = (keys * self.numNodes) + chains[:, chainPosition]
+        return (keys * self.numNodes) + receivers
+
+    def getMessagesPerRound(self):
+        return sum(len(level.receivers) for level in self.levels)
+
+    def sampleDelays(self, shape):
+        """
+        Sample message delays the way the simulator does (normal, clamped to [0, max latency]).
+
+        :param shape:   Shape of the array of delays.
+
+        :return: Array of delays in milliseconds.
+        """
+        delays = self.randomGenerator.normal(self.networkLatencyConfig.averageLatencyMs,
+                                             self.networkLatencyConfig.latencyStdDevMs, shape)
+        np.clip(delays, 0, self.networkLatencyConfig.maxLatencyMs, out=delays)
+        if (self.perHopOverheadMs != 0):
+            delays += self.perHopOverheadMs
+        return delays
+
+    def sampleRounds(self, trueConsensusValues, numFaultyNodes):
+        """
+        Sample rounds of consensus.
+
+        :param trueConsensusValues: Value the general is given to send in each round (one entry per round).
+        :param numFaultyNodes:      Number of faulty nodes in every round.
+
+        :return: List with a tuple of (SingleRoundResults, list of faulty nodes) for each round.
+        """
+        numRounds = len(trueConsensusValues)
+        numNodes = self.numNodes
+        randomGenerator = self.randomGenerator
+
+        # Faulty nodes in the canonical labelling (general is node 0)
+        faultyOrder = randomGenerator.permuted(np.tile(np.arange(numNodes), (numRounds, 1)), axis=1)
+        isFaulty = np.zeros((numRounds, numNodes), dtype=bool)
+        np.put_along_axis(isFaulty, faultyOrder[:, :numFaultyNodes], True, axis=1)
+        trueValues = np.asarray(trueConsensusValues, dtype=bool)
+
+        # Walk down the recursion, tracking the arrival time and received content of every message
+        levelArrivals = []
+        levelContents = []
+        arrivals = None
+        contents = None
+        for levelIdx, level in enumerate(self.levels):
+            numMessages = len(level.receivers)
+            delays = self.sampleDelays((numRounds, numMessages))
+            if (levelIdx == 0):
+                arrivals = delays
+                contents = np.repeat(trueValues[:, None], numMessages, axis=1)
+            else:
+                relaysPerMessage = numMessages // levelArrivals[-1].shape[1]
+                arrivals = np.repeat(arrivals, relaysPerMessage, axis=1) + delays
+                contents = np.repeat(contents, relaysPerMessage, axis=1)
+            faultySender = isFaulty[:, level.relayers]
+            contents = np.where(faultySender, randomGenerator.random((numRounds, numMessages)) < 0.5, contents)
+            levelArrivals.append(arrivals)
+            levelContents.append(contents)
+
+        # A node has its result once the last message of the deepest level reaches it
+        lastLevelArrivals = levelArrivals[-1][:, self.lastLevelReceiverOrder]
+        nodeLatencies = lastLevelArrivals.reshape(numRounds, numNodes - 1, -1).max(axis=2)
+
+        # Aggregate the results trees from the leaves up: each message's result is the majority of its own content and
+        # the results of the messages aggregated into it
+        results = levelContents[-1]
+        for levelIdx in range(len(self.levels) - 1, 0, -1):
+            numParents = levelContents[levelIdx - 1].shape[1]
+            childResults = results[:, self.levels[levelIdx].aggregationOrder].reshape(numRounds, numParents, -1)
+            trueCount = levelContents[levelIdx - 1] + childResults.sum(axis=2)
+            falseCount = (childResults.shape[2] + 1) - trueCount
+            results = np.where(trueCount == falseCount, self.defaultConsensusValue, trueCount > falseCount)
+        # The first level has one message per receiver, in node order
+        nodeDecisions = results
+
+        # Map the canonical labels back to randomly chosen node numbers
+        nodeLabels = randomGenerator.permuted(np.tile(np.arange(numNodes), (numRounds, 1)), axis=1)
+        sampledRounds = []
+        for roundIdx in range(numRounds):
+            labels = nodeLabels[roundIdx].tolist()
+            general = labels[0]
+            latencies = {general: 0.0}
+            latencies.update(zip(labels[1:], nodeLatencies[roundIdx].tolist()))
+            consensuses = {general: bool(trueValues[roundIdx])}
+            consensuses.update(zip(labels[1:], nodeDecisions[roundIdx].tolist()))
+            faultyNodes = [labels[nodeNum] for nodeNum in np.flatnonzero(isFaulty[roundIdx])]
+
+            loyalDecisions = {decision for nodeNum, decision in consensuses.items() if nodeNum not in faultyNodes}
+            singleRoundResults = SingleRoundResults({self.mValue: latencies}, {self.mValue: consensuses},
+                                                    bool(trueValues[roundIdx]),
+                                                    {self.mValue: (len(loyalDecisions) > 1)})
+            sampledRounds.append((singleRoundResults, faultyNodes))
+        return sampledRounds
+
+
+def runSurrogateSimulation(superConfig, fixedM=None, perHopOverheadMs=0.0):
+    """
+    Run the experiment described by the configs against the surrogate instead of the node processes. Follows the same
+    schedule as run_simulation.runSimulation (true fault counts, observation periods and multi-armed bandit decisions)
+    so the bandit can be tuned quickly.
+
+    :param superConfig:         SuperConfig object that provides access to all configuration parameters.
+    :param fixedM:              M value to use for every round, or None to let the multi-armed bandit choose.
+    :param perHopOverheadMs:    Milliseconds added to every hop (see OralMessagesSurrogate).
+
+    :return: Results (FullResults) for the experiment.
+    """
+    runConfig = superConfig.getRunConfig()
+    byzantineErrorConfig = superConfig.getByzantineErrorConfig()
+    roundConfig = superConfig.getRoundConfig()
+    multiArmedBanditConfig = superConfig.getMultiArmedBanditConfig()
+    networkLatencyConfig = superConfig.getNetworkLatencyConfig()
+    roundsPerObservationPeriod = roundConfig.roundsPerObservationPeriod
+    if ((runConfig.consensusValueType != BOOL_VALUE_TYPE) or (runConfig.consensusBatchSize != 1)):
+        print("The surrogate only models single boolean consensus values, not batches of " + str(
+            runConfig.consensusBatchSize) + " " + str(runConfig.consensusValueType) + " values")
+        exit(1)
+    if ((byzantineErrorConfig.faultStrategy != RANDOM_FAULT_STRATEGY) or
+            (byzantineErrorConfig.faultySetPolicy != RESAMPLE_FAULTY_SET_POLICY)):
+        print("The surrogate only models the " + RANDOM_FAULT_STRATEGY + " fault strategy with the " +
+              RESAMPLE_FAULTY_SET_POLICY + " faulty set policy, not " + str(byzantineErrorConfig.faultStrategy) +
+              " with " + str(byzantineErrorConfig.faultySetPolicy))
+        exit(1)
+    if (byzantineErrorConfig.percentDropMessage > 0):
+        print("The surrogate doesn't model dropped messages (percentDropMessage is " + str(
+            byzantineErrorConfig.percentDropMessage) + ")")
+        exit(1)
+
+    randomStreams = RandomStreams(runConfig.randomSeed)
+    consensusValueRandom = randomStreams.getGenerator(CONSENSUS_VALUE_STREAM)
+    surrogateRandom = randomStreams.getGenerator(SURROGATE_STREAM)
+
+    fullResults = FullResults()
+    fullResults.randomSeed = randomStreams.seed
+
+    if (fixedM is not None):
+        consensusFaultToleranceValue = fixedM
+    else:
+        consensusFaultToleranceValue = runConfig.possibleMValues[
+            consensusValueRandom.integers(len(runConfig.possibleMValues))]
+    multiArmedBanditExecutor = createMultiArmedBanditExecutor(runConfig.possibleMValues, multiArmedBanditConfig)
+
+    # Surrogates are built lazily for each m value, since building the message structure is the expensive part
+    surrogatesByM = {}
+    trueFaultyCounts = getTrueFaultyCounts(byzantineErrorConfig.consensusRoundToSetMValue,
+                                           runConfig.numConsensusRounds)
+    # Rounds at which the number of faulty nodes changes, in order
+    changeRounds = np.flatnonzero(np.diff(trueFaultyCounts)) + 1
+    roundIdx = 0
+    while (roundIdx < runConfig.numConsensusRounds):
+        trueFaultsValue = int(trueFaultyCounts[roundIdx])
+
+        # Sample up to the end of the observation period or the next change in the number of faulty nodes
+        chunkEnd = min(runConfig.numConsensusRounds,
+                       ((roundIdx // roundsPerObservationPeriod) + 1) * roundsPerObservationPeriod)
+        nextChangeIdx = np.searchsorted(changeRounds, roundIdx, side="right")
+        if (nextChangeIdx < len(changeRounds)):
+            chunkEnd = min(chunkEnd, int(changeRounds[nextChangeIdx]))
+
+        if (consensusFaultToleranceValue not in surrogatesByM):
+            surrogatesByM[consensusFaultToleranceValue] = OralMessagesSurrogate(
+                runConfig.numNodes, consensusFaultToleranceValue, networkLatencyConfig,
+                byzantineErrorConfig.defaultConsensusValue, surrogateRandom, perHopOverheadMs)
+        trueConsensusValues = consensusValueRandom.random(chunkEnd - roundIdx) < 0.5
+        for singleRoundResults, faultyNodes in surrogatesByM[consensusFaultToleranceValue].sampleRounds(
+                trueConsensusValues, trueFaultsValue):
+            fullResults.addRoundResults(singleRoundResults, trueFaultsValue, consensusFaultToleranceValue)
+        roundIdx = chunkEnd
+
+        if ((fixedM is None) and ((roundIdx % roundsPerObservationPeriod) == 0)):
+            consensusFaultToleranceValue = multiArmedBanditExecutor.getNextValueOfM(
+                fullResults.roundMetrics.takePeriodMetrics())
+
+    return fullResults
+
+
+if __name__ == "__main__":
+
+    perHopOverheadMs = 0.0
+    for arg in sys.argv:
+        if (arg.startswith(PER_HOP_OVERHEAD_FLAG_PREFIX)):
+            perHopOverheadMs = float(arg[len(PER_HOP_OVERHEAD_FLAG_PREFIX):])
+    args = [arg for arg in sys.argv if (not arg.startswith(PER_HOP_OVERHEAD_FLAG_PREFIX))]
+    if ((len(args) != 3) and (len(args) != 4)):
+        print("Arguments must be the super config file, the results output file, optionally a fixed m value and "
+              "optionally " + PER_HOP_OVERHEAD_FLAG_PREFIX + "<ms> with the milliseconds of processing to add to every "
+              "hop")
+        exit(1)
+    superConfigFile = args[1]
+    resultsOutputFile = args[2]
+    fixedM = None
+    if (len(args) == 4):
+        fixedM = int(args[3])
+
+    superConfig = readSuperConfig(superConfigFile)
+    startTime = time.perf_counter()
+    fullResults = runSurrogateSimulation(superConfig, fixedM, perHopOverheadMs)
+    print("Sampled " + str(len(fullResults.perRoundResults)) + " rounds in " + str(
+        round(time.perf_counter() - startTime, 2)) + " s")
+
+    joblib.dump(fullResults, resultsOutputFile)
+    print("Done with surrogate experiment!")
@@ -0,0 +1,247 @@
+import struct
+from consensus_values import *
+
+# Binary trace of the consensus messages relayed by the network manager. The file starts with a header describing the
+# network, followed by a sequence of records. Each record starts with a one-byte record type. All values are
+# little-endian. Consensus values are encoded by the value space described in the header (see consensus_values).
+
+MESSAGE_TRACE_MAGIC = b"BMTR"
+MESSAGE_TRACE_VERSION = 3
+
+# Magic, version, number of nodes, average/std dev/max latency (ms), value type code (see VALUE_TYPE_CODES), value
+# domain size, value payload length, value batch size. Followed by the default consensus value.
+TRACE_HEADER_STRUCT = struct.Struct("<4sBHdddBIHH")
+
+RECORD_TYPE_STRUCT = struct.Struct("<B")
+
+# Start of a consensus round
+ROUND_START_RECORD_TYPE = 1
+# Round id, commanding general, number of m values, number of faulty nodes. Followed by the true consensus value, the m
+# values and then the faulty node numbers (NODE_NUM_STRUCT each).
+ROUND_START_STRUCT = struct.Struct("<IHBH")
+
+# Consensus message relayed from one node to another
+MESSAGE_RECORD_TYPE = 2
+# Round id, send time (ms), delivery time (ms), source node, destination node, corrupted flag, length of the commanding
+# general chain. Followed by the content and then the commanding general chain (NODE_NUM_STRUCT each).
+MESSAGE_STRUCT = struct.Struct("<IddHH?B")
+
+NODE_NUM_STRUCT = struct.Struct("<H")
+
+
+class MessageTraceRecorder:
+    """
+    Writes a binary trace of the consensus rounds and of every consensus message the network manager relays (with the
+    time it was sent, the time it is due to be delivered, its commanding general chain, its destination and whether a
+    faulty sender corrupted it).
+    """
+
+    def __init__(self, traceFile, numNodes, networkLatencyConfig, defaultConsensusValue, valueSpace):
+        """
+        Create the trace file and write its header.
+
+        :param traceFile:               Name of the file to write the trace to.
+        :param numNodes:                Number of nodes in the network.
+        :param networkLatencyConfig:    Network latency configuration used to generate the message delays.
+        :param defaultConsensusValue:   Value that nodes use when they don't receive a message.
+        :param valueSpace:              ConsensusValueSpace of the values the nodes agree on.
+        """
+        self.valueSpace = valueSpace
+        self.traceFile = open(traceFile, "wb")
+        self.traceFile.write(TRACE_HEADER_STRUCT.pack(MESSAGE_TRACE_MAGIC, MESSAGE_TRACE_VERSION, numNodes,
+                                                      networkLatencyConfig.averageLatencyMs,
+                                                      networkLatencyConfig.latencyStdDevMs,
+                                                      networkLatencyConfig.maxLatencyMs,
+                                                      VALUE_TYPE_CODES[valueSpace.valueType], valueSpace.domainSize,
+                                                      valueSpace.payloadLength, valueSpace.batchSize))
+        self.traceFile.write(valueSpace.packValue(defaultConsensusValue))
+
+    def recordRoundStart(self, roundId, commandingGeneral, trueConsensusValue, mValues, faultyNodes):
+        """
+        Record the start of a consensus round.
+
+        :param roundId:             Id of the round.
+        :param commandingGeneral:   Node acting as the commanding general.
+        :param trueConsensusValue:  Value that the general should send.
+        :param mValues:             M values that the nodes use in the round.
+        :param faultyNodes:         Nodes that are faulty in the round.
+        """
+        self.traceFile.write(RECORD_TYPE_STRUCT.pack(ROUND_START_RECORD_TYPE))
+        self.traceFile.write(ROUND_START_STRUCT.pack(roundId, commandingGeneral, len(mValues), len(faultyNodes)))
+        self.traceFile.write(self.valueSpace.packValue(trueConsensusValue))
+        for nodeNum in list(mValues) + list(faultyNodes):
+            self.traceFile.write(NODE_NUM_STRUCT.pack(nodeNum))
+
+    def recordMessage(self, message, dest, corrupted, sendTimeMs, deliveryTimeMs):
+        """
+        Record a consensus message relayed by the network manager.
+
+        :param message:         Message as it will be delivered (with any corruption already applied).
+        :param dest:            Id of the node that will receive the message.
+        :param corrupted:       True if the content was changed by a faulty sender.
+        :param sendTimeMs:      Time the network manager received the message, in milliseconds.
+        :param deliveryTimeMs:  Time the message is due to be delivered, in milliseconds.
+        """
+        self.traceFile.write(RECORD_TYPE_STRUCT.pack(MESSAGE_RECORD_TYPE))
+        self.traceFile.write(MESSAGE_STRUCT.pack(message.roundId, sendTimeMs, deliveryTimeMs, message.sourceNodeId,
+                                                 dest, corrupted, len(message.commandingGeneralChain)))
+        self.traceFile.write(self.valueSpace.packValue(message.content))
+        for nodeNum in message.commandingGeneralChain:
+            self.traceFile.write(NODE_NUM_STRUCT.pack(nodeNum))
+
+    def close(self):
+        self.traceFile.close()
+
+
+class TracedMessage:
+    """
+    Consensus message read from a trace.
+    """
+
+    def __init__(self, sourceNodeId, destNodeId, content, commandingGeneralChain, corrupted, sendTimeMs,
+                 deliveryTimeMs):
+        """
+        Create the traced message.
+
+        :param sourceNodeId:            Node id of the node that sent the message.
+        :param destNodeId:              Node id of the node that received the message.
+        :param content:                 Content delivered to the destination (with any corruption applied).
+        :param commandingGeneralChain:  Commanding generals that have issued their commands in the recursion.
+        :param corrupted:               True if the content was changed by a faulty sender.
+        :param sendTimeMs:              Time the network manager received the message, in milliseconds.
+        :param deliveryTimeMs:          Time the message was due to be delivered, in milliseconds.
+        """
+        self.sourceNodeId = sourceNodeId
+        self.destNodeId = destNodeId
+        self.content = content
+        self.commandingGeneralChain = commandingGeneralChain
+        self.corrupted = corrupted
+        self.sendTimeMs = sendTimeMs
+        self.deliveryTimeMs = deliveryTimeMs
+
+    def getDelayMs(self):
+        return self.deliveryTimeMs - self.sendTimeMs
+
+
+class TracedRound:
+    """
+    Consensus round read from a trace.
+    """
+
+    def __init__(self, roundId, commandingGeneral, trueConsensusValue, mValues, faultyNodes):
+        """
+        Create the traced round.
+
+        :param roundId:             Id of the round when it was recorded.
+        :param commandingGeneral:   Node acting as the commanding general.
+        :param trueConsensusValue:  Value that the general was given to send.
+        :param mValues:             M values that the nodes used in the round.
+        :param faultyNodes:         Nodes that were faulty in the round.
+        """
+        self.roundId = roundId
+        self.commandingGeneral = commandingGeneral
+        self.trueConsensusValue = trueConsensusValue
+        self.mValues = mValues
+        self.faultyNodes = faultyNodes
+
+        # Map of (commanding general chain tuple, destination node) to TracedMessage. In OM(m), a message is uniquely
+        # identified by its chain (which ends with the sender) and its destination.
+        self.messages = {}
+
+    def getMessage(self, commandingGeneralChain, dest):
+        """
+        Get the traced message with the given chain and destination.
+
+        :param commandingGeneralChain:  Commanding general chain of the message.
+        :param dest:                    Destination of the message.
+
+        :return: TracedMessage, or None if no such message was relayed in the round.
+        """
+        return self.messages.get((tuple(commandingGeneralChain), dest))
+
+
+class MessageTrace:
+    """
+    Contents of a trace file.
+    """
+
+    def __init__(self, numNodes, averageLatencyMs, latencyStdDevMs, maxLatencyMs, valueSpace, defaultConsensusValue,
+                 rounds):
+        """
+        Create the trace.
+
+        :param numNodes:                Number of nodes in the network.
+        :param averageLatencyMs:        Average message latency configured when the trace was recorded.
+        :param latencyStdDevMs:         Standard deviation of the message latency configured when the trace was recorded.
+        :param maxLatencyMs:            Max message latency configured when the trace was recorded.
+        :param valueSpace:              ConsensusValueSpace of the values the nodes agreed on.
+        :param defaultConsensusValue:   Value that nodes use when they don't receive a message.
+        :param rounds:                  TracedRounds in the order they were run.
+        """
+        self.numNodes = numNodes
+        self.averageLatencyMs = averageLatencyMs
+        self.latencyStdDevMs = latencyStdDevMs
+        self.maxLatencyMs = maxLatencyMs
+        self.valueSpace = valueSpace
+        self.defaultConsensusValue = defaultConsensusValue
+        self.rounds = rounds
+
+
+def readNodeNums(traceFile, count):
+    """
+    Read a sequence of node numbers (or m values) from a trace file.
+
+    :param traceFile:   Trace file positioned at the start of the sequence.
+    :param count:       Number of values to read.
+
+    :return: List of the values.
+    """
+    data = traceFile.read(NODE_NUM_STRUCT.size * count)
+    return [values[0] for values in NODE_NUM_STRUCT.iter_unpack(data)]
+
+
+def readMessageTrace(traceFileName):
+    """
+    Read a trace written by MessageTraceRecorder.
+
+    :param traceFileName:   Name of the trace file.
+
+    :return: MessageTrace with the contents of the file.
+    """
+    with open(traceFileName, "rb") as traceFile:
+        (magic, version, numNodes, averageLatencyMs, latencyStdDevMs, maxLatencyMs, valueTypeCode, domainSize,
+         payloadLength, batchSize) = TRACE_HEADER_STRUCT.unpack(traceFile.read(TRACE_HEADER_STRUCT.size))
+        if ((magic != MESSAGE_TRACE_MAGIC) or (version != MESSAGE_TRACE_VERSION)):
+            raise ValueError(traceFileName + " is not a version " + str(MESSAGE_TRACE_VERSION) + " message trace")
+        valueTypesByCode = {code: valueType for valueType, code in VALUE_TYPE_CODES.items()}
+        valueSpace = createConsensusValueSpace(valueTypesByCode[valueTypeCode], domainSize, payloadLength, batchSize)
+        defaultConsensusValue = valueSpace.readValue(traceFile)
+
+        rounds = []
+        roundsById = {}
+        while True:
+            recordTypeBytes = traceFile.read(RECORD_TYPE_STRUCT.size)
+            if (not recordTypeBytes):
+                break
+            (recordType,) = RECORD_TYPE_STRUCT.unpack(recordTypeBytes)
+            if (recordType == ROUND_START_RECORD_TYPE):
+                roundId, commandingGeneral, numMValues, numFaultyNodes = \
+                    ROUND_START_STRUCT.unpack(traceFile.read(ROUND_START_STRUCT.size))
+                trueConsensusValue = valueSpace.readValue(traceFile)
+                mValues = readNodeNums(traceFile, numMValues)
+                faultyNodes = readNodeNums(traceFile, numFaultyNodes)
+                tracedRound = TracedRound(roundId, commandingGeneral, trueConsensusValue, mValues, faultyNodes)
+                rounds.append(tracedRound)
+                roundsById[roundId] = tracedRound
+            elif (recordType == MESSAGE_RECORD_TYPE):
+                roundId, sendTimeMs, deliveryTimeMs, sourceNodeId, dest, corrupted, chainLength = \
+                    MESSAGE_STRUCT.unpack(traceFile.read(MESSAGE_STRUCT.size))
+                content = valueSpace.readValue(traceFile)
+                commandingGeneralChain = readNodeNums(traceFile, chainLength)
+                roundsById[roundId].messages[(tuple(commandingGeneralChain), dest)] = TracedMessage(
+                    sourceNodeId, dest, content, commandingGeneralChain, corrupted, sendTimeMs, deliveryTimeMs)
+            else:
+                raise ValueError("Unknown record type " + str(recordType) + " in " + traceFileName)
+
+    return MessageTrace(numNodes, averageLatencyMs, latencyStdDevMs, maxLatencyMs, valueSpace, defaultConsensusValue,
+                        rounds)
@@ -1,4 +1,54 @@
+from statistics import NormalDist
 import numpy as np
+from online_statistics import *
+
+# Latencies that rewards can be based on (see MultiArmedBanditConfig.reward_mode)
+MEAN_LATENCY_REWARD = "mean"
+P95_LATENCY_REWARD = "p95"
+P99_LATENCY_REWARD = "p99"
+# Quantile of the latency that each tail latency reward is based on
+REWARD_LATENCY_QUANTILES = {P95_LATENCY_REWARD: 0.95, P99_LATENCY_REWARD: 0.99}
+
+# Latency (milliseconds) above which rewards stop decreasing
+MAX_REWARDED_LATENCY_MS = 2500
+
+# Ways of choosing the m value (see MultiArmedBanditConfig.policy)
+UCB_POLICY = "ucb"
+CONTEXTUAL_POLICY = "contextual"
+SAFE_POLICY = "safe"
+
+# Features of the context that ContextualMultiArmedBanditExecutor predicts failures from: a constant, the fault signals
+# of the last observation period (see ContextualMultiArmedBanditExecutor.getSignals) and the m value of the arm
+NUM_CONTEXT_FEATURES = 7
+
+# Newton steps taken to refit ContextualMultiArmedBanditExecutor's failure model after each observation period
+FAILURE_MODEL_NEWTON_STEPS = 5
+
+# Confidence of the upper bounds on each arm's failure rate that SafeMultiArmedBanditExecutor compares to the threshold
+SAFE_FAILURE_BOUND_CONFIDENCE = 0.95
+
+
+def getRoundReward(latencyMs, didFail, multiArmedBanditConfig):
+    """
+    Get the reward the multi-armed bandit would give a single round: the failure penalty if it failed, otherwise the
+    latency reward.
+
+    :param latencyMs:               Latency of the round per value agreed on, in milliseconds.
+    :param didFail:                 True if the non-faulty nodes didn't agree in the round.
+    :param multiArmedBanditConfig:  Configuration of the multi-armed bandit, for its rewards.
+
+    :return: Reward.
+    """
+    if (didFail):
+        return multiArmedBanditConfig.failure_penalty
+    return multiArmedBanditConfig.lat_rew_bias - (min(latencyMs, MAX_REWARDED_LATENCY_MS)
+                                                  * multiArmedBanditConfig.latency_scale)
+
+
+def getLogistic(x):
+    # Clipped so that confident predictions don't overflow
+    return 1/(1 + np.exp(-np.clip(x, -50, 50)))
+
 
 class MultiArmedBanditExecutor:
     """
@@ -19,58 +69,43 @@ class MultiArmedBanditExecutor:
         self.ni = np.zeros(self.n_arms)
         self.si = np.zeros(self.n_arms)
         self.prev_l = None
-        self.latency_scale = multiArmedBanditConfig.latency_scale # 1e-3
         self.i = 0
         self.gamma = multiArmedBanditConfig.gamma # 0.5
-        self.lat_rew_bias = multiArmedBanditConfig.lat_rew_bias # 1.0
         self.failure_penalty = multiArmedBanditConfig.failure_penalty # -0.5
+        self.reward_mode = multiArmedBanditConfig.reward_mode
+        if ((self.reward_mode != MEAN_LATENCY_REWARD) and (self.reward_mode not in REWARD_LATENCY_QUANTILES)):
+            print("Unknown multi-armed bandit reward mode " + str(self.reward_mode))
+            exit(1)
+        # For the tail latency rewards: discounted number of observation periods with failures, and the latencies of
+        # the rounds of the periods without, for each arm. Both are discounted by gamma like ni and si.
+        self.fi = np.zeros(self.n_arms)
+        self.latencyDigests = [TDigest() for l in range(self.n_arms)]
+        # Discounted sum of the latency reward of every period, with or without failures, for each arm
+        self.li = np.zeros(self.n_arms)
         # TODO
 
-    def getNextValueOfM(self, resultsSinceLastRound):
+    def getNextValueOfM(self, periodMetrics):
         """
         Get the next value of m to use.
 
-        :param resultsSinceLastRound:   Results (list of SingleRoundResults obj) since the last time an m value was chosen.
+        :param periodMetrics:   Statistics (PeriodMetrics obj) of the rounds since the last time an m value was chosen
+                                (see RoundMetricsStream.takePeriodMetrics).
 
         :return: Next m value to use.
         """
         # Get the observations from the previous arm pull and which arm it was
-        round_latencies = [round_res.latenciesByNode for round_res in resultsSinceLastRound]
-        avg_latency = np.average([max([v for k, v in (list(lats.items())[0][1]).items()]) for lats in round_latencies])
+        # Latency per committed value, so that batched rounds are rewarded for the values they amortize over
+        avg_latency = periodMetrics.getAverageLatency()
         print('Prev_l', self.prev_l, 'Latencies', avg_latency)
-        # round_consensuses = [round_res.consensusesByNode for round_res in resultsSinceLastRound]
-        # round_failures = np.where([np.average([v for k, v in (list(cons.items())[0][1]).items()])<=0.5 for cons in round_consensuses])
-        round_didFails = [round_res.didFail for round_res in resultsSinceLastRound]
-        round_failures = np.where([(list(f.items())[0][1]) for f in round_didFails])
-        # print(round_failures)
-
-        # for round_res in resultsSinceLastRound:
-            # print('round failures', [([v for k, v in (list(cons.items())[0][1]).items()]) for cons in round_consensuses])
-            # print('failures', round_failures[0].size)
 
         if (self.prev_l is not None):
-            # Update arm pull and reward counters
-            self.ni *= self.gamma # Discounting
-            self.si *= self.gamma # Discounting
-            self.ni[self.prev_l] += 1
-            # TODO: change how reward is calculated to include failure penalties etc.
-            rew = 0.0
-            if round_failures[0].size == 0:
-                rew = (self.lat_rew_bias - min(avg_latency, 2500)*self.latency_scale)
-            else:
-                rew = self.failure_penalty
-            self.si[self.prev_l] += rew
+            self.updateArm(self.prev_l, periodMetrics)
 
         if (self.prev_l is None) or (np.any(self.ni==0)):
-            # Initial rounds, make sure every arm is pulled at least once
-            l = np.max(np.where(self.ni==0)[0])
+            l = self.chooseInitialArm()
         else:
             # Regular decisions after initial rounds
-            mui = self.si/self.ni
-            nt = np.sum(self.ni)
-            ucb = np.maximum(mui*(1-mui), 0.002)*np.log(nt)/self.ni
-            ucb = np.sqrt(ucb)
-            l = np.argmax(mui + ucb)
+            l = self.chooseArm()
         
         self.prev_l = l
 
@@ -79,6 +114,102 @@ class MultiArmedBanditExecutor:
         return self.mOptions[l]
         # return self.mOptions[3]
 
+    def chooseInitialArm(self):
+        # Initial rounds, make sure every arm is pulled at least once
+        return np.max(np.where(self.ni==0)[0])
+
+    def chooseArm(self):
+        """
+        Choose the arm to pull in the next observation period, once every arm has been pulled.
+
+        :return: Index of the arm.
+        """
+        mui = self.getMeanRewards()
+        nt = np.sum(self.ni)
+        ucb = np.maximum(mui*(1-mui), 0.002)*np.log(nt)/self.ni
+        ucb = np.sqrt(ucb)
+        return np.argmax(mui + ucb)
+
+    def getLatencyReward(self, latencyMs):
+        return getRoundReward(latencyMs, False, self.multiArmedBanditConfig)
+
+    def getPeriodReward(self, periodMetrics):
+        """
+        Get the reward of an observation period on its own: the failure penalty if any of its rounds failed, otherwise
+        the reward for its latency (its mean latency, or the quantile of its rounds for the tail latency rewards).
+
+        :param periodMetrics:   Statistics (PeriodMetrics obj) of the period.
+
+        :return: Reward.
+        """
+        if (periodMetrics.numFailures > 0):
+            return self.failure_penalty
+        return self.getPeriodLatencyReward(periodMetrics)
+
+    def getPeriodLatencyReward(self, periodMetrics):
+        if (self.reward_mode == MEAN_LATENCY_REWARD):
+            return self.getLatencyReward(periodMetrics.getAverageLatency())
+        quantile = REWARD_LATENCY_QUANTILES[self.reward_mode]
+        return self.getLatencyReward(periodMetrics.latencyDigest.getQuantile(quantile))
+
+    def updateArm(self, l, periodMetrics):
+        """
+        Discount every arm's observations and add the observation period that the given arm was pulled for.
+
+        :param l:               Index of the arm pulled in the period.
+        :param periodMetrics:   Statistics (PeriodMetrics obj) of the period.
+
+        :return: Reward of the period (see getPeriodReward).
+        """
+        # Update arm pull and reward counters
+        self.ni *= self.gamma # Discounting
+        self.si *= self.gamma # Discounting
+        self.fi *= self.gamma
+        self.li *= self.gamma
+        for latencyDigest in self.latencyDigests:
+            latencyDigest.scaleWeights(self.gamma)
+        self.ni[l] += 1
+        rew = self.getPeriodReward(periodMetrics)
+        if periodMetrics.numFailures == 0:
+            self.latencyDigests[l].merge(periodMetrics.latencyDigest)
+        else:
+            self.fi[l] += 1
+        self.si[l] += rew
+        self.li[l] += self.getPeriodLatencyReward(periodMetrics)
+        return rew
+
+    def getMeanRewards(self):
+        """
+        Get the estimated mean reward of each arm (each must have been pulled).
+
+        For the mean latency reward this is the discounted average of the period rewards. For the tail latency rewards,
+        the reward of periods without failures is based on the latency quantile of all the arm's discounted rounds in
+        such periods, since a single period has too few rounds to estimate a tail from.
+
+        :return: Array of the mean reward of each arm.
+        """
+        if (self.reward_mode == MEAN_LATENCY_REWARD):
+            return self.si/self.ni
+        failureRates = self.fi/self.ni
+        latencyRewards = self.getLatencyRewards()
+        print(f'{self.reward_mode} latency rewards {latencyRewards}')
+        return ((1 - failureRates)*latencyRewards) + (failureRates*self.failure_penalty)
+
+    def getLatencyRewards(self):
+        """
+        Get the estimated latency reward of each arm, leaving failures out (each must have been pulled).
+
+        :return: Array of the discounted average latency reward of the arm's periods, or for the tail latency rewards
+        the reward for the latency quantile of its discounted rounds in periods without failures (see getMeanRewards).
+        """
+        averageLatencyRewards = self.li/self.ni
+        if (self.reward_mode == MEAN_LATENCY_REWARD):
+            return averageLatencyRewards
+        quantile = REWARD_LATENCY_QUANTILES[self.reward_mode]
+        return np.array([self.getLatencyReward(latencyDigest.getQuantile(quantile)) if (
+                latencyDigest.totalWeight > 0) else averageLatencyRewards[l] for l, latencyDigest in
+                         enumerate(self.latencyDigests)])
+
     def getNextValuesOfM(self, resultsSinceLastRound, minMValueMargin):
         """
         Get the next two values of m to vote for in the distributed case.
@@ -89,3 +220,260 @@ class MultiArmedBanditExecutor:
         :return: Tuple of the next two values of m that the node exhibiting the given results should vote for.
         """
         pass
+
+
+class ContextualMultiArmedBanditExecutor(MultiArmedBanditExecutor):
+    """
+    Multi-armed bandit that also chooses m from the fault signals of the last observation period: its failure rate, how
+    many nodes disagreed with the majority, how many messages timed out, how much the nodes' latencies varied and the m
+    value it ran with.
+
+    A logistic model shared by every arm predicts whether a period will have failures from these signals and the m
+    value of the arm, so it learns which m values are unsafe for the signals seen (e.g. that a given level of
+    disagreement means the m value has to be at least 2) from the failures of any arm. Each arm's expected reward is its
+    latency reward, weighted by the predicted chance of no failures, plus the failure penalty weighted by the predicted
+    chance of failures (at least the arm's discounted failure rate), and the arm is chosen with the same upper
+    confidence bounds as MultiArmedBanditExecutor. After a jump in the number of faulty nodes, the signals of the first
+    period with the unsafe m value move the bandit straight to a safe m value, without waiting for the discounted
+    rewards of the unsafe ones to run down.
+    """
+
+    def __init__(self, mOptions, multiArmedBanditConfig):
+        """
+        Initialize the multi-armed bandit executor.
+
+        :param mOptions:                List of the m values to choose from.
+        :param multiArmedBanditConfig:  Configuration for multi-armed bandit.
+        """
+        MultiArmedBanditExecutor.__init__(self, mOptions, multiArmedBanditConfig)
+        self.regularization = multiArmedBanditConfig.context_regularization
+        # Context (see getContext) of every observation period seen, and whether the period had failures. The
+        # relationship between the signals and failures doesn't change when the number of faulty nodes does, so these
+        # aren't discounted.
+        self.contexts = []
+        self.periodFailed = []
+        # Weights of the failure model, one per context feature. The features other than the constant are standardized
+        # with the mean and standard deviation of the contexts seen, so that the regularization treats them alike.
+        self.failureWeights = np.zeros(NUM_CONTEXT_FEATURES)
+        self.featureMeans = np.zeros(NUM_CONTEXT_FEATURES)
+        self.featureScales = np.ones(NUM_CONTEXT_FEATURES)
+        # Signals that the previous arm was chosen with, and the signals to choose the next arm with
+        self.prev_signals = None
+        self.signals = None
+
+    def getSignals(self, periodMetrics):
+        """
+        Get the fault signals of an observation period.
+
+        :param periodMetrics:   Statistics (PeriodMetrics obj) of the period.
+
+        :return: Array of the period's failure rate, fraction of nodes that disagreed with the majority, messages timed
+        out per node (log scaled), spread of the nodes' latencies and m value (see getMFraction).
+        """
+        return np.array([periodMetrics.getFailureRate(), periodMetrics.disagreementStatistics.mean,
+                         np.log1p(periodMetrics.timeoutStatistics.mean), periodMetrics.latencySpreadStatistics.mean,
+                         self.getMFraction(periodMetrics.mValue)])
+
+    def getMFraction(self, mValue):
+        maxM = max(self.mOptions)
+        return (mValue / maxM) if ((maxM > 0) and (mValue is not None)) else 0.0
+
+    def getContext(self, signals, l):
+        """
+        Get the context features for pulling an arm after a period with the given signals.
+
+        :param signals: Fault signals of the period (see getSignals).
+        :param l:       Index of the arm.
+
+        :return: Array of the NUM_CONTEXT_FEATURES features.
+        """
+        return np.concatenate(([1.0], signals, [self.getMFraction(self.mOptions[l])]))
+
+    def getNextValueOfM(self, periodMetrics):
+        """
+        Get the next value of m to use.
+
+        :param periodMetrics:   Statistics (PeriodMetrics obj) of the rounds since the last time an m value was chosen
+                                (see RoundMetricsStream.takePeriodMetrics).
+
+        :return: Next m value to use.
+        """
+        self.signals = self.getSignals(periodMetrics)
+        print('Signals', self.signals)
+        mValue = MultiArmedBanditExecutor.getNextValueOfM(self, periodMetrics)
+        self.prev_signals = self.signals
+        return mValue
+
+    def updateArm(self, l, periodMetrics):
+        rew = MultiArmedBanditExecutor.updateArm(self, l, periodMetrics)
+        if (self.prev_signals is not None):
+            self.contexts.append(self.getContext(self.prev_signals, l))
+            self.periodFailed.append(float(periodMetrics.numFailures > 0))
+            self.fitFailureModel()
+        return rew
+
+    def fitFailureModel(self):
+        """
+        Fit the weights of the failure model to every period seen: L2-regularized logistic regression, solved with a
+        few Newton steps from the previous weights.
+        """
+        contexts = np.array(self.contexts)
+        self.featureMeans[1:] = contexts[:, 1:].mean(axis=0)
+        featureStdDevs = contexts[:, 1:].std(axis=0)
+        self.featureScales[1:] = np.where(featureStdDevs > 0, featureStdDevs, 1.0)
+        contexts = (contexts - self.featureMeans)/self.featureScales
+        periodFailed = np.array(self.periodFailed)
+        penalty = self.regularization*np.eye(NUM_CONTEXT_FEATURES)
+        for i in range(FAILURE_MODEL_NEWTON_STEPS):
+            failureProbabilities = getLogistic(contexts @ self.failureWeights)
+            gradient = (contexts.T @ (failureProbabilities - periodFailed)) + (penalty @ self.failureWeights)
+            hessian = ((contexts.T*(failureProbabilities*(1 - failureProbabilities))) @ contexts) + penalty
+            self.failureWeights = self.failureWeights - np.linalg.solve(hessian, gradient)
+
+    def getFailureProbabilities(self, signals):
+        """
+        Get the predicted chance of failures in the next period with each arm.
+
+        :param signals: Fault signals of the last period (see getSignals).
+
+        :return: Array of the probability for each arm.
+        """
+        contexts = np.array([self.getContext(signals, l) for l in range(self.n_arms)])
+        contexts = (contexts - self.featureMeans)/self.featureScales
+        return getLogistic(contexts @ self.failureWeights)
+
+    def chooseArm(self):
+        """
+        Choose the arm with the highest upper confidence bound on its expected reward given the failure chances
+        predicted from the last period's signals.
+
+        :return: Index of the arm.
+        """
+        # The signals can't show faults that a safe m value hides, so each arm's own recent failure rate is a floor
+        failureProbabilities = np.maximum(self.getFailureProbabilities(self.signals), self.fi/self.ni)
+        mui = ((1 - failureProbabilities)*self.getLatencyRewards()) + (failureProbabilities*self.failure_penalty)
+        print(f'Failure probabilities {failureProbabilities}\n expected rewards {mui}')
+        nt = np.sum(self.ni)
+        ucb = np.maximum(mui*(1-mui), 0.002)*np.log(nt)/self.ni
+        ucb = np.sqrt(ucb)
+        return np.argmax(mui + ucb)
+
+
+class SafeMultiArmedBanditExecutor(MultiArmedBanditExecutor):
+    """
+    Multi-armed bandit that only pulls arms whose failure rate is known to be low: of the arms whose upper confidence
+    bound on the failure rate of their rounds is at most failure_rate_threshold, it pulls the one with the highest
+    latency reward. Until an arm's bound is under the threshold, it starts from the most conservative m value.
+
+    Lower m values are explored one at a time: the arm with the next lower m value than the lowest safe one is pulled
+    once it hasn't been for safe_exploration_interval observation periods, and then kept while its periods have no
+    failures, until its bound is under the threshold. A probe with failures ends the exploration and doubles the wait
+    before the arm is probed again. A higher threshold and a shorter interval trade failures for latency.
+
+    Each arm's failure counts are discounted by failure_bound_gamma only when the arm is pulled, so its bound covers its
+    own most recent rounds: an arm stays safe while a lower one is probed, and becomes unsafe after its first period
+    with failures once the number of faulty nodes goes up.
+    """
+
+    def __init__(self, mOptions, multiArmedBanditConfig):
+        """
+        Initialize the multi-armed bandit executor.
+
+        :param mOptions:                List of the m values to choose from.
+        :param multiArmedBanditConfig:  Configuration for multi-armed bandit.
+        """
+        MultiArmedBanditExecutor.__init__(self, mOptions, multiArmedBanditConfig)
+        self.failure_rate_threshold = multiArmedBanditConfig.failure_rate_threshold
+        self.failure_bound_gamma = multiArmedBanditConfig.failure_bound_gamma
+        self.safe_exploration_interval = multiArmedBanditConfig.safe_exploration_interval
+        self.failureBoundZScore = NormalDist().inv_cdf(SAFE_FAILURE_BOUND_CONFIDENCE)
+        # Number of rounds and of failed rounds of each arm, discounted each time the arm is pulled
+        self.roundsi = np.zeros(self.n_arms)
+        self.failedRoundsi = np.zeros(self.n_arms)
+        # Number of observation periods so far, the period each arm was last pulled in and the number of periods to
+        # wait after that before probing it
+        self.numPeriods = 0
+        self.lastPulledPeriod = np.zeros(self.n_arms)
+        self.probeWaits = np.full(self.n_arms, float(self.safe_exploration_interval))
+        # Arm being probed, or None
+        self.probe_l = None
+
+    def updateArm(self, l, periodMetrics):
+        rew = MultiArmedBanditExecutor.updateArm(self, l, periodMetrics)
+        self.roundsi[l] = (self.roundsi[l]*self.failure_bound_gamma) + periodMetrics.numRounds
+        self.failedRoundsi[l] = (self.failedRoundsi[l]*self.failure_bound_gamma) + periodMetrics.numFailures
+        self.numPeriods += 1
+        self.lastPulledPeriod[l] = self.numPeriods
+        if (l == self.probe_l):
+            if (periodMetrics.numFailures > 0):
+                self.probeWaits[l] *= 2
+                self.probe_l = None
+            else:
+                self.probeWaits[l] = self.safe_exploration_interval
+        return rew
+
+    def getFailureBounds(self):
+        """
+        Get the upper confidence bound on the failure rate of each arm's rounds: the upper end of the Wilson score
+        interval of its discounted failed and total rounds.
+
+        :return: Array of the bound for each arm (1 for arms without rounds).
+        """
+        z = self.failureBoundZScore
+        with np.errstate(divide='ignore', invalid='ignore'):
+            failureRates = self.failedRoundsi/self.roundsi
+            bounds = (failureRates + (z**2/(2*self.roundsi)) + (z*np.sqrt(
+                (failureRates*(1 - failureRates)/self.roundsi) + (z**2/(4*self.roundsi**2)))))/(1 + (z**2/self.roundsi))
+        return np.where(self.roundsi > 0, np.minimum(bounds, 1.0), 1.0)
+
+    def chooseInitialArm(self):
+        # Arms that haven't been pulled aren't safe, so they are only pulled when chooseArm probes them
+        return self.chooseArm()
+
+    def chooseArm(self):
+        """
+        Choose the safe arm with the highest latency reward, the arm with the next lower m value to probe, or if no arm
+        is safe, the arm with the lowest failure bound (the most conservative m value of those).
+
+        :return: Index of the arm.
+        """
+        failureBounds = self.getFailureBounds()
+        print(f'Failure bounds {failureBounds}')
+        safeArms = [l for l in range(self.n_arms) if failureBounds[l] <= self.failure_rate_threshold]
+        if (len(safeArms) == 0):
+            self.probe_l = None
+            return min(range(self.n_arms), key=lambda l: (failureBounds[l], -self.mOptions[l]))
+
+        lowestSafeM = min(self.mOptions[l] for l in safeArms)
+        lowerArms = [l for l in range(self.n_arms) if self.mOptions[l] < lowestSafeM]
+        if (len(lowerArms) > 0):
+            candidate_l = max(lowerArms, key=lambda l: self.mOptions[l])
+            if ((candidate_l == self.probe_l) or (
+                    (self.numPeriods - self.lastPulledPeriod[candidate_l]) >= self.probeWaits[candidate_l])):
+                self.probe_l = candidate_l
+                print(f'Probing arm {candidate_l}')
+                return candidate_l
+
+        self.probe_l = None
+        with np.errstate(divide='ignore', invalid='ignore'):
+            latencyRewards = self.getLatencyRewards()
+        return max(safeArms, key=lambda l: (latencyRewards[l], self.mOptions[l]))
+
+
+def createMultiArmedBanditExecutor(mOptions, multiArmedBanditConfig):
+    """
+    Create the multi-armed bandit executor for the policy in the config.
+
+    :param mOptions:                List of the m values to choose from.
+    :param multiArmedBanditConfig:  Configuration for multi-armed bandit.
+
+    :return: MultiArmedBanditExecutor (or subclass) for the policy.
+    """
+    if (multiArmedBanditConfig.policy == UCB_POLICY):
+        return MultiArmedBanditExecutor(mOptions, multiArmedBanditConfig)
+    if (multiArmedBanditConfig.policy == CONTEXTUAL_POLICY):
+        return ContextualMultiArmedBanditExecutor(mOptions, multiArmedBanditConfig)
+    if (multiArmedBanditConfig.policy == SAFE_POLICY):
+        return SafeMultiArmedBanditExecutor(mOptions, multiArmedBanditConfig)
+    print("Unknown multi-armed bandit policy " + str(multiArmedBanditConfig.policy))
+    exit(1)
@@ -1,24 +1,39 @@
 from network_messages import *
 from network_node import *
+from node_process import *
 import queue
-import random
 import copy
 import time
 import numpy as np
 from project_utils import *
+from shared_memory_transport import *
+from byzantine_faults import *
+from fault_models import *
+from consensus_values import *
+from peer_delivery import *
+from phase_instrumentation import *
+from message_trace import *
+from random_streams import *
+from chain_deadlines import *
+from round_fault_tables import *
 import multiprocessing
 
-from contextlib import contextmanager
-
-@contextmanager
-def acquire_timeout(lock, timeout):
-    result = lock.acquire(timeout=timeout)
-    yield result
-    if result:
-        lock.release()
+# Ways the network manager and nodes can exchange messages
+# Each direction of each node's traffic goes through a multiprocessing.Queue
+QUEUE_MESSAGE_TRANSPORT = "queue"
+# Each direction of each node's traffic goes through a single-producer/single-consumer shared memory ring buffer
+SHARED_MEMORY_MESSAGE_TRANSPORT = "shared_memory"
 
+# Methods of the network manager that are timed when instrumentation is enabled
+MANAGER_INSTRUMENTED_PHASES = ["processMessages", "readMessagesFromNode", "enqueueMessageToDest",
+                               "deliverPendingMessages"]
 
+# Key in the per-round phase stats for the network manager's own stats (the other keys are node numbers)
+MANAGER_PHASE_STATS_KEY = "manager"
 
+# Multiple of the max latency that nodes wait for the commanding general's message. The general's message is never
+# dropped, so this only bounds how long a round can stall.
+GENERAL_MESSAGE_TIMEOUT_FACTOR = 100
 
 
 class NetworkManager:
@@ -27,13 +42,18 @@ class NetworkManager:
     """
 
     def __init__(self, networkLatencyConfig, numNodes, defaultConsensusValue, initialConsensusTolerance,
-                 byzantineFaultDropMessagePercent, useCentralizedMab, sleepBetweenNodeProcessingMs):
+                 byzantineFaultDropMessagePercent, useCentralizedMab, sleepBetweenNodeProcessingMs,
+                 messageTransport=QUEUE_MESSAGE_TRANSPORT, useDirectPeerDelivery=False, enableInstrumentation=False,
+                 messageTraceFile=None, randomStreams=None, faultStrategy=RANDOM_FAULT_STRATEGY,
+                 faultySetPolicy=RESAMPLE_FAULTY_SET_POLICY, valueSpace=None, nodeWorkerPool=None,
+                 precomputeRoundFaults=True):
 
         """
         Initialize the network
         :param networkLatencyConfig:                Configuration for the network latency.
         :param numNodes:                            Number of nodes to have in the network.
-        :param defaultConsensusValue:               Default value to use when no value provided in consensus.
+        :param defaultConsensusValue:               Default value to use when no value provided in consensus. Converted
+                                                    to the value space.
         :param initialConsensusTolerance:           Initial m value(s) to use in reaching consensus. Tuple of 2 entries
                                                     if distributed, single value if centralized.
         :param byzantineFaultDropMessagePercent:    When a node qis exhibiting byzantine faults, percent of the time
@@ -42,7 +62,38 @@ class NetworkManager:
         :param useCentralizedMab:                   True if a centralized multi-armed bandit is used, false if each
                                                     node should use its own data to vote and then use consensus to
                                                     agree on the next pair of m-values that they should all use.
+        :param sleepBetweenNodeProcessingMs:        Milliseconds for a node to sleep between checks of its queue.
+        :param messageTransport:                    How messages are exchanged with the nodes
+                                                    (QUEUE_MESSAGE_TRANSPORT or SHARED_MEMORY_MESSAGE_TRANSPORT).
+        :param useDirectPeerDelivery:               True if nodes should send consensus messages straight to each
+                                                    other (with latency and Byzantine faults injected on the sending
+                                                    side), so the network manager only handles control traffic. False
+                                                    if the network manager should relay every consensus message.
+        :param enableInstrumentation:               True if the hot-path methods of the network manager and nodes
+                                                    should be timed. The stats for each round are then available in
+                                                    lastRoundPhaseStats.
+        :param messageTraceFile:                    File to write a binary trace of the rounds and relayed consensus
+                                                    messages to (see message_trace), or None to not record a trace.
+                                                    Requires the network manager to relay the consensus messages.
+        :param randomStreams:                       RandomStreams to draw the faulty nodes, commanding generals,
+                                                    message latencies and corruption from. If None, unseeded streams
+                                                    are used.
+        :param faultStrategy:                       How faulty nodes corrupt their messages (one of FAULT_STRATEGIES in
+                                                    fault_models).
+        :param faultySetPolicy:                     How the faulty nodes are chosen for each round (one of
+                                                    FAULTY_SET_POLICIES in fault_models).
+        :param valueSpace:                          ConsensusValueSpace of the values the nodes agree on. If None, the
+                                                    nodes agree on booleans.
+        :param nodeWorkerPool:                      NodeWorkerPool (see node_worker_pool) to run the nodes on, or None
+                                                    to start a process for each node.
+        :param precomputeRoundFaults:               True if the latency and faults of every message of a round should be
+                                                    drawn when the round starts (see round_fault_tables), false if they
+                                                    should be drawn as each message is sent.
         """
+        if (valueSpace is None):
+            valueSpace = ConsensusValueSpace()
+        self.valueSpace = valueSpace
+        defaultConsensusValue = valueSpace.convertValue(defaultConsensusValue)
         self.networkLatencyConfig = networkLatencyConfig
         self.numFaultyNodes = 0
         self.numNodes = numNodes
@@ -50,46 +101,124 @@ class NetworkManager:
         self.consensusTolerance = initialConsensusTolerance
         self.byzantineFaultDropMessagePercent = byzantineFaultDropMessagePercent
         self.useCentralizedMab = useCentralizedMab
+        self.messageTransport = messageTransport
+        self.useDirectPeerDelivery = useDirectPeerDelivery
+
+        # Per-phase stats for the last round, keyed by node number (and MANAGER_PHASE_STATS_KEY for the network
+        # manager). None when instrumentation is disabled.
+        self.lastRoundPhaseStats = None
+        # Number of messages that each node timed out waiting for in the last round, keyed by node number
+        self.lastRoundTimeoutCounts = {}
+        self.instrumentation = None
+        if (enableInstrumentation):
+            self.instrumentation = PhaseInstrumentation()
+            self.instrumentation.instrumentMethods(self, MANAGER_INSTRUMENTED_PHASES)
+
+        self.messageTraceRecorder = None
+        if (messageTraceFile is not None):
+            if (useDirectPeerDelivery):
+                print("Message traces can't be recorded when consensus messages are delivered directly between nodes")
+                exit(1)
+            self.messageTraceRecorder = MessageTraceRecorder(messageTraceFile, numNodes, networkLatencyConfig,
+                                                             defaultConsensusValue, valueSpace)
 
         self.currentFaultyNodes = []
 
+        if (randomStreams is None):
+            randomStreams = RandomStreams()
+        self.faultSelectionRandom = randomStreams.getGenerator(FAULT_SELECTION_STREAM)
+        self.messageFaultRandom = randomStreams.getGenerator(MESSAGE_FAULT_STREAM)
+        self.faultModel = ByzantineFaultModel(numNodes, faultStrategy, faultySetPolicy,
+                                              networkLatencyConfig.maxLatencyMs, self.faultSelectionRandom,
+                                              valueSpace)
+        # RoundFaultPlan with the faults injected in the current round
+        self.currentFaultPlan = None
+        self.precomputeRoundFaults = precomputeRoundFaults
+        # RoundFaultTables with the latency and faults of every message of the current round (if precomputed)
+        self.roundFaultTables = None
+
+        # Identifier of the current consensus round. Every round-scoped message carries this so that messages left
+        # over from earlier rounds can be dropped on receipt instead of draining all queues between rounds.
+        self.currentRoundId = 0
+        self.nodeWorkerPool = nodeWorkerPool
+
+        # Both transports are safe to use from both ends without extra locks. Each queue has a single producer and a
+        # single consumer.
         self.fromNodeQueues = []
-        self.fromNodeQueueLocks = []
         self.toNodeQueues = []
-        self.toNodeQueueLocks = []
         self.nodes = []
         self.pendingMessages = [queue.PriorityQueue() for i in range(self.numNodes)]
         self.resultsByNode = {}
         self.processes = []
+        # Inbox for each node when consensus messages are delivered directly between nodes. Every node writes to
+        # these, so they are always multi-producer queues regardless of the transport used for control traffic.
+        self.peerInboxes = []
+        if (nodeWorkerPool is not None):
+            # Continue the pool's round identifiers, so that anything left over from its last network manager is stale
+            self.currentRoundId = nodeWorkerPool.lastRoundId
+            self.toNodeQueues, self.fromNodeQueues, poolPeerInboxes = nodeWorkerPool.acquireWorkers(
+                self.numNodes, self.messageTransport)
+            if (self.useDirectPeerDelivery):
+                self.peerInboxes = poolPeerInboxes
+        elif (self.useDirectPeerDelivery):
+            self.peerInboxes = [multiprocessing.Queue() for i in range(self.numNodes)]
         for i in range(self.numNodes):
-            nextFromNodeQueue = multiprocessing.Queue()
-            nextFromNodeQueueLock = multiprocessing.Lock()
-            self.fromNodeQueues.append(nextFromNodeQueue)
-            self.fromNodeQueueLocks.append(nextFromNodeQueueLock)
-            nextToNodeQueue = multiprocessing.Queue()
-            nextToNodeQueueLock = multiprocessing.Lock()
-            self.toNodeQueueLocks.append(nextToNodeQueueLock)
-            self.toNodeQueues.append(nextToNodeQueue)
-
-            threadingFunction = None
-            # TODO get the timeout time from a config (and also figure out how ot make it smaller without inducing
-            #  timeouts for non-dropped messages
+            if (nodeWorkerPool is not None):
+                nextFromNodeQueue = self.fromNodeQueues[i]
+                nextToNodeQueue = self.toNodeQueues[i]
+            else:
+                nextFromNodeQueue = self.createMessageChannel()
+                self.fromNodeQueues.append(nextFromNodeQueue)
+                nextToNodeQueue = self.createMessageChannel()
+                self.toNodeQueues.append(nextToNodeQueue)
+
+            generalMessageTimeoutMs = self.networkLatencyConfig.maxLatencyMs * GENERAL_MESSAGE_TIMEOUT_FACTOR
             if (useCentralizedMab):
-                node = NetworkNode(i, nextFromNodeQueue, nextFromNodeQueueLock, nextToNodeQueue, nextToNodeQueueLock,
-                                   defaultConsensusValue, sleepBetweenNodeProcessingMs, [self.consensusTolerance],
-                                   self.networkLatencyConfig.maxLatencyMs * 50000, self.numNodes)
-                threadingFunction = NetworkNode.run
+                node = NetworkNode(i, nextFromNodeQueue, nextToNodeQueue, defaultConsensusValue, sleepBetweenNodeProcessingMs, [self.consensusTolerance],
+                                   generalMessageTimeoutMs, self.numNodes, enableInstrumentation=enableInstrumentation)
             else:
-                node = DistributedMabNetworkNode(i, nextFromNodeQueue, nextFromNodeQueueLock, nextToNodeQueue,
-                                                 nextToNodeQueueLock, defaultConsensusValue,
+                node = DistributedMabNetworkNode(i, nextFromNodeQueue, nextToNodeQueue, defaultConsensusValue,
                                                  sleepBetweenNodeProcessingMs, self.consensusTolerance,
-                                                 self.networkLatencyConfig.maxLatencyMs * 50000, self.numNodes)
-                threadingFunction = DistributedMabNetworkNode.run
+                                                 generalMessageTimeoutMs, self.numNodes,
+                                                 enableInstrumentation=enableInstrumentation)
+            if (self.canMessagesBeLost()):
+                # Relayed messages time out based on how deep they are in the recursion, so dropped messages only delay
+                # a round by about the latency of the protocol. Otherwise a late message would only ever be mistaken
+                # for a lost one, so the nodes wait for every message.
+                node.chainDeadlines = AdaptiveChainDeadlines(self.networkLatencyConfig, self.numNodes)
+            if (self.useDirectPeerDelivery):
+                node.peerDeliveryShim = PeerDeliveryShim(i, self.peerInboxes, self.networkLatencyConfig,
+                                                         randomStreams.getGenerator(NODE_STREAM, i),
+                                                         byzantineFaultDropMessagePercent)
             self.nodes.append(node)
 
-            nodeProcess = multiprocessing.Process(target=threadingFunction, args=(node,))
-            self.processes.append(nodeProcess)
-            nodeProcess.start()
+            if (nodeWorkerPool is not None):
+                nodeWorkerPool.startNode(node)
+                continue
+            self.processes.append(startNodeProcess(runNode, (node,)))
+
+    def canMessagesBeLost(self):
+        """
+        Check if consensus messages can fail to arrive: faulty nodes drop some of their messages or crash.
+
+        :return: True if nodes should time out on relayed messages with AdaptiveChainDeadlines.
+        """
+        return ((self.byzantineFaultDropMessagePercent > 0) or
+                (self.faultModel.strategy == CRASH_STOP_FAULT_STRATEGY))
+
+    def createMessageChannel(self):
+        """
+        Create a channel for messages in one direction between the network manager and a node.
+
+        :return: Object with the put/get interface of a multiprocessing.Queue for the configured transport.
+        """
+        if (self.messageTransport == SHARED_MEMORY_MESSAGE_TRANSPORT):
+            return SharedMemoryRingBuffer()
+        elif (self.messageTransport == QUEUE_MESSAGE_TRANSPORT):
+            return multiprocessing.Queue()
+        else:
+            print("Unknown message transport " + str(self.messageTransport))
+            exit(1)
 
     def changeNumFaultyNodes(self, newNumFaultyNodes):
         """
@@ -108,10 +237,20 @@ class NetworkManager:
         Set the nodes that should behave incorrectly in the next consensus round. Number of these should equal
         self.numFaultyNodes
         """
-        self.currentFaultyNodes = random.sample(range(self.numNodes), self.numFaultyNodes)
+        self.currentFaultyNodes = self.faultModel.selectFaultyNodes(self.numFaultyNodes)
 
     def getConsensusCommandingGeneralNum(self):
-        return random.choice(range(self.numNodes))
+        return int(self.faultSelectionRandom.integers(self.numNodes))
+
+    def getCurrentMValues(self):
+        """
+        Get the m value(s) that the nodes are using.
+
+        :return: List of the m values.
+        """
+        if (isinstance(self.consensusTolerance, (list, tuple))):
+            return list(self.consensusTolerance)
+        return [self.consensusTolerance]
 
     def startConsensusAndGetNodeLatenciesAndDecisions(self, trueConsensusValue):
         """
@@ -128,41 +267,51 @@ class NetworkManager:
         needed so that incorrect consensus reached by faulty nodes is not treated as a failure.
         """
         self.trueConsensusValue = trueConsensusValue
+        self.currentRoundId += 1
 
         commandingGeneralNode = self.getConsensusCommandingGeneralNum()
+        mValues = self.getCurrentMValues()
+        if (self.messageTraceRecorder is not None):
+            self.messageTraceRecorder.recordRoundStart(self.currentRoundId, commandingGeneralNode, trueConsensusValue,
+                                                       mValues, self.currentFaultyNodes)
+        self.currentFaultPlan = self.faultModel.planRound(self.currentFaultyNodes, trueConsensusValue,
+                                                          max(mValues) + 1)
+        newFaultTables = None
+        if (self.precomputeRoundFaults):
+            newFaultTables = self.fillRoundFaultTables(max(mValues) + 1)
+        # Nodes that inject their own faults keep the tables they were sent until they are replaced
+        faultTablesForNodes = newFaultTables if self.useDirectPeerDelivery else None
 
         for i in range(self.numNodes):
-
             if (i != commandingGeneralNode):
-                outgoingQueue = self.toNodeQueues[i]
-                outgoingQueueLock = self.toNodeQueueLocks[i]
-                with outgoingQueueLock:
-                    outgoingQueue.put(ConsensusStartMessage(commandingGeneralNode))
+                self.toNodeQueues[i].put(ConsensusStartMessage(commandingGeneralNode, self.currentRoundId,
+                                                               i in self.currentFaultyNodes,
+                                                               self.getFaultPlanForNode(i), faultTablesForNodes))
 
         for i in range(self.numNodes):
             if (i != commandingGeneralNode):
-                outgoingQueue = self.toNodeQueues[i]
-                outgoingQueueLock = self.toNodeQueueLocks[i]
-
-                queueEmpty = False
-                while (not queueEmpty):
-                    with outgoingQueueLock:
-                        queueEmpty = outgoingQueue.empty()
-                        time.sleep(10 / 1000)  # TODO get this value from a config
-        commanderOutgoingQueue = self.toNodeQueues[commandingGeneralNode]
-        commanderOutgoingQueueLock = self.toNodeQueueLocks[commandingGeneralNode]
-        with commanderOutgoingQueueLock:
-            commanderOutgoingQueue.put(TriggerConsensusCommandingGeneral(trueConsensusValue))
+                self.waitForQueueToDrain(self.toNodeQueues[i])
+        self.toNodeQueues[commandingGeneralNode].put(
+            TriggerConsensusCommandingGeneral(trueConsensusValue, self.currentRoundId,
+                                              commandingGeneralNode in self.currentFaultyNodes,
+                                              self.getFaultPlanForNode(commandingGeneralNode), faultTablesForNodes))
 
         self.waitForNodeResponses()
 
+        if (self.instrumentation is not None):
+            self.lastRoundPhaseStats = {nodeNum: results.phaseStats for nodeNum, results in
+                                        self.resultsByNode.items()}
+            self.lastRoundPhaseStats[MANAGER_PHASE_STATS_KEY] = self.instrumentation.takeStats()
+
         # Extract the latencies and decisions from the node result messages
         if (self.useCentralizedMab):
             latencyInnerDict = {}
             consensusValInnerDict = {}
             mValues = []
+            self.lastRoundTimeoutCounts = {}
             for nodeNum, results in self.resultsByNode.items():
                 mValues.append(results.mValue)
+                self.lastRoundTimeoutCounts[nodeNum] = results.timeoutCount
                 latencyInnerDict[nodeNum] = results.latency
                 consensusValInnerDict[nodeNum] = results.consensusOutcome
             mValues = list(set(mValues))
@@ -183,29 +332,54 @@ class NetworkManager:
                     latencies[mVal][nodeNum] = mValueResult.latency
                     consensuses[mVal][nodeNum] = mValueResult.consensusOutcome
 
+        # Messages still in flight for this round are not drained here; they carry this round's id and are dropped
+        # by the nodes and by processMessages once the next round starts
         self.resultsByNode.clear()
-        self.clearQueues()
         return (latencies, consensuses, self.currentFaultyNodes)
 
-    def clearQueues(self):
+    def fillRoundFaultTables(self, maxChainLength):
         """
-        Clear the queues to and from the nodes.
+        Draw the latency and faults of every message of the current round into the round fault tables, replacing the
+        tables with larger ones if they don't have room for the round's longest commanding general chain.
+
+        :param maxChainLength:  Longest commanding general chain of the round (largest m value + 1).
+
+        :return: New RoundFaultTables if the tables were replaced (and have to be sent to nodes that use them), None
+        otherwise.
         """
-        for i in range(self.numNodes):
-            incomingQueueLock = self.fromNodeQueueLocks[i]
-            incomingQueue = self.fromNodeQueues[i]
-            with incomingQueueLock:
-                # print("Acquired lock for " + str(i))
-                while (not incomingQueue.empty()):
-                    incomingQueue.get()
-                # print("Released lock for " + str(i))
+        newFaultTables = None
+        if ((self.roundFaultTables is None) or (self.roundFaultTables.maxChainLength < maxChainLength)):
+            if (self.roundFaultTables is not None):
+                self.roundFaultTables.close()
+            self.roundFaultTables = RoundFaultTables(self.numNodes, maxChainLength)
+            newFaultTables = self.roundFaultTables
+        self.roundFaultTables.fillRound(self.currentRoundId, self.currentFaultPlan, maxChainLength,
+                                        self.networkLatencyConfig, self.byzantineFaultDropMessagePercent,
+                                        self.messageFaultRandom)
+        return newFaultTables
+
+    def getFaultPlanForNode(self, nodeNum):
+        """
+        Get the fault plan that a node needs to inject its own faults.
+
+        :param nodeNum: Node to get the plan for.
 
-            outgoingQueue = self.toNodeQueues[i]
-            outgoingQueueLock = self.toNodeQueueLocks[i]
+        :return: RoundFaultPlan for the current round if the node is faulty and injects faults on the sending side
+        (direct peer delivery), None otherwise.
+        """
+        if (self.useDirectPeerDelivery and (nodeNum in self.currentFaultyNodes)):
+            return self.currentFaultPlan
+        return None
 
-            with outgoingQueueLock:
-                while (not outgoingQueue.empty()):
-                    outgoingQueue.get()
+    def isMessageFromCurrentRound(self, msg):
+        """
+        Check if a round-scoped message belongs to the consensus round that is currently executing.
+
+        :param msg: Message with a roundId field.
+
+        :return: True if the message is for the current round, false if it is stale and should be dropped.
+        """
+        return msg.roundId == self.currentRoundId
 
     def checkAllNodesDeliveredResults(self):
         """
@@ -227,75 +401,75 @@ class NetworkManager:
         """
         Run one iteration of processing messages. Check for messages incoming from each node and then check if any
         messages should be delivered to the nodes (and if so, deliver them).
-        :return:
         """
         for i in range(self.numNodes):
-            # print("Num nodes " + str(self.numNodes))
-            # print("Checking status for " + str(i) + ", m=" + str(self.consensusTolerance))
-            # print("Is process alive? " + str(self.processes[i].is_alive()))
-            incomingQueueLock = self.fromNodeQueueLocks[i]
-            incomingQueue = self.fromNodeQueues[i]
-
-            # Check for incoming messages
-            # print("Checking incoming messages from " + str(i))
-            msgCount = 0
-
-            with acquire_timeout(incomingQueueLock, 0.5) as acquired:
-                if acquired:
-                    # print("Acquired lock for " + str(i))
-                    while not incomingQueue.empty():
-                        incomingMsg = incomingQueue.get()
-                        msgCount += 1
-                        if (isinstance(incomingMsg, ConsensusMessage)):
-                            self.enqueueMessageToDest(incomingMsg, i, incomingMsg.destNodeId)
-
-                            # if ((msgCount % 1000) == 0):
-                            #     print(str(i) + " still processing; cmd gen len " + str(
-                            #         len(incomingMsg.commandingGeneralChain)) + "; msgs so far " + str(msgCount))
-                        elif (isinstance(incomingMsg, ConsensusResultMessage) or
-                              isinstance(incomingMsg, DistributedConsensusResultMessage)):
-                            self.resultsByNode[i] = incomingMsg
-                    # print("Released lock for " + str(i))
-                else:
-                    print('WARNING: lock not available for ' + str(i))
-
-
-            # Process messages that are pending for the current node
-            # print("Processed " + str(msgCount) + "; Checking pending messages for " + str(i))
-
-            sentMsgsCount = 0
-            if (not self.pendingMessages[i].empty()):
-                outgoingQueueLock = self.toNodeQueueLocks[i]
-                outgoingQueue = self.toNodeQueues[i]
-
-                with acquire_timeout(outgoingQueueLock, 0.5) as acquired:
-                    if acquired:
-                        # print("Outgoing lock for " + str(i) + " acquired")
-                        while (not self.pendingMessages[i].empty()):
-                            # print(str(i) + "Pending messages not empty")
-                            # Get the first message to be delivered and see if it should be delivered yet (see if delivery tine is less than current time)
-                            # TODO verify that the priority queue returns the smallest element first
-                            nextMsg = self.pendingMessages[i].get()
-                            if (nextMsg[0] < getCurrentTimeMillis()):
-                                # print("Putting in queue (full? " + str(outgoingQueue.full()) + "): " + str(sentMsgsCount))
-                                try:
-                                    outgoingQueue.put(nextMsg[1], timeout=0.5)
-                                    sentMsgsCount += 1
-                                except (queue.Full):
-                                    print("WARNING: Queue to node " + str(i) + " is full, exiting after processing " + str(sentMsgsCount))
-                                    self.pendingMessages[i].put(nextMsg)
-                                    break
-                                # if ((sentMsgsCount % 1000) == 0):
-                                #     print(str(i) + " sending still processing; sent msgs so far " + str(sentMsgsCount))
-                            else:
-                                # If the message isn't ready to be delivered, put it back in the queue and break
-                                self.pendingMessages[i].put(nextMsg)
-                                # print("Message not ready to be delivered; breaking")
-                                break
-                        # print("Outgoing lock for " + str(i) + " released ")
-                    else:
-                        print('WARNING: outgoing lock not available to deliver to ' + str(i))
-            # print("Sent " + str(sentMsgsCount) + " to node " + str(i))
+            # Check for incoming messages. The queue does its own synchronization, so a node can keep producing
+            # while we drain.
+            self.readMessagesFromNode(i)
+
+            # Deliver messages that are pending for the current node and whose delivery time has passed
+            self.deliverPendingMessages(i)
+
+    def readMessagesFromNode(self, nodeNum):
+        """
+        Handle every message that is currently waiting in the queue from the given node.
+
+        :param nodeNum: Node to read messages from.
+        """
+        incomingQueue = self.fromNodeQueues[nodeNum]
+        while True:
+            try:
+                incomingMsg = incomingQueue.get_nowait()
+            except queue.Empty:
+                break
+            self.handleMessageFromNode(nodeNum, incomingMsg)
+
+    def handleMessageFromNode(self, nodeNum, incomingMsg):
+        """
+        Handle a message received from a node.
+
+        :param nodeNum:     Node that sent the message.
+        :param incomingMsg: Message received (ConsensusMessage to relay or consensus results).
+        """
+        if (not self.isMessageFromCurrentRound(incomingMsg)):
+            # Left over from an earlier round
+            return
+        if (isinstance(incomingMsg, ConsensusMessage)):
+            self.enqueueMessageToDest(incomingMsg, nodeNum, incomingMsg.destNodeId)
+        elif (isinstance(incomingMsg, ConsensusResultMessage) or
+              isinstance(incomingMsg, DistributedConsensusResultMessage)):
+            self.resultsByNode[nodeNum] = incomingMsg
+
+    def deliverPendingMessages(self, nodeNum):
+        """
+        Move messages from the pending queue for the given node to its incoming queue once their delivery time has
+        passed.
+
+        :param nodeNum: Node to deliver messages to.
+        """
+        pendingForNode = self.pendingMessages[nodeNum]
+        outgoingQueue = self.toNodeQueues[nodeNum]
+        sentMsgsCount = 0
+        while (not pendingForNode.empty()):
+            # Get the first message to be delivered and see if it should be delivered yet (see if delivery time is
+            # less than current time)
+            nextMsg = pendingForNode.get()
+            if (not self.isMessageFromCurrentRound(nextMsg[1])):
+                # Scheduled during an earlier round; no longer relevant to the node
+                continue
+            if (nextMsg[0] < getCurrentTimeMillis()):
+                try:
+                    outgoingQueue.put(nextMsg[1], timeout=0.5)
+                    sentMsgsCount += 1
+                except (queue.Full):
+                    print("WARNING: Queue to node " + str(nodeNum) + " is full, exiting after processing " + str(
+                        sentMsgsCount))
+                    pendingForNode.put(nextMsg)
+                    break
+            else:
+                # If the message isn't ready to be delivered, put it back in the queue and break
+                pendingForNode.put(nextMsg)
+                break
 
     def getMessageDelay(self):
         """
@@ -304,12 +478,7 @@ class NetworkManager:
 
         :return: Delay that should be imposed before delivering a message.
         """
-        avgLatency = self.networkLatencyConfig.averageLatencyMs
-        stdDevLatency = self.networkLatencyConfig.latencyStdDevMs
-        maxLatency = self.networkLatencyConfig.maxLatencyMs
-        randomLatency = np.random.normal(avgLatency, stdDevLatency)
-
-        return max(0, min(maxLatency, randomLatency))
+        return sampleMessageDelay(self.networkLatencyConfig, self.messageFaultRandom)
 
     def enqueueMessageToDest(self, message, sender, dest):
         """
@@ -319,41 +488,63 @@ class NetworkManager:
         :param sender:  Id of the node that sent the message.
         :param dest:    Id of the node that should receive the message.
         """
-        # passMsg = copy.deepcopy(message)
+        content, msgDelay = self.getDeliveredContentAndDelay(message, sender, dest)
+        passMsg = ConsensusMessage(message.sourceNodeId, message.destNodeId, content, message.commandingGeneralChain,
+                                   message.roundId, message.delayedByTimeout)
+
+        if (self.messageTraceRecorder is not None):
+            sendTime = getCurrentTimeMillis()
+            # Dropped messages are recorded as never being delivered
+            deliveryTime = float("inf") if (msgDelay is None) else (sendTime + msgDelay)
+            self.messageTraceRecorder.recordMessage(passMsg, dest, content != message.content, sendTime,
+                                                    deliveryTime)
+
+        if (msgDelay is None):
+            return
+        self.scheduleDelivery(dest, msgDelay, passMsg)
+
+    def getDeliveredContentAndDelay(self, message, sender, dest):
+        """
+        Get the content that should be delivered for a message and how long its delivery should take, adding byzantine
+        faults and latency as appropriate.
+
+        :param message: Message to deliver (uncorrupted).
+        :param sender:  Id of the node that sent the message.
+        :param dest:    Id of the node that should receive the message.
+
+        :return: Tuple of the content to deliver and the delay in milliseconds before delivering it. The delay is None
+        if the message should be dropped.
+        """
         content = message.content
-        if (sender in self.currentFaultyNodes):
-            # TODO currently having issues with timeouts being triggered even when messages are sent. For now,
-            #  disabling dropped messages and just making timeout time huge so that if a message is successfully sent,
-            #  it is always received by the target node. This requires turning off dropped messages though, since it
-            #  will take forever for them to be timed-out on
-            # if (random.uniform(0, 1) < self.byzantineFaultDropMessagePercent):
-            #     # Simulate a byzantine fault in which the message is dropped
-            #     print("Dropping message from " + str(sender) + " to " + str(dest))
-            #     return
-            # else:
-            # passMsg.content = self.corruptMessageContents(passMsg.content)
-            content = self.corruptMessageContents(content)
-
-        passMsg = ConsensusMessage(message.sourceNodeId, message.destNodeId, content, message.commandingGeneralChain)
-
-        currentTime = getCurrentTimeMillis()
+        if (self.roundFaultTables is not None):
+            messageFaults = self.roundFaultTables.takeMessageFaults(sender, dest, len(message.commandingGeneralChain))
+            if (messageFaults is not None):
+                msgDelay, isLie = messageFaults
+                if (isLie):
+                    content = self.currentFaultPlan.getLieContent(content, self.messageFaultRandom)
+                return content, msgDelay
+
+        # Not in the round fault tables, so draw the message's latency and faults now
         msgDelay = self.getMessageDelay()
-        deliveryTime = currentTime + msgDelay
-        self.pendingMessages[dest].put(item=(deliveryTime, passMsg))
+        if (self.currentFaultPlan.isFaulty[sender]):
+            if (shouldDropMessage(message, self.byzantineFaultDropMessagePercent, self.messageFaultRandom)):
+                # Simulate a byzantine fault in which the message is dropped. The receiver times out waiting for it.
+                return content, None
+            content, msgDelay = self.currentFaultPlan.applyFaults(message, sender, dest, msgDelay,
+                                                                  self.messageFaultRandom)
 
-    def corruptMessageContents(self, contents):
-        """
-        Corrupt the contents of a message (to simulate Byzantine faults).
+        return content, msgDelay
 
-        :param contents: Contents of the message, uncorrputed.
+    def scheduleDelivery(self, dest, msgDelay, passMsg):
+        """
+        Schedule a message to be delivered to a node after the given delay.
 
-        :return: Corrupted message contents.
+        :param dest:        Id of the node that should receive the message.
+        :param msgDelay:    Milliseconds to wait before delivering the message.
+        :param passMsg:     Message to deliver (with any corruption already applied).
         """
-        if (isinstance(contents, bool)):
-            return bool(random.getrandbits(1))
-        else:
-            print("Corrupt message not implemented for type " + str(type(contents)))
-            exit(1)
+        deliveryTime = getCurrentTimeMillis() + msgDelay
+        self.pendingMessages[dest].put(item=(deliveryTime, passMsg))
 
     def setConsensusTolerance(self, newConsensusTolerance):
         """
@@ -365,17 +556,9 @@ class NetworkManager:
         self.consensusTolerance = newConsensusTolerance
         setMValuesMessage = SetMValuesMessage([self.consensusTolerance])
         for i in range(self.numNodes):
-            with self.toNodeQueueLocks[i]:
-                self.toNodeQueues[i].put(setMValuesMessage)
-        anyQueuesNotProcessed = True
-        while (anyQueuesNotProcessed):
-            anyQueuesNotProcessed = False
-            for i in range(self.numNodes):
-                with self.toNodeQueueLocks[i]:
-                    toNodeQueue = self.toNodeQueues[i]
-                    if (not toNodeQueue.empty()):
-                        anyQueuesNotProcessed = True
-                        break
+            self.toNodeQueues[i].put(setMValuesMessage)
+        for i in range(self.numNodes):
+            self.waitForQueueToDrain(self.toNodeQueues[i])
 
     def haveDistributedNodesChooseNextMValues(self):
         """
@@ -407,17 +590,56 @@ class NetworkManager:
         """
         shutdownMessage = ShutdownNodeMessage()
         for i in range(self.numNodes):
-            with self.toNodeQueueLocks[i]:
-                self.toNodeQueues[i].put(shutdownMessage)
-        anyQueuesNotProcessed = True
-        while (anyQueuesNotProcessed):
-            anyQueuesNotProcessed = False
-            for i in range(self.numNodes):
-                with self.toNodeQueueLocks[i]:
-                    toNodeQueue = self.toNodeQueues[i]
-                    if (not toNodeQueue.empty()):
-                        anyQueuesNotProcessed = True
-                        break
-
+            self.toNodeQueues[i].put(shutdownMessage)
+
+        if (self.nodeWorkerPool is not None):
+            # The workers keep running (and keep their channels) for the next network manager
+            self.nodeWorkerPool.waitForNodesToStop(self.numNodes)
+            self.nodeWorkerPool.lastRoundId = self.currentRoundId
+            if (self.messageTraceRecorder is not None):
+                self.messageTraceRecorder.close()
+            self.closeRoundFaultTables()
+            return
+
+        # A node can't exit until everything it put on its outgoing queue has been flushed to the pipe, so keep
+        # discarding whatever is left over while waiting for the processes to finish
         for nodeThread in self.processes:
-            nodeThread.join()
+            while (nodeThread.is_alive()):
+                self.discardIncomingMessages()
+                nodeThread.join(timeout=0.05)
+
+        if (self.messageTraceRecorder is not None):
+            self.messageTraceRecorder.close()
+
+        if (self.messageTransport == SHARED_MEMORY_MESSAGE_TRANSPORT):
+            for ringBuffer in (self.fromNodeQueues + self.toNodeQueues):
+                ringBuffer.close()
+        self.closeRoundFaultTables()
+
+    def closeRoundFaultTables(self):
+        """
+        Remove the round fault tables once the nodes have shut down.
+        """
+        if (self.roundFaultTables is not None):
+            self.roundFaultTables.close()
+            self.roundFaultTables = None
+
+    def discardIncomingMessages(self):
+        """
+        Drop any messages that the nodes have sent to the network manager.
+        """
+        for incomingQueue in self.fromNodeQueues:
+            while True:
+                try:
+                    incomingQueue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def waitForQueueToDrain(self, toNodeQueue):
+        """
+        Wait until the node reading from the given queue has consumed everything in it.
+
+        :param toNodeQueue: Queue from the network manager to a node.
+        """
+        while (not toNodeQueue.empty()):
+            time.sleep(10 / 1000)  # TODO get this value from a config
@@ -4,13 +4,24 @@ class ConsensusStartMessage:
     protocol.
     """
 
-    def __init__(self, mainGeneralID):
+    def __init__(self, mainGeneralID, roundId, isFaulty=False, faultPlan=None, faultTables=None):
         """
         Create the message.
 
         :param mainGeneralID:   Id of the node that will act as the commanding general for this consensus round
+        :param roundId:         Identifier of the consensus round that is starting.
+        :param isFaulty:        True if the receiving node should exhibit Byzantine faults this round. Only used when
+                                nodes inject faults on the sending side (direct peer delivery).
+        :param faultPlan:       RoundFaultPlan (see fault_models) with the faults to inject if the receiving node is
+                                faulty. Only used with direct peer delivery.
+        :param faultTables:     RoundFaultTables (see round_fault_tables) to use from this round on, or None to keep
+                                using the last ones sent. Only used with direct peer delivery.
         """
         self.mainGeneralID = mainGeneralID
+        self.roundId = roundId
+        self.isFaulty = isFaulty
+        self.faultPlan = faultPlan
+        self.faultTables = faultTables
 
 
 class TriggerConsensusCommandingGeneral:
@@ -19,13 +30,24 @@ class TriggerConsensusCommandingGeneral:
     by sending the given command.
     """
 
-    def __init__(self, decision):
+    def __init__(self, decision, roundId, isFaulty=False, faultPlan=None, faultTables=None):
         """
         Create the message.
 
         :param decision:    Decision that the commanding general should send.
+        :param roundId:     Identifier of the consensus round that is starting.
+        :param isFaulty:    True if the commanding general should exhibit Byzantine faults this round. Only used when
+                            nodes inject faults on the sending side (direct peer delivery).
+        :param faultPlan:   RoundFaultPlan (see fault_models) with the faults to inject if the commanding general is
+                            faulty. Only used with direct peer delivery.
+        :param faultTables: RoundFaultTables (see round_fault_tables) to use from this round on, or None to keep using
+                            the last ones sent. Only used with direct peer delivery.
         """
         self.decision = decision
+        self.roundId = roundId
+        self.isFaulty = isFaulty
+        self.faultPlan = faultPlan
+        self.faultTables = faultTables
 
 
 class ConsensusMessage:
@@ -33,7 +55,7 @@ class ConsensusMessage:
     Message passed from node to node in the consensus protocol.
     """
 
-    def __init__(self, sourceNodeId, destNodeId, content, commandingGeneralChain):
+    def __init__(self, sourceNodeId, destNodeId, content, commandingGeneralChain, roundId, delayedByTimeout=False):
         """
         Create the message.
 
@@ -42,11 +64,17 @@ class ConsensusMessage:
         :param content:                 Contents of the message (type may vary).
         :param commandingGeneralChain:  Denotes which commanding generals have issued their commands in the recursion.
                                         Should include the sender of this message.
+        :param roundId:                 Identifier of the consensus round that the message belongs to. Messages from
+                                        earlier rounds are dropped on receipt.
+        :param delayedByTimeout:        True if the message relays a value that a node along the chain used after
+                                        timing out, so it was sent late on purpose (see chain_deadlines).
         """
         self.sourceNodeId = sourceNodeId
         self.destNodeId = destNodeId
         self.content = content
         self.commandingGeneralChain = commandingGeneralChain
+        self.roundId = roundId
+        self.delayedByTimeout = delayedByTimeout
 
     def __lt__(self, other):
         # Needed in case two messages have the same delivery time
@@ -59,17 +87,23 @@ class ConsensusResultMessage:
     Message from a node to the network manager conveying the results of the consensus protocol for a particular m value.
     """
 
-    def __init__(self, mValue, latency, consensusOutcome):
+    def __init__(self, mValue, latency, consensusOutcome, roundId):
         """
         Create the message.
 
         :param mValue:              M value that the results are for.
         :param latency:             Latency experienced when reaching consensus.
         :param consensusOutcome:    Outcome of the consensus protocol (agreed-upon value).
+        :param roundId:             Identifier of the consensus round that the results are for.
         """
         self.mValue = mValue
         self.latency = latency
         self.consensusOutcome = consensusOutcome
+        self.roundId = roundId
+        # Per-phase stats (map of phase name to [call count, total seconds]) for the round, if the node is instrumented
+        self.phaseStats = None
+        # Number of messages that the node gave up waiting for in the round (and used the default value for instead)
+        self.timeoutCount = 0
 
 
 class DistributedConsensusResultMessage:
@@ -77,13 +111,15 @@ class DistributedConsensusResultMessage:
     Message from a node to the network manager conveying the results of the consensus protocol for multiple m values.
     """
 
-    def __init__(self, individualConsensusResults):
+    def __init__(self, individualConsensusResults, roundId):
         """
         Create the message.
 
         :param individualConsensusResults:  List of ConsensusResultMessages (one per m-value).
+        :param roundId:                     Identifier of the consensus round that the results are for.
         """
         self.individualConsensusResults = individualConsensusResults
+        self.roundId = roundId
 
 
 class SetMValuesMessage:
@@ -108,3 +144,37 @@ class ShutdownNodeMessage:
 
     def __init__(self):
         pass
+
+
+class RunNodeCommand:
+    """
+    Message from a network manager to a node worker (see node_worker_pool) telling it to run a node until the node is
+    shut down.
+    """
+
+    def __init__(self, node):
+        """
+        Create the message.
+
+        :param node:    NetworkNode to run. Its queues (and peer inboxes) are replaced with the worker's own.
+        """
+        self.node = node
+
+
+class NodeStoppedMessage:
+    """
+    Message from a node worker to the network manager that indicates that the node it was running has shut down, so
+    nothing more will be sent for it.
+    """
+
+    def __init__(self):
+        pass
+
+
+class StopNodeWorkerMessage:
+    """
+    Message to a node worker that indicates that the worker process should exit.
+    """
+
+    def __init__(self):
+        pass
@@ -2,37 +2,17 @@ from network_messages import *
 import multiprocessing
 import time
 import queue
+import logging
 from project_utils import *
 from functools import partial
+from phase_instrumentation import *
+from node_logging import *
+from chain_deadlines import *
+from consensus_values import *
 
-from contextlib import contextmanager
-
-@contextmanager
-def acquire_lock_timeout(lock, timeout):
-    result = lock.acquire(timeout=timeout)
-    yield result
-    if result:
-        lock.release()
-
-
-
-def getMajorityOfBooleans(tiebreakerValue, booleansList):
-    """
-    Get the majority of a list of booleans, or the tiebreaker value if there were the same number of true and false
-    values in the list.
-
-    :param tiebreakerValue: Value to use (true or false) if there were the same number of trues and falses in the
-                            booleans list.
-    :param booleansList:    List of booleans to get the majority value of.
-
-    :return: Value that occurred in the list most frequently, or the tiebreaker value if there was a tie.
-    """
-    trueCount = booleansList.count(True)
-    falseCount = booleansList.count(False)
-
-    if (trueCount == falseCount):
-        return tiebreakerValue
-    return trueCount > falseCount
+# Methods of the node that are timed when instrumentation is enabled
+NODE_INSTRUMENTED_PHASES = ["receiveIncomingMessages", "handleConsensusMsg", "handleAwaitingResponseTimeout",
+                            "updateResultsTree", "hasReceivedAllExpectedMessages", "flushPendingOutgoingMessages"]
 
 
 class WaitingForResponseMsg:
@@ -101,18 +81,17 @@ class ConsensusMessagesTreeNode:
             if (firstGeneralId not in self.children):
                 # TODO is this true? Need to revisit this if we get this error -- timeouts/delays could result in this
                 #  not being true
-                self.printStrWithNodePrefix(
-                    "ERROR: If we have a result from a child, we should already have the parent in the tree",
-                    level="ERROR")
-                self.printStrWithNodePrefix(unprocessedGeneralIds, level="ERROR")
+                logging.getLogger(NODE_LOGGER_NAME).error(
+                    "ERROR: If we have a result from a child, we should already have the parent in the tree: %s",
+                    unprocessedGeneralIds)
                 exit(1)
             self.children[firstGeneralId].addChild(consensusValue, remainingGeneralIds)
 
         else:
             # TODO should we check if the first general id already exists in the children before overwriting?
             if (firstGeneralId in self.children):
-                self.printStrWithNodePrefix("WARN: The general is already in the children in the tree -- overwriting",
-                                            level="WARN")
+                logging.getLogger(NODE_LOGGER_NAME).warning(
+                    "WARN: The general is already in the children in the tree -- overwriting")
             self.children[firstGeneralId] = ConsensusMessagesTreeNode(consensusValue, firstGeneralId)
 
     def getMinimumBranchDepth(self, expectedNodes, callingNode):
@@ -158,36 +137,33 @@ class NetworkNode:
     Node that operates in the network.
     """
 
-    def __init__(self, nodeNum, outgoingMsgQueue, outgoingMsgQueueLock, incomingMsgQueue, incomingMsgQueueLock,
-                 defaultConsensusValue, sleepBetweenProcessingMs, initialConsensusTolerance, maxLatency,
-                 totalNodesCount, debug=False):
+    def __init__(self, nodeNum, outgoingMsgQueue, incomingMsgQueue, defaultConsensusValue, sleepBetweenProcessingMs,
+                 initialConsensusTolerance, maxLatency, totalNodesCount, debug=False, enableInstrumentation=False):
         """
         Create the node.
 
         :param nodeNum:                     Number identifying this node.
         :param outgoingMsgQueue:            Outgoing message queue (used to send data to the network manager/other nodes
                                             from this node).
-        :param outgoingMsgQueueLock:        Lock for the outgoing message queue.
         :param incomingMsgQueue:            Incoming message queue (used to send data to this node from the network
                                             manager/other nodes).
-        :param incomingMsgQueueLock:        Lock for the incoming message queue.
         :param defaultConsensusValue:       Default value to use in the consensus protocol.
         :param sleepBetweenProcessingMs:    Milliseconds to sleep between checking for new messages to process.
         :param initialConsensusTolerance:   Initial consensus tolerance value (m value) to use.
         :param maxLatency:                  Maximum time in milliseconds to wait for a node's response after becoming
-                                            aware that we need it.
+                                            aware that we need it. When chainDeadlines is set, this only applies to the
+                                            commanding general's message.
         :param totalNodesCount:             Total number of nodes. Needed so we know what other nodes exist in our
                                             network that we should communicate with.
+        :param debug:                       True if debug output should be printed.
+        :param enableInstrumentation:       True if the hot-path methods should be timed and the per-round stats sent
+                                            back with the consensus results.
         """
-        # TODO need to check that these are storing the address to the same queue and not creating new queues
-        # Outgoing message queue (for sending to network manager or other nodes)
+        # Outgoing message queue (for sending to network manager or other nodes). The queues synchronize
+        # internally, so no separate lock is needed around them.
         self.outgoingMsgQueue = outgoingMsgQueue
-        # Outgoing msg queue lock (so we don't have simultaneous reads and writes to the queue)
-        self.outgoingMsgQueueLock = outgoingMsgQueueLock
         # Incoming message queue (for receiving from the network manager or other nodes)
         self.incomingMsgQueue = incomingMsgQueue
-        # Outgoing msg queue lock (so we don't have simultaneous reads and writes to the queue)
-        self.incomingMsgQueueLock = incomingMsgQueueLock
         # Number of this node (used as identifier)
         self.nodeNum = nodeNum
         # Consensus tolerance -- list of consensus tolerance values to test -- in centralized case, this will have 1
@@ -214,13 +190,31 @@ class NetworkNode:
         self.consensusResultTree = None
         # True if we're in the middle of consensus, false if we're not in the middle of a consensus round
         self.executingConsensus = False
+        # Identifier of the consensus round that this node is executing, or None once it has sent its result. Consensus
+        # messages tagged with any other round are stale and dropped on receipt.
+        self.currentRoundId = None
         self.pendingMessages = []
         self.debug = debug
         self.pendingOutgoingMessages = []
-
-    def printStrWithNodePrefix(self, printObj, level=""):
-        if (self.debug or (level == "WARN") or (level == "ERROR")):
-            print("Node " + str(self.nodeNum) + ": " + str(printObj), flush=True)
+        # (Instrumentation only) Consensus result waiting to be sent with the stats of its round
+        self.pendingConsensusResult = None
+        # PeerDeliveryShim used to send consensus messages directly to other nodes. When None, consensus messages are
+        # sent to the network manager to be relayed.
+        self.peerDeliveryShim = None
+        # AdaptiveChainDeadlines used to time out relayed messages that were dropped. When None (messages can't be
+        # lost), every message is waited for for maxLatency.
+        self.chainDeadlines = None
+        # Commanding general chains (as tuples) that have been resolved in the current round, by a message or by a
+        # timeout. Messages for these that arrive later are dropped.
+        self.resolvedChains = set()
+        # Number of messages timed out in the current round
+        self.timeoutCount = 0
+        self.enableInstrumentation = enableInstrumentation
+        # PhaseInstrumentation collecting stats for the current round. Only created once the node is running in its own
+        # process (the timed wrappers can't be sent to the process).
+        self.instrumentation = None
+        # Messages are passed to the logger unformatted so that disabled debug messages cost nothing to build
+        self.logger = getNodeLogger(nodeNum)
 
     # def dummy_consensus(self):
     #     consensusToleranceVal = self.consensusTolerance[0]
@@ -228,9 +222,9 @@ class NetworkNode:
     #     time.sleep(sleepTime)
     #     self.outgoingMsgQueue.put(ConsensusResultMessage(consensusToleranceVal, sleepTime, 0))
 
-    def processMessageWhileLocked(self, msg):
+    def processControlMessage(self, msg):
         """
-        Do processing of the message while holding the lock.
+        Process a message from the network manager that controls the node (shutdown, m-values, consensus start).
 
         :param msg: Message to process. One of the types in network_messages
 
@@ -256,13 +250,22 @@ class NetworkNode:
         :param consensusStartMsg:   Consensus start message that was received.
         """
         # Trigger the timer
-        self.printStrWithNodePrefix("Received consensus start msg with general " + str(consensusStartMsg.mainGeneralID))
+        self.logger.debug("Received consensus start msg with general %s", consensusStartMsg.mainGeneralID)
         currentTimeMillis = getCurrentTimeMillis()
         self.executingConsensus = True
-        # At the beginning of the consensus round, we should remove any pending messages, they do not apply to this round
+        self.currentRoundId = consensusStartMsg.roundId
+        if (self.peerDeliveryShim is not None):
+            self.peerDeliveryShim.startRound(consensusStartMsg.roundId, consensusStartMsg.isFaulty,
+                                             consensusStartMsg.faultPlan, consensusStartMsg.faultTables)
+        # At the beginning of the consensus round, pending messages from earlier rounds no longer apply
         self.awaitingResponse.clear()
         self.receivedResults.clear()
-        self.pendingMessages.clear()  # TODO Is this okay to do here?
+        self.resolvedChains.clear()
+        self.timeoutCount = 0
+        if (self.chainDeadlines is not None):
+            self.chainDeadlines.startRound(max(self.consensusTolerance))
+        self.pendingMessages = [pendingMsg for pendingMsg in self.pendingMessages if
+                                pendingMsg.roundId == self.currentRoundId]
         self.consensusResultTree = None
         # Record the start time, so we can measure latency
         self.consensusStartTime = currentTimeMillis
@@ -278,8 +281,12 @@ class NetworkNode:
         :param waitingForGenerals:  List of generals indicating what branch of the recursion we're in. Message that
                                     we're waiting for should have this chain of generals.
         """
-        self.printStrWithNodePrefix("Added awaiting for response from " + str(waitingForGenerals))
-        timeoutTime = startWaitingTime + self.maxLatency
+        self.logger.debug("Added awaiting for response from %s", waitingForGenerals)
+        timeoutTime = None
+        if ((self.chainDeadlines is not None) and (len(waitingForGenerals) > 1)):
+            timeoutTime = self.chainDeadlines.getDeadline(len(waitingForGenerals))
+        if (timeoutTime is None):
+            timeoutTime = startWaitingTime + self.maxLatency
         self.awaitingResponse.append((timeoutTime, WaitingForResponseMsg(waitingForGenerals)))
 
     def consensusMsgMatchesAwaitingResponse(self, msg):
@@ -304,20 +311,36 @@ class NetworkNode:
         else:
             # TODO should we discard or process it anyway? (Right now, we're not actually discarding, we're just
             #  placing in a queue to process later)
-            self.printStrWithNodePrefix("WARN: Message with commanding general chain " + str(
-                msg.commandingGeneralChain) + " does not match awaiting response. Discarding")
+            self.logger.debug("WARN: Message with commanding general chain %s does not match awaiting response. "
+                              "Discarding", msg.commandingGeneralChain)
         return matchingMsg
 
-    def handleConsensusMsg(self, msg):
+    def handleConsensusMsg(self, msg, isNewArrival=True):
         """
         Process a consensus message.
 
-        :param msg: Consensus message received.
+        :param msg:             Consensus message received.
+        :param isNewArrival:    False if the message was held in pendingMessages and is being processed again.
         """
+        if (msg.roundId != self.currentRoundId):
+            # Stale message from a round this node has finished (still in flight when it decided)
+            return
+
+        if ((self.chainDeadlines is not None) and isNewArrival and (len(msg.commandingGeneralChain) > 1) and
+                (not msg.delayedByTimeout)):
+            # Learn from when the message arrived, not from when the node got to it (messages for a chain whose parent
+            # hasn't resolved wait in pendingMessages until it has). Messages held up by a timeout upstream say nothing
+            # about how long relaying takes.
+            self.chainDeadlines.recordArrival(len(msg.commandingGeneralChain), getCurrentTimeMillis())
+
+        if (tuple(msg.commandingGeneralChain) in self.resolvedChains):
+            # Arrived after its deadline, so the default value has already been used in its place
+            self.logger.debug("Dropping late message with commanding general chain %s", msg.commandingGeneralChain)
+            return
+
         if (not self.executingConsensus):
-            self.printStrWithNodePrefix(
-                "WARN: Node " + str(self.nodeNum) + " received consensus message from node" + str(
-                    msg.sourceNodeId) + " when the node didn't think it was executing consensus", level="WARN")
+            self.logger.warning("WARN: Node %s received consensus message from node %s when the node didn't think it "
+                                "was executing consensus", self.nodeNum, msg.sourceNodeId)
             return
 
         consensusSenderValue = msg.content
@@ -327,7 +350,7 @@ class NetworkNode:
 
         matchingMsg = self.consensusMsgMatchesAwaitingResponse(msg)
         if (matchingMsg is not None):
-            self.handleMsgOrDefaultFromTimeout(commandingGeneralChain, consensusSenderValue)
+            self.handleMsgOrDefaultFromTimeout(commandingGeneralChain, consensusSenderValue, msg.delayedByTimeout)
         else:
             self.pendingMessages.append(msg)
 
@@ -342,14 +365,14 @@ class NetworkNode:
         """
         if (self.consensusResultTree == None):
             if (len(commandingGeneralChain) != 1):
-                self.printStrWithNodePrefix("ERROR: If the consensus results tree doesn't exist, we should "
-                                            "only have information from the commanding general", level="ERROR")
+                self.logger.error("ERROR: If the consensus results tree doesn't exist, we should only have "
+                                  "information from the commanding general")
                 exit(1)
             self.consensusResultTree = ConsensusMessagesTreeNode(consensusValue, commandingGeneralChain[0])
         else:
             self.consensusResultTree.addChild(consensusValue, commandingGeneralChain[1:])
 
-    def handleMsgOrDefaultFromTimeout(self, commandingGeneralChain, consensusValue):
+    def handleMsgOrDefaultFromTimeout(self, commandingGeneralChain, consensusValue, delayedByTimeout=False):
         """
         Handle the given message result (or timeout result), with the point in the recursion identified by the
         commandingGeneralChain.
@@ -358,6 +381,8 @@ class NetworkNode:
                                         value is for.
         :param consensusValue:          Consensus value that should be treated as received at the given point in the
                                         recursion.
+        :param delayedByTimeout:        True if the value comes from a timeout, here or further up the chain, so that
+                                        the messages relaying it are marked as sent late.
         :return:
         """
         # Get the time at which the message/timeout was received
@@ -365,19 +390,22 @@ class NetworkNode:
         receivedTime = getCurrentTimeMillis()
         # Update the results
         self.receivedResults.append(ReceivedOrDefaultInfo(commandingGeneralChain, consensusValue))
+        self.resolvedChains.add(tuple(commandingGeneralChain))
+        if ((self.chainDeadlines is not None) and (len(commandingGeneralChain) == 1)):
+            # Deadlines for the relayed messages are measured from when the general's message was received
+            self.chainDeadlines.setAnchor(receivedTime)
         self.updateResultsTree(commandingGeneralChain, consensusValue)
 
         # If we've reached m=0
-        self.printStrWithNodePrefix(
-            "Received message/timeout with " + str(consensusValue) + " and commandingGeneralChain " + str(
-                commandingGeneralChain))
-        self.printStrWithNodePrefix("Consensus tolerance is " + str(max(self.consensusTolerance)))
+        self.logger.debug("Received message/timeout with %s and commandingGeneralChain %s", consensusValue,
+                          commandingGeneralChain)
+        self.logger.debug("Consensus tolerance is %s", self.consensusTolerance)
         if (len(commandingGeneralChain) > max(self.consensusTolerance)):
             # print("Node " + str(self.nodeNum) + " at m=0")
 
             # TODO Update to handle distributed case
             if (self.hasReceivedAllExpectedMessages(self.consensusTolerance[0])):
-                print("Node " + str(self.nodeNum) + " sending result")
+                self.logger.info("sending result")
                 self.sendConsensusResult(self.consensusTolerance[0],
                                          self.getDecisionFromCollectedResults(self.consensusTolerance[0]))
 
@@ -385,24 +413,30 @@ class NetworkNode:
             # m > 0
             # Get the remaining nodes -- send to them and indicate we're also waiting for responses from them
             sendToNodes = list((set(range(self.totalNodesCount)) - set(commandingGeneralChain) - {self.nodeNum}))
-            self.printStrWithNodePrefix(
-                "Prev commanding general chain was " + str(commandingGeneralChain) + "; sending to " + str(sendToNodes))
+            self.logger.debug("Prev commanding general chain was %s; sending to %s", commandingGeneralChain,
+                              sendToNodes)
             for destNodeNum in sendToNodes:
-                self.sendConsensusMsg(destNodeNum, consensusValue, commandingGeneralChain)
+                self.sendConsensusMsg(destNodeNum, consensusValue, commandingGeneralChain, delayedByTimeout)
                 # Indicate that we're awaiting messages from all of the other nodes
                 self.setAwaitingForResponse(receivedTime, commandingGeneralChain + [destNodeNum])
 
-    def sendConsensusMsg(self, targetNode, consensusValue, previousCommandingGenerals):
+    def sendConsensusMsg(self, targetNode, consensusValue, previousCommandingGenerals, delayedByTimeout=False):
         """
         Send a consensus message with the given value to the target node.
 
-        :param targetNode:      Node to send the consensus message to
-        :param consensusValue:  Value to include in the consensus message
-        """
-        self.printStrWithNodePrefix(
-            "Sending consensus message " + str(consensusValue) + " with commanding general chain " + str(
-                previousCommandingGenerals + [self.nodeNum]) + " to node " + str(targetNode))
-        self.pendingOutgoingMessages.append(ConsensusMessage(self.nodeNum, targetNode, consensusValue, previousCommandingGenerals + [self.nodeNum]))
+        :param targetNode:          Node to send the consensus message to
+        :param consensusValue:      Value to include in the consensus message
+        :param delayedByTimeout:    True if the value is only being relayed late because of a timeout.
+        """
+        consensusMsg = ConsensusMessage(self.nodeNum, targetNode, consensusValue,
+                                        previousCommandingGenerals + [self.nodeNum], self.currentRoundId,
+                                        delayedByTimeout)
+        self.logger.debug("Sending consensus message %s with commanding general chain %s to node %s", consensusValue,
+                          consensusMsg.commandingGeneralChain, targetNode)
+        if (self.peerDeliveryShim is not None):
+            self.peerDeliveryShim.send(consensusMsg)
+        else:
+            self.pendingOutgoingMessages.append(consensusMsg)
         # with (self.outgoingMsgQueueLock):
             # print("Node " + str(self.nodeNum) + " acquired outgoing lock")
             # self.outgoingMsgQueue.put(
@@ -416,6 +450,10 @@ class NetworkNode:
         :param msg: Consensus start message.
         """
         self.consensusStartTime = getCurrentTimeMillis()
+        self.currentRoundId = msg.roundId
+        self.timeoutCount = 0
+        if (self.peerDeliveryShim is not None):
+            self.peerDeliveryShim.startRound(msg.roundId, msg.isFaulty, msg.faultPlan, msg.faultTables)
         # Send consensus msg then send result
         for i in range(self.totalNodesCount):
             if (i != self.nodeNum):
@@ -423,9 +461,9 @@ class NetworkNode:
                 self.sendConsensusMsg(i, msg.decision, [])
         self.sendConsensusResult(self.consensusTolerance[0], msg.decision)
 
-    def processMessageWithoutLock(self, msg):
+    def processProtocolMessage(self, msg):
         """
-        Process a message received from the network while not locked (not blocking message insertion into the queue).
+        Process a message received from the network that is part of the consensus protocol itself.
 
         :param msg: Message received.
         """
@@ -443,10 +481,10 @@ class NetworkNode:
         """
         # TODO fix to handle recursive
         # Also fix for multi-m-value case
-        self.printStrWithNodePrefix(
-            "Timed out awaiting response for " + str(awaitingResponseDetails[1].awaitingForGeneralsChain))
+        self.logger.debug("Timed out awaiting response for %s", awaitingResponseDetails[1].awaitingForGeneralsChain)
+        self.timeoutCount += 1
         self.handleMsgOrDefaultFromTimeout(awaitingResponseDetails[1].awaitingForGeneralsChain,
-                                           self.defaultConsensusValue)
+                                           self.defaultConsensusValue, True)
 
     def sendConsensusResult(self, mValue, consensusResult):
         """
@@ -460,8 +498,16 @@ class NetworkNode:
         self.pendingMessages.clear()
         self.consensusResultTree = None
         currentTime = getCurrentTimeMillis()
-        consensusResultMsg = ConsensusResultMessage(mValue, currentTime - self.consensusStartTime, consensusResult)
-        self.pendingOutgoingMessages.append(consensusResultMsg)
+        consensusResultMsg = ConsensusResultMessage(mValue, currentTime - self.consensusStartTime, consensusResult,
+                                                    self.currentRoundId)
+        consensusResultMsg.timeoutCount = self.timeoutCount
+        if (self.instrumentation is not None):
+            # The stats are taken once the round's messages have been flushed (see sendPendingConsensusResult)
+            self.pendingConsensusResult = consensusResultMsg
+        else:
+            self.pendingOutgoingMessages.append(consensusResultMsg)
+        # The round is over for this node, so messages still in flight for it are dropped as stale
+        self.currentRoundId = None
         # with self.outgoingMsgQueueLock:
             # print("Node " + str(self.nodeNum) + " acquired outgoing lock")
             # self.outgoingMsgQueue.put(consensusResultMsg)
@@ -478,15 +524,15 @@ class NetworkNode:
             return False
         expectedTreeNodes = set(range(self.totalNodesCount)) - {self.nodeNum}
         minBranchDepth = self.consensusResultTree.getMinimumBranchDepth(expectedTreeNodes, self.nodeNum)
-        self.printStrWithNodePrefix("Minimum branch depth " + str(minBranchDepth))
-        self.printStrWithNodePrefix("Results tree" + str(self.consensusResultTree))
+        self.logger.debug("Minimum branch depth %s", minBranchDepth)
+        self.logger.debug("Results tree %s", self.consensusResultTree)
         return (consensusToleranceVal + 1) <= minBranchDepth
 
     def getDecisionFromCollectedResults(self, consensusToleranceVal):
         # TODO utilize consensusToleranceValue in aggregateResults
-        majorityFunction = partial(getMajorityOfBooleans, self.defaultConsensusValue)
+        majorityFunction = partial(getMajorityValue, self.defaultConsensusValue)
         aggregatedResults = self.consensusResultTree.aggregateResults(majorityFunction)
-        self.printStrWithNodePrefix("Results: " + str(aggregatedResults))
+        self.logger.debug("Results: %s", aggregatedResults)
         return aggregatedResults
 
     def run(self):
@@ -494,51 +540,43 @@ class NetworkNode:
         Run the node by periodically checking for incoming messages. Runs until shutdown. This should be run in its
         own thread.
         """
+        configureNodeLogging(self.debug)
+        if (self.enableInstrumentation):
+            self.instrumentation = PhaseInstrumentation()
+            self.instrumentation.instrumentMethods(self, NODE_INSTRUMENTED_PHASES)
+
         keepProcessing = True
         while (keepProcessing):
             time.sleep(self.sleepBetweenProcessingMs / 1000.0)
             currentTimeMillis = getCurrentTimeMillis()
-            # Check for any messages that we're waiting for responses for
-            timedOutMsgs = [awaitingResponseMsg for awaitingResponseMsg in self.awaitingResponse if
-                            awaitingResponseMsg[0] < currentTimeMillis]
-            self.awaitingResponse = [awaitingResponseMsg for awaitingResponseMsg in self.awaitingResponse if
-                                     awaitingResponseMsg[0] >= currentTimeMillis]
             pendingMsgsCopy = self.pendingMessages[:]
             self.pendingMessages.clear()
             for pendingMsg in pendingMsgsCopy:
-                self.handleConsensusMsg(pendingMsg)
+                self.handleConsensusMsg(pendingMsg, False)
             numPendingMsgs = len(pendingMsgsCopy)
             # if (numPendingMsgs != 0):
             #     print("Node " + str(self.nodeNum) + " processed  " + str(numPendingMsgs) + " cached messages")
 
+            if (self.peerDeliveryShim is not None):
+                for peerMsg in self.peerDeliveryShim.getDueMessages():
+                    self.handleConsensusMsg(peerMsg)
+
+            keepProcessing = self.receiveIncomingMessages()
+
+            # Check for any messages that we're waiting for responses for, after handling the messages that had arrived
+            # by currentTimeMillis (the node may not have run for a while, e.g. on a busy host)
+            timedOutMsgs = [awaitingResponseMsg for awaitingResponseMsg in self.awaitingResponse if
+                            awaitingResponseMsg[0] < currentTimeMillis]
+            self.awaitingResponse = [awaitingResponseMsg for awaitingResponseMsg in self.awaitingResponse if
+                                     awaitingResponseMsg[0] >= currentTimeMillis]
             for awaitingResponseMsg in timedOutMsgs:
                 self.handleAwaitingResponseTimeout(awaitingResponseMsg)
 
-            receivedMsgs = 0
-            while (not self.incomingMsgQueue.empty()):
-                with self.incomingMsgQueueLock:
-                    receivedMsgs += 1
-                    msg = self.incomingMsgQueue.get()
-                    keepProcessing = self.processMessageWhileLocked(msg)
-                self.processMessageWithoutLock(msg)
-            # if (receivedMsgs > 0):
-            #     print("Node " + str(self.nodeNum) + " received " + str(receivedMsgs) + " messages")
-
             if (self.pendingOutgoingMessages):
-                with acquire_lock_timeout(self.outgoingMsgQueueLock, 0.5) as acquired:
-                    if (acquired):
-                        unhandledMessages = []
-                        for i in range(len(self.pendingOutgoingMessages)):
-                            pendingOutgoingMsg = self.pendingOutgoingMessages[i]
-                            try:
-                                self.outgoingMsgQueue.put(pendingOutgoingMsg, timeout=0.5)
-                            except (queue.Full):
-                                print("WARNING: Node " + str(self.nodeNum) + " unable to send messages because outgoing queue is full; sent " + str(i) + " messages before filling up")
-                                unhandledMessages = self.pendingOutgoingMessages[i:]
-                                break
-                        self.pendingOutgoingMessages = unhandledMessages
-                    else:
-                        print("WARNING: Failed to acquire lock for node " + str(self.nodeNum))
+                self.flushPendingOutgoingMessages()
+
+            if (self.pendingConsensusResult is not None):
+                self.sendPendingConsensusResult()
 
             # numAwaitingResponses = len(self.awaitingResponse)
             # if (numAwaitingResponses == 0):
@@ -547,6 +585,56 @@ class NetworkNode:
 
             # print("Processing " + str(self.nodeNum))
 
+        if (self.peerDeliveryShim is not None):
+            self.peerDeliveryShim.stop()
+
+    def receiveIncomingMessages(self):
+        """
+        Process the messages waiting in the incoming message queue.
+
+        :return: True if the node should keep running, false if it was told to shut down.
+        """
+        while True:
+            try:
+                msg = self.incomingMsgQueue.get_nowait()
+            except queue.Empty:
+                return True
+            if (not self.processControlMessage(msg)):
+                return False
+            self.processProtocolMessage(msg)
+
+    def sendPendingConsensusResult(self):
+        """
+        (Instrumentation only) Send the consensus result held back by sendConsensusResult with the round's stats. This
+        is called outside of the timed methods, after the round's other messages were flushed, so the stats include
+        every timed call of the round (e.g. the commanding general's flush of its commands). The result's own flush
+        isn't timed, so it isn't counted in the next round either.
+        """
+        if (self.pendingOutgoingMessages):
+            # Some of the round's messages didn't fit in the outgoing queue; the result has to follow them
+            return
+        self.pendingConsensusResult.phaseStats = self.instrumentation.takeStats()
+        self.pendingOutgoingMessages.append(self.pendingConsensusResult)
+        self.pendingConsensusResult = None
+        NetworkNode.flushPendingOutgoingMessages(self)
+
+    def flushPendingOutgoingMessages(self):
+        """
+        Put the messages queued up while processing onto the outgoing queue. Any messages that don't fit are kept and
+        retried on the next iteration.
+        """
+        unhandledMessages = []
+        for i in range(len(self.pendingOutgoingMessages)):
+            pendingOutgoingMsg = self.pendingOutgoingMessages[i]
+            try:
+                self.outgoingMsgQueue.put(pendingOutgoingMsg, timeout=0.5)
+            except (queue.Full):
+                self.logger.warning("WARNING: unable to send messages because outgoing queue is full; sent %s "
+                                    "messages before filling up", i)
+                unhandledMessages = self.pendingOutgoingMessages[i:]
+                break
+        self.pendingOutgoingMessages = unhandledMessages
+
 
 class DistributedMabNetworkNode(NetworkNode):
     """
@@ -554,19 +642,16 @@ class DistributedMabNetworkNode(NetworkNode):
     distributed multi-armed bandit (rather than a centralized controller).
     """
 
-    def __init__(self, nodeNum, outgoingMsgQueue, outgoingMsgQueueLock, incomingMsgQueue, incomingMsgQueueLock,
-                 defaultConsensusValue, sleepBetweenProcessingMs, initialConsensusTolerance, maxLatency,
-                 totalNodesCount):
+    def __init__(self, nodeNum, outgoingMsgQueue, incomingMsgQueue, defaultConsensusValue, sleepBetweenProcessingMs,
+                 initialConsensusTolerance, maxLatency, totalNodesCount, enableInstrumentation=False):
         """
         Create the node.
 
         :param nodeNum:                     Number identifying this node.
         :param outgoingMsgQueue:            Outgoing message queue (used to send data to the network manager/other nodes
                                             from this node).
-        :param outgoingMsgQueueLock:        Lock for the outgoing message queue.
         :param incomingMsgQueue:            Incoming message queue (used to send data to this node from the network
                                             manager/other nodes).
-        :param incomingMsgQueueLock:        Lock for the incoming message queue.
         :param defaultConsensusValue:       Default value to use in the consensus protocol.
         :param sleepBetweenProcessingMs:    Milliseconds to sleep between checking for new messages to process.
         :param initialConsensusTolerance:   Initial consensus tolerance value (m value) to use.
@@ -574,7 +659,9 @@ class DistributedMabNetworkNode(NetworkNode):
                                             aware that we need it.
         :param totalNodesCount:             Total number of nodes. Needed so we know what other nodes exist in our
                                             network that we should communicate with.
+        :param enableInstrumentation:       True if the hot-path methods should be timed and the per-round stats sent
+                                            back with the consensus results.
         """
-        NetworkNode.__init__(self, nodeNum, outgoingMsgQueue, outgoingMsgQueueLock, incomingMsgQueue,
-                             incomingMsgQueueLock, defaultConsensusValue, sleepBetweenProcessingMs,
-                             initialConsensusTolerance, maxLatency, totalNodesCount)
+        NetworkNode.__init__(self, nodeNum, outgoingMsgQueue, incomingMsgQueue, defaultConsensusValue,
+                             sleepBetweenProcessingMs, initialConsensusTolerance, maxLatency, totalNodesCount,
+                             enableInstrumentation=enableInstrumentation)
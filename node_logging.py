@@ -0,0 +1,56 @@
+import logging
+import sys
+
+# Name of the logger used by the nodes
+NODE_LOGGER_NAME = "network_node"
+
+NODE_LOG_FORMAT = "%(message)s"
+
+
+class NodeLoggerAdapter(logging.LoggerAdapter):
+    """
+    Logger for a single node that prefixes each message with the node number.
+
+    Messages should be given as a format string and arguments (e.g. logger.debug("Results tree %s", tree)) so that
+    they're only formatted if the level is enabled. The prefix is also only added to messages that are emitted.
+    """
+
+    def __init__(self, logger, nodeNum):
+        """
+        Create the logger.
+
+        :param logger:  Logger to write the messages to.
+        :param nodeNum: Number of the node that is logging.
+        """
+        logging.LoggerAdapter.__init__(self, logger, {})
+        self.prefix = "Node " + str(nodeNum) + ": "
+
+    def process(self, msg, kwargs):
+        return self.prefix + str(msg), kwargs
+
+
+def getNodeLogger(nodeNum):
+    """
+    Get the logger for a node.
+
+    :param nodeNum: Number of the node.
+
+    :return: NodeLoggerAdapter for the node.
+    """
+    return NodeLoggerAdapter(logging.getLogger(NODE_LOGGER_NAME), nodeNum)
+
+
+def configureNodeLogging(debug):
+    """
+    Set up the node logger in the current process. Needed in each node process, since logging configuration isn't
+    inherited by spawned processes.
+
+    :param debug:   True if debug messages should be written, false if only info messages and above should be.
+    """
+    logger = logging.getLogger(NODE_LOGGER_NAME)
+    if (not logger.handlers):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(NODE_LOG_FORMAT))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
@@ -0,0 +1,110 @@
+import multiprocessing
+import sys
+from network_messages import *
+from consensus_values import *
+
+# Code run inside node processes, and how they are started.
+#
+# Node processes are started with the spawn start method, which makes every child import the main module of the
+# program that started it (e.g. run_simulation, and through it NumPy, joblib and yaml) before running anything. Nodes
+# need none of that, so startNodeProcess has the children import this module in its place. This module and the modules
+# that the nodes are unpickled from (network_node, network_messages, chain_deadlines and consensus_values) only import
+# the standard library. Nodes only import NumPy to aggregate integer values or batches (see importNodeDependencies), or
+# for the random generator of direct peer delivery (peer_delivery).
+
+# True to have node processes import the main module of the program that started them, as multiprocessing does by
+# default
+NODE_PROCESSES_IMPORT_MAIN_MODULE = False
+
+
+def importNodeDependencies(node):
+    """
+    Import the modules that a node only needs for some value spaces before it runs, so that importing them isn't
+    counted in the latency of its first round.
+
+    :param node:    NetworkNode about to run.
+    """
+    if (isIntValue(node.defaultConsensusValue) or isinstance(node.defaultConsensusValue, tuple)):
+        # Integer values and batches are aggregated with NumPy (see getMajorityValue)
+        import numpy
+
+
+def runNode(node):
+    """
+    Run a node until it is told to shut down. This is the target of each node process started by a network manager.
+
+    :param node:    NetworkNode to run.
+    """
+    importNodeDependencies(node)
+    node.run()
+
+
+def runNodeWorker(workerNum, toWorkerQueue, fromWorkerQueue, peerInboxes):
+    """
+    Run nodes sent by network managers one after another, until told to exit. This is the target of each worker
+    process of a NodeWorkerPool.
+
+    :param workerNum:       Number of the worker. The worker runs the node with this node number.
+    :param toWorkerQueue:   Channel from the network manager to the worker's node.
+    :param fromWorkerQueue: Channel from the worker's node to the network manager.
+    :param peerInboxes:     Inbox of every worker in the pool, for direct peer delivery.
+    """
+    while True:
+        msg = toWorkerQueue.get()
+        if (isinstance(msg, StopNodeWorkerMessage)):
+            break
+        if (not isinstance(msg, RunNodeCommand)):
+            # Left over from a network manager that stopped early
+            continue
+
+        node = msg.node
+        node.incomingMsgQueue = toWorkerQueue
+        node.outgoingMsgQueue = fromWorkerQueue
+        if (node.peerDeliveryShim is not None):
+            node.peerDeliveryShim.peerInboxes = peerInboxes[:node.totalNodesCount]
+        importNodeDependencies(node)
+        node.run()
+        fromWorkerQueue.put(NodeStoppedMessage())
+
+    for peerInbox in peerInboxes:
+        peerInbox.cancel_join_thread()
+
+
+def isDefinedInMainModule(obj):
+    """
+    Check whether an object is a function or instance of a class defined in the main module, which a child process
+    can only unpickle after importing the main module.
+
+    :param obj: Object to check.
+
+    :return: True if the object comes from the main module.
+    """
+    if (callable(obj) and hasattr(obj, "__module__")):
+        return obj.__module__ == "__main__"
+    return type(obj).__module__ == "__main__"
+
+
+def startNodeProcess(target, args):
+    """
+    Start a process that runs a node or a node worker, without having it import the main module of this program
+    (unless NODE_PROCESSES_IMPORT_MAIN_MODULE is set, or the target or an argument comes from the main module).
+
+    :param target:  Function for the process to run (e.g. runNode).
+    :param args:    Arguments of the function.
+
+    :return: Started multiprocessing.Process.
+    """
+    nodeProcess = multiprocessing.Process(target=target, args=args)
+    if (NODE_PROCESSES_IMPORT_MAIN_MODULE or any(isDefinedInMainModule(obj) for obj in ((target,) + tuple(args)))):
+        nodeProcess.start()
+        return nodeProcess
+
+    # The spawn start method tells the child to import whatever module is the main module when the process starts, so
+    # make that this one until the child has been started
+    mainModule = sys.modules["__main__"]
+    sys.modules["__main__"] = sys.modules[__name__]
+    try:
+        nodeProcess.start()
+    finally:
+        sys.modules["__main__"] = mainModule
+    return nodeProcess
@@ -0,0 +1,163 @@
+import copy
+import multiprocessing
+import queue
+from network_messages import *
+from network_node import *
+from node_process import *
+from shared_memory_transport import *
+
+# Ways the pool and its workers can exchange messages (the same as the network manager's transports)
+QUEUE_WORKER_TRANSPORT = "queue"
+SHARED_MEMORY_WORKER_TRANSPORT = "shared_memory"
+
+# Seconds to wait for a worker to report that its node stopped before checking that the worker is still alive
+NODE_STOP_POLL_SEC = 1.0
+
+
+class NodeWorkerPool:
+    """
+    Pool of processes that run the nodes of one network manager after another.
+
+    Starting a process for every node of every experiment means re-importing the project (and numpy) in each of them,
+    which dominates sweeps of short experiments. A network manager created with a pool instead sends each node to one
+    of the pool's workers (see RunNodeCommand), so the node count, m values, latency config and node class can all
+    change between experiments without starting any process. Each worker keeps its channels for its whole life, and the
+    pool keeps consensus round identifiers increasing across network managers so that messages still in flight from an
+    earlier experiment are dropped as stale.
+
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, numWorkers=0, messageTransport=QUEUE_WORKER_TRANSPORT):
+        """
+        Start the pool.
+
+        :param numWorkers:          Number of workers to start now. More are started when a network manager needs them.
+        :param messageTransport:    How the network manager and nodes exchange messages (QUEUE_WORKER_TRANSPORT or
+                                    SHARED_MEMORY_WORKER_TRANSPORT). Network managers using the pool must use the same.
+        """
+        if (messageTransport not in [QUEUE_WORKER_TRANSPORT, SHARED_MEMORY_WORKER_TRANSPORT]):
+            print("Unknown message transport " + str(messageTransport))
+            exit(1)
+        self.messageTransport = messageTransport
+        self.toWorkerQueues = []
+        self.fromWorkerQueues = []
+        self.peerInboxes = []
+        self.processes = []
+        # Identifier of the last consensus round run on the pool's workers
+        self.lastRoundId = 0
+        # True while a network manager is using the workers
+        self.inUse = False
+        self.ensureWorkers(numWorkers)
+
+    def createMessageChannel(self):
+        """
+        Create a channel for messages in one direction between a network manager and a worker.
+
+        :return: Object with the put/get interface of a multiprocessing.Queue for the pool's transport.
+        """
+        if (self.messageTransport == SHARED_MEMORY_WORKER_TRANSPORT):
+            return SharedMemoryRingBuffer()
+        return multiprocessing.Queue()
+
+    def ensureWorkers(self, numWorkers):
+        """
+        Start workers until the pool has at least the given number.
+
+        Every worker gets the inboxes of the workers that exist when it starts, so adding workers restarts the existing
+        ones (between experiments) to give them the new inboxes.
+
+        :param numWorkers:  Number of workers needed.
+        """
+        if (numWorkers <= len(self.processes)):
+            return
+        self.stopWorkers()
+        self.peerInboxes += [multiprocessing.Queue() for i in range(numWorkers - len(self.peerInboxes))]
+        for workerNum in range(numWorkers):
+            if (workerNum == len(self.toWorkerQueues)):
+                self.toWorkerQueues.append(self.createMessageChannel())
+                self.fromWorkerQueues.append(self.createMessageChannel())
+            self.processes.append(startNodeProcess(runNodeWorker, (
+                workerNum, self.toWorkerQueues[workerNum], self.fromWorkerQueues[workerNum], self.peerInboxes)))
+
+    def acquireWorkers(self, numNodes, messageTransport):
+        """
+        Reserve workers for a network manager's nodes.
+
+        :param numNodes:            Number of nodes in the network.
+        :param messageTransport:    Transport the network manager uses. Must be the pool's transport.
+
+        :return: Tuple of the channels to the nodes, the channels from the nodes and the peer inboxes, each indexed by
+        node number.
+        """
+        if (messageTransport != self.messageTransport):
+            print("Node worker pool uses the " + str(self.messageTransport) + " transport, not " + str(
+                messageTransport))
+            exit(1)
+        if (self.inUse):
+            print("Node worker pool is already in use by another network manager")
+            exit(1)
+        self.ensureWorkers(numNodes)
+        self.inUse = True
+        return (self.toWorkerQueues[:numNodes], self.fromWorkerQueues[:numNodes], self.peerInboxes[:numNodes])
+
+    def startNode(self, node):
+        """
+        Start running a node on the worker with its node number.
+
+        :param node:    NetworkNode to run. Its queues are replaced by the worker's.
+        """
+        # Queues can only be given to a process when it starts, so send a copy of the node without them (the copy is
+        # pickled later, by the queue's feeder thread)
+        nodeToSend = copy.copy(node)
+        nodeToSend.incomingMsgQueue, nodeToSend.outgoingMsgQueue = None, None
+        if (node.peerDeliveryShim is not None):
+            nodeToSend.peerDeliveryShim = copy.copy(node.peerDeliveryShim)
+            nodeToSend.peerDeliveryShim.peerInboxes = None
+        self.toWorkerQueues[node.nodeNum].put(RunNodeCommand(nodeToSend))
+
+    def waitForNodesToStop(self, numNodes):
+        """
+        Wait until the nodes of the network manager using the pool have shut down (after they were sent a
+        ShutdownNodeMessage), discarding anything else they sent, and release the workers.
+
+        :param numNodes:    Number of nodes in the network.
+        """
+        for workerNum in range(numNodes):
+            while True:
+                try:
+                    msg = self.fromWorkerQueues[workerNum].get(timeout=NODE_STOP_POLL_SEC)
+                except queue.Empty:
+                    if (not self.processes[workerNum].is_alive()):
+                        print("Node worker " + str(workerNum) + " exited unexpectedly")
+                        exit(1)
+                    continue
+                if (isinstance(msg, NodeStoppedMessage)):
+                    break
+        self.inUse = False
+
+    def stopWorkers(self):
+        """
+        Tell every worker to exit and wait for them to finish.
+        """
+        for workerNum in range(len(self.processes)):
+            self.toWorkerQueues[workerNum].put(StopNodeWorkerMessage())
+        for workerProcess in self.processes:
+            workerProcess.join()
+        self.processes = []
+
+    def close(self):
+        """
+        Stop the workers and release the channels.
+        """
+        self.stopWorkers()
+        if (self.messageTransport == SHARED_MEMORY_WORKER_TRANSPORT):
+            for ringBuffer in (self.toWorkerQueues + self.fromWorkerQueues):
+                ringBuffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
@@ -0,0 +1,249 @@
+import bisect
+import math
+from collections import deque
+from statistics import NormalDist
+import numpy as np
+
+# Compression of a TDigest: roughly the number of centroids kept. Higher is more accurate and slower.
+DEFAULT_TDIGEST_COMPRESSION = 100
+
+# Number of values a TDigest buffers before merging them into its centroids
+TDIGEST_BUFFER_FACTOR = 5
+
+
+class RunningStatistics:
+    """
+    Mean and variance of a stream of values, updated one value at a time with Welford's algorithm so no values need to
+    be kept.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # Sum of squared differences from the current mean
+        self.sumSquaredDiffs = 0.0
+
+    def addValue(self, value):
+        """
+        Add a value to the stream.
+
+        :param value:   Value to add.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.sumSquaredDiffs += delta * (value - self.mean)
+
+    def getVariance(self):
+        """
+        Get the sample variance of the values added so far.
+
+        :return: Sample variance, or infinity with fewer than 2 values.
+        """
+        if (self.count < 2):
+            return math.inf
+        return self.sumSquaredDiffs / (self.count - 1)
+
+    def getConfidenceIntervalWidth(self, confidenceLevel):
+        """
+        Get the full width of the normal-approximation confidence interval for the mean.
+
+        :param confidenceLevel: Probability that the interval contains the true mean (e.g. 0.95).
+
+        :return: Width of the interval, or infinity with fewer than 2 values.
+        """
+        if (self.count < 2):
+            return math.inf
+        zScore = NormalDist().inv_cdf(0.5 + (confidenceLevel / 2))
+        return 2 * zScore * math.sqrt(self.getVariance() / self.count)
+
+
+class TDigest:
+    """
+    Streaming quantile sketch (a merging t-digest). Values are summarised by weighted centroids that are small near the
+    tails, so extreme quantiles (e.g. p99) stay accurate while the sketch stays a fixed size. Digests can be merged, and
+    their weights scaled down to discount old values.
+    """
+
+    def __init__(self, compression=DEFAULT_TDIGEST_COMPRESSION):
+        """
+        Create an empty digest.
+
+        :param compression: Roughly the number of centroids kept (see DEFAULT_TDIGEST_COMPRESSION).
+        """
+        self.compression = compression
+        self.centroidMeans = np.empty(0)
+        self.centroidWeights = np.empty(0)
+        self.unmergedValues = []
+        self.unmergedWeights = []
+        self.totalWeight = 0.0
+        self.minValue = math.inf
+        self.maxValue = -math.inf
+
+    def addValue(self, value, weight=1.0):
+        """
+        Add a value to the digest.
+
+        :param value:   Value to add.
+        :param weight:  Weight of the value.
+        """
+        self.unmergedValues.append(value)
+        self.unmergedWeights.append(weight)
+        self.totalWeight += weight
+        self.minValue = min(self.minValue, value)
+        self.maxValue = max(self.maxValue, value)
+        if (len(self.unmergedValues) >= (TDIGEST_BUFFER_FACTOR * self.compression)):
+            self.compress()
+
+    def getScale(self, quantile):
+        # Scale function k1 of the t-digest paper: centroids may cover one unit of it, which is little near 0 and 1
+        return (self.compression / (2 * math.pi)) * math.asin((2 * quantile) - 1)
+
+    def getQuantileOfScale(self, scale):
+        return (math.sin((2 * math.pi * scale) / self.compression) + 1) / 2
+
+    def compress(self):
+        """
+        Merge the buffered values into the centroids.
+        """
+        if (len(self.unmergedValues) == 0):
+            return
+        means = np.concatenate((self.centroidMeans, self.unmergedValues))
+        weights = np.concatenate((self.centroidWeights, self.unmergedWeights))
+        self.unmergedValues = []
+        self.unmergedWeights = []
+        order = np.argsort(means, kind="stable")
+        means = means[order].tolist()
+        weights = weights[order].tolist()
+        totalWeight = sum(weights)
+
+        mergedMeans = []
+        mergedWeights = []
+        currentMean, currentWeight = means[0], weights[0]
+        # Weight of the centroids before the current one, and the most the current one can reach before it is full
+        weightBefore = 0.0
+        weightLimit = totalWeight * self.getQuantileOfScale(self.getScale(0.0) + 1)
+        for mean, weight in zip(means[1:], weights[1:]):
+            if ((weightBefore + currentWeight + weight) <= weightLimit):
+                currentWeight += weight
+                currentMean += (mean - currentMean) * (weight / currentWeight)
+                continue
+            mergedMeans.append(currentMean)
+            mergedWeights.append(currentWeight)
+            weightBefore += currentWeight
+            weightLimit = totalWeight * self.getQuantileOfScale(
+                self.getScale(min(weightBefore / totalWeight, 1.0)) + 1)
+            currentMean, currentWeight = mean, weight
+        mergedMeans.append(currentMean)
+        mergedWeights.append(currentWeight)
+        self.centroidMeans = np.array(mergedMeans)
+        self.centroidWeights = np.array(mergedWeights)
+        self.totalWeight = totalWeight
+
+    def getQuantile(self, quantile):
+        """
+        Estimate a quantile of the values added.
+
+        :param quantile:    Quantile to estimate, from 0 to 1.
+
+        :return: Estimated value at the quantile, or NaN if the digest is empty.
+        """
+        self.compress()
+        if (len(self.centroidMeans) == 0):
+            return math.nan
+        # Each centroid's mean sits at the middle of the cumulative weight it covers, with the smallest and largest
+        # values at either end. Only fractions of the total weight are compared, so scaling every weight by the same
+        # factor (see scaleWeights) doesn't change any quantile.
+        centroidMidWeights = np.cumsum(self.centroidWeights) - (self.centroidWeights / 2)
+        return float(np.interp(quantile * self.totalWeight,
+                               np.concatenate(([0.0], centroidMidWeights, [self.totalWeight])),
+                               np.concatenate(([self.minValue], self.centroidMeans, [self.maxValue]))))
+
+    def scaleWeights(self, factor):
+        """
+        Scale the weight of every value added so far, e.g. to discount them before adding new ones.
+
+        :param factor:  Factor to multiply the weights by.
+        """
+        self.compress()
+        self.centroidWeights = self.centroidWeights * factor
+        self.totalWeight *= factor
+        if (len(self.centroidMeans) > 0):
+            # The exact smallest and largest values are only kept for values added since the weights were last scaled,
+            # so that an old outlier doesn't stay the end of the tail forever
+            self.minValue = float(self.centroidMeans[0])
+            self.maxValue = float(self.centroidMeans[-1])
+
+    def merge(self, otherDigest):
+        """
+        Add the values summarised by another digest.
+
+        :param otherDigest: TDigest to add.
+        """
+        otherDigest.compress()
+        self.unmergedValues.extend(otherDigest.centroidMeans.tolist())
+        self.unmergedWeights.extend(otherDigest.centroidWeights.tolist())
+        self.totalWeight += otherDigest.totalWeight
+        self.minValue = min(self.minValue, otherDigest.minValue)
+        self.maxValue = max(self.maxValue, otherDigest.maxValue)
+        self.compress()
+
+
+class SlidingWindowStatistics:
+    """
+    Mean and exact quantiles of the most recent values of a stream.
+    """
+
+    def __init__(self, windowSize):
+        """
+        Create an empty window.
+
+        :param windowSize:  Number of most recent values kept.
+        """
+        self.windowValues = deque(maxlen=windowSize)
+        # The values in the window, sorted
+        self.sortedValues = []
+        self.windowSum = 0.0
+
+    def addValue(self, value):
+        """
+        Add a value, dropping the oldest one if the window is full.
+
+        :param value:   Value to add.
+        """
+        if (len(self.windowValues) == self.windowValues.maxlen):
+            oldestValue = self.windowValues[0]
+            del self.sortedValues[bisect.bisect_left(self.sortedValues, oldestValue)]
+            self.windowSum -= oldestValue
+        self.windowValues.append(value)
+        bisect.insort(self.sortedValues, value)
+        self.windowSum += value
+
+    def getCount(self):
+        return len(self.windowValues)
+
+    def getMean(self):
+        """
+        Get the mean of the values in the window.
+
+        :return: Mean, or NaN if the window is empty.
+        """
+        if (len(self.windowValues) == 0):
+            return math.nan
+        return self.windowSum / len(self.windowValues)
+
+    def getQuantile(self, quantile):
+        """
+        Get a quantile of the values in the window, interpolating linearly between values.
+
+        :param quantile:    Quantile to get, from 0 to 1.
+
+        :return: Value at the quantile, or NaN if the window is empty.
+        """
+        if (len(self.sortedValues) == 0):
+            return math.nan
+        position = quantile * (len(self.sortedValues) - 1)
+        lowerIdx = int(position)
+        upperIdx = min(lowerIdx + 1, len(self.sortedValues) - 1)
+        fraction = position - lowerIdx
+        return self.sortedValues[lowerIdx] + ((self.sortedValues[upperIdx] - self.sortedValues[lowerIdx]) * fraction)
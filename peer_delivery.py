@@ -0,0 +1,117 @@
+import heapq
+import queue
+from byzantine_faults import *
+from fault_models import *
+from project_utils import *
+from round_fault_tables import *
+
+
+class PeerDeliveryShim:
+    """
+    Sender-side shim used when nodes deliver consensus messages directly to each other instead of relaying them
+    through the network manager.
+
+    When sending, the shim injects the Byzantine corruption (if this node is faulty in the current round) and the
+    network latency, and puts the message straight into the destination node's inbox tagged with the time at which it
+    should be delivered. When receiving, the shim holds messages from this node's inbox until their delivery time.
+    """
+
+    def __init__(self, nodeNum, peerInboxes, networkLatencyConfig, randomGenerator, dropMessagePercent=0.0):
+        """
+        Create the shim.
+
+        :param nodeNum:                 Number of the node that owns the shim.
+        :param peerInboxes:             Inbox queue for every node, indexed by node number. Each inbox holds tuples of
+                                        (delivery time in milliseconds, ConsensusMessage).
+        :param networkLatencyConfig:    Configuration for the network latency to inject.
+        :param randomGenerator:         numpy Generator used for the injected latency and corruption.
+        :param dropMessagePercent:      Fraction (0 to 1) of relayed messages that should be dropped while this node is
+                                        faulty.
+        """
+        self.nodeNum = nodeNum
+        self.peerInboxes = peerInboxes
+        self.networkLatencyConfig = networkLatencyConfig
+        self.randomGenerator = randomGenerator
+        self.dropMessagePercent = dropMessagePercent
+        # True if this node should exhibit Byzantine faults in the current round
+        self.isFaulty = False
+        # RoundFaultPlan for the current round while this node is faulty
+        self.faultPlan = None
+        # RoundFaultTables with the latency and faults of this node's messages, or None to draw them as they are sent
+        self.faultTables = None
+        # Heap of (delivery time, message) for messages that have reached this node's inbox but aren't due yet
+        self.undeliveredMessages = []
+
+    def startRound(self, roundId, isFaulty, faultPlan=None, faultTables=None):
+        """
+        Set up the faults to inject in the round that is starting.
+
+        :param roundId:     Identifier of the round.
+        :param isFaulty:    True if the node's outgoing messages should be corrupted.
+        :param faultPlan:   RoundFaultPlan with the faults to inject if the node is faulty.
+        :param faultTables: RoundFaultTables to use from this round on, or None to keep using the current ones.
+        """
+        self.isFaulty = isFaulty
+        self.faultPlan = faultPlan
+        if (faultTables is not None):
+            if (self.faultTables is not None):
+                self.faultTables.close()
+            self.faultTables = faultTables
+        if (self.faultTables is not None):
+            self.faultTables.startRound(roundId)
+
+    def send(self, msg):
+        """
+        Send a consensus message directly to its destination, with corruption and latency applied.
+
+        :param msg: Consensus message (uncorrupted) to send.
+        """
+        messageFaults = None
+        if (self.faultTables is not None):
+            messageFaults = self.faultTables.takeMessageFaults(self.nodeNum, msg.destNodeId,
+                                                               len(msg.commandingGeneralChain))
+        if (messageFaults is not None):
+            msgDelay, isLie = messageFaults
+            if (isLie):
+                msg.content = self.faultPlan.getLieContent(msg.content, self.randomGenerator)
+        else:
+            # Not in the round fault tables, so draw the message's latency and faults now
+            msgDelay = sampleMessageDelay(self.networkLatencyConfig, self.randomGenerator)
+            if (self.isFaulty):
+                if (shouldDropMessage(msg, self.dropMessagePercent, self.randomGenerator)):
+                    return
+                msg.content, msgDelay = self.faultPlan.applyFaults(msg, self.nodeNum, msg.destNodeId, msgDelay,
+                                                                   self.randomGenerator)
+        if (msgDelay is None):
+            return
+        deliveryTime = getCurrentTimeMillis() + msgDelay
+        self.peerInboxes[msg.destNodeId].put((deliveryTime, msg))
+
+    def getDueMessages(self):
+        """
+        Get the messages sent to this node whose delivery time has passed.
+
+        :return: List of consensus messages to deliver to the node, in delivery time order.
+        """
+        inbox = self.peerInboxes[self.nodeNum]
+        while True:
+            try:
+                heapq.heappush(self.undeliveredMessages, inbox.get_nowait())
+            except queue.Empty:
+                break
+
+        dueMessages = []
+        currentTime = getCurrentTimeMillis()
+        while (self.undeliveredMessages and (self.undeliveredMessages[0][0] < currentTime)):
+            dueMessages.append(heapq.heappop(self.undeliveredMessages)[1])
+        return dueMessages
+
+    def stop(self):
+        """
+        Stop using the inboxes. Messages that other nodes will never read must not keep this process from exiting.
+        """
+        for peerInbox in self.peerInboxes:
+            peerInbox.cancel_join_thread()
+        if (self.faultTables is not None):
+            self.faultTables.close()
+            self.faultTables = None
@@ -0,0 +1,64 @@
+import time
+
+# Index of the call count and of the total time in the per-phase stats
+PHASE_CALL_COUNT_IDX = 0
+PHASE_TOTAL_SEC_IDX = 1
+
+
+class PhaseInstrumentation:
+    """
+    Counters and monotonic-clock timers for the hot-path methods of a node or of the network manager.
+
+    Instrumentation is installed by replacing the chosen methods on a single object with timed wrappers. Nothing is
+    wrapped when instrumentation is off, so the disabled case costs nothing on the hot path. Times are inclusive (a
+    method's time includes the instrumented methods it calls).
+    """
+
+    def __init__(self):
+        # Map of phase name to [call count, total seconds] since the stats were last taken
+        self.phaseStats = {}
+
+    def wrap(self, phaseName, func):
+        """
+        Wrap a function so that its calls and the time spent in it are recorded under the given phase.
+
+        :param phaseName:   Name to record the calls under.
+        :param func:        Function to wrap.
+
+        :return: Wrapped function.
+        """
+        perfCounter = time.perf_counter
+
+        def timedFunc(*args, **kwargs):
+            startTime = perfCounter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats = self.phaseStats.get(phaseName)
+                if (stats is None):
+                    stats = [0, 0.0]
+                    self.phaseStats[phaseName] = stats
+                stats[PHASE_CALL_COUNT_IDX] += 1
+                stats[PHASE_TOTAL_SEC_IDX] += perfCounter() - startTime
+
+        return timedFunc
+
+    def instrumentMethods(self, obj, methodNames):
+        """
+        Replace the given methods of an object with timed versions.
+
+        :param obj:         Object to instrument.
+        :param methodNames: Names of the methods to instrument. Each is recorded as its own phase.
+        """
+        for methodName in methodNames:
+            setattr(obj, methodName, self.wrap(methodName, getattr(obj, methodName)))
+
+    def takeStats(self):
+        """
+        Get the stats collected since the last call and start collecting from scratch.
+
+        :return: Map of phase name to [call count, total seconds].
+        """
+        stats = self.phaseStats
+        self.phaseStats = {}
+        return stats
@@ -0,0 +1,52 @@
+import numpy as np
+
+# Subsystems that draw random numbers. Each gets its own stream so that changing how many numbers one of them draws
+# doesn't change the numbers drawn by the others. The values are part of each stream's seed, so they must not change.
+# True consensus values and the initial m value chosen in run_simulation
+CONSENSUS_VALUE_STREAM = 0
+# Faulty nodes and commanding general chosen by the network manager for each round
+FAULT_SELECTION_STREAM = 1
+# Message latency and corruption injected by the network manager
+MESSAGE_FAULT_STREAM = 2
+# Message latency and corruption injected by a node (with direct peer delivery). Has one stream per node.
+NODE_STREAM = 3
+# Random choices made when writing configs (byzantine_mab_config_writer)
+CONFIG_WRITER_STREAM = 4
+# Rounds sampled by the Monte Carlo surrogate (latency_surrogate)
+SURROGATE_STREAM = 5
+# Seeds of the replicas of an experiment (replication_harness)
+REPLICATION_STREAM = 6
+
+
+class RandomStreams:
+    """
+    Hierarchy of independent random number generators derived from a single seed.
+
+    Each subsystem (and, for per-node streams, each node) gets a numpy Generator seeded from a child of the root
+    SeedSequence, so a run is reproduced exactly by reusing its seed.
+    """
+
+    def __init__(self, seed=None):
+        """
+        Create the streams.
+
+        :param seed:    Root seed (non-negative int). If None, a seed is drawn from the OS; it is available in
+                        self.seed so the run can be repeated.
+        """
+        rootSeedSequence = np.random.SeedSequence(seed)
+        # Seed actually used (the drawn one if no seed was given)
+        self.seed = rootSeedSequence.entropy
+
+    def getGenerator(self, stream, index=None):
+        """
+        Get a generator for a subsystem.
+
+        :param stream:  Subsystem to get the generator for (one of the *_STREAM constants).
+        :param index:   Index within the subsystem (e.g. node number) for subsystems that have one stream per entity,
+                        or None.
+
+        :return: numpy Generator. Every call with the same arguments returns a generator that produces the same
+        sequence.
+        """
+        spawnKey = (stream,) if (index is None) else (stream, index)
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=spawnKey))
@@ -0,0 +1,118 @@
+import math
+import sys
+import joblib
+from byzantine_mab_configs import *
+from network_manager import *
+from run_simulation import createSingleRoundResults
+from byzantine_mab_results import *
+
+
+class ReplayNetworkManager(NetworkManager):
+    """
+    Network manager that re-runs the rounds of a message trace (see message_trace) instead of sampling them.
+
+    Each round uses the recorded commanding general, faulty nodes and m value, and each consensus message is delivered
+    with the recorded content and delay, so two versions of the nodes can be compared on the same fault and latency
+    schedule. Messages that weren't in the trace (e.g. if the protocol under test sends different messages) fall back
+    to sampled faults and latency and are counted in unmatchedMessageCount.
+    """
+
+    def __init__(self, messageTrace, sleepBetweenNodeProcessingMs, messageTransport=QUEUE_MESSAGE_TRANSPORT,
+                 **kwargs):
+        """
+        Initialize the network described by the trace.
+
+        :param messageTrace:                    MessageTrace to replay.
+        :param sleepBetweenNodeProcessingMs:    Milliseconds for a node to sleep between checks of its queue.
+        :param messageTransport:                How messages are exchanged with the nodes.
+        :param kwargs:                          Other NetworkManager arguments.
+        """
+        self.messageTrace = messageTrace
+        # Index of the round of the trace that is being replayed
+        self.traceRoundIdx = -1
+        self.currentTraceRound = None
+        self.unmatchedMessageCount = 0
+
+        # Messages are delivered as recorded, so only the ones that aren't in the trace need their faults drawn
+        kwargs.setdefault("precomputeRoundFaults", False)
+        networkLatencyConfig = NetworkLatencyConfig(messageTrace.averageLatencyMs, messageTrace.latencyStdDevMs,
+                                                    messageTrace.maxLatencyMs)
+        NetworkManager.__init__(self, networkLatencyConfig, messageTrace.numNodes, messageTrace.defaultConsensusValue,
+                                messageTrace.rounds[0].mValues[0], 0.0, True, sleepBetweenNodeProcessingMs,
+                                messageTransport, valueSpace=messageTrace.valueSpace, **kwargs)
+
+    def canMessagesBeLost(self):
+        return any(math.isinf(tracedMessage.deliveryTimeMs) for tracedRound in self.messageTrace.rounds for
+                   tracedMessage in tracedRound.messages.values())
+
+    def updateFaultyNodes(self):
+        """
+        Move on to the next round of the trace and use its faulty nodes.
+        """
+        self.traceRoundIdx += 1
+        self.currentTraceRound = self.messageTrace.rounds[self.traceRoundIdx]
+        self.currentFaultyNodes = list(self.currentTraceRound.faultyNodes)
+
+    def getConsensusCommandingGeneralNum(self):
+        return self.currentTraceRound.commandingGeneral
+
+    def getDeliveredContentAndDelay(self, message, sender, dest):
+        tracedMessage = self.currentTraceRound.getMessage(message.commandingGeneralChain, dest)
+        if (tracedMessage is None):
+            self.unmatchedMessageCount += 1
+            return NetworkManager.getDeliveredContentAndDelay(self, message, sender, dest)
+        if (math.isinf(tracedMessage.deliveryTimeMs)):
+            # Dropped when the trace was recorded
+            return tracedMessage.content, None
+        return tracedMessage.content, tracedMessage.getDelayMs()
+
+
+def replayMessageTrace(replayNetworkManager):
+    """
+    Run every round of a trace.
+
+    :param replayNetworkManager:    ReplayNetworkManager for the trace.
+
+    :return: FullResults for the replayed rounds.
+    """
+    fullResults = FullResults()
+    for tracedRound in replayNetworkManager.messageTrace.rounds:
+        mValue = tracedRound.mValues[0]
+        if (mValue != replayNetworkManager.consensusTolerance):
+            replayNetworkManager.setConsensusTolerance(mValue)
+        replayNetworkManager.updateFaultyNodes()
+
+        latencies, consensuses, currentFaultyNodes = \
+            replayNetworkManager.startConsensusAndGetNodeLatenciesAndDecisions(tracedRound.trueConsensusValue)
+        resultsForRound = createSingleRoundResults(latencies, consensuses, currentFaultyNodes,
+                                                   tracedRound.trueConsensusValue,
+                                                   replayNetworkManager.valueSpace.batchSize,
+                                                   replayNetworkManager.lastRoundTimeoutCounts)
+        fullResults.addRoundResults(resultsForRound, len(currentFaultyNodes), mValue,
+                                    replayNetworkManager.lastRoundPhaseStats)
+    return fullResults
+
+
+if __name__ == "__main__":
+
+    multiprocessing.set_start_method('spawn')
+
+    if ((len(sys.argv) != 3) and (len(sys.argv) != 4)):
+        print("Arguments must be the message trace file, the results output file and optionally the milliseconds for "
+              "a node to sleep between checks of its queue")
+        exit(1)
+    messageTraceFile = sys.argv[1]
+    resultsOutputFile = sys.argv[2]
+    sleepBetweenNodeProcessingMs = 0.1
+    if (len(sys.argv) == 4):
+        sleepBetweenNodeProcessingMs = float(sys.argv[3])
+
+    messageTrace = readMessageTrace(messageTraceFile)
+    replayNetworkManager = ReplayNetworkManager(messageTrace, sleepBetweenNodeProcessingMs)
+    fullResults = replayMessageTrace(replayNetworkManager)
+    replayNetworkManager.shutdown()
+
+    print("Replayed " + str(len(messageTrace.rounds)) + " rounds (" + str(
+        replayNetworkManager.unmatchedMessageCount) + " messages not in the trace)")
+    joblib.dump(fullResults, resultsOutputFile)
+    print("Done with replay!")
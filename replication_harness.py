@@ -0,0 +1,201 @@
+import multiprocessing
+import queue
+import sys
+import joblib
+import numpy as np
+from byzantine_mab_configs import *
+from online_statistics import *
+from random_streams import *
+from run_simulation import SimulationSession
+
+# Metrics computed for each replica
+# Fraction of the conservative m value's mean round latency saved by the multi-armed bandit
+LATENCY_SAVINGS_METRIC = "latency_savings"
+# Fraction of the multi-armed bandit's rounds in which the non-faulty nodes didn't agree
+FAILURE_RATE_METRIC = "failure_rate"
+# Fraction of the multi-armed bandit's rounds in which the chosen m value was at least the true number of faulty nodes
+PERCENT_SAFE_M_METRIC = "percent_safe_m"
+REPLICATION_METRICS = [LATENCY_SAVINGS_METRIC, FAILURE_RATE_METRIC, PERCENT_SAFE_M_METRIC]
+
+# Fewest replicas before the confidence intervals are trusted to stop early (the normal approximation used for the
+# intervals is poor with fewer)
+MIN_REPLICAS_TO_STOP = 5
+
+# Seconds to wait for a replica to finish before checking whether any replica process died
+REPLICA_POLL_SEC = 1.0
+
+
+class ReplicationResults:
+    """
+    Results of running replicas of an experiment with different seeds.
+    """
+
+    def __init__(self, confidenceLevel):
+        """
+        Initialize the results.
+
+        :param confidenceLevel: Confidence level of the intervals reported for each metric.
+        """
+        self.confidenceLevel = confidenceLevel
+        # RunningStatistics for each metric (REPLICATION_METRICS)
+        self.statisticsByMetric = {metric: RunningStatistics() for metric in REPLICATION_METRICS}
+        # Seed of each finished replica, in order of finishing
+        self.replicaSeeds = []
+        # Map of metric to value for each finished replica, in the same order
+        self.replicaMetrics = []
+        # True if replicas stopped being started because every confidence interval was narrow enough
+        self.stoppedEarly = False
+
+    def addReplicaMetrics(self, replicaSeed, metrics):
+        """
+        Add the metrics of a finished replica.
+
+        :param replicaSeed: Seed that the replica was run with.
+        :param metrics:     Map of metric to the replica's value.
+        """
+        self.replicaSeeds.append(replicaSeed)
+        self.replicaMetrics.append(metrics)
+        for metric, value in metrics.items():
+            self.statisticsByMetric[metric].addValue(value)
+
+    def getWidestConfidenceInterval(self):
+        """
+        Get the widest confidence interval of the metrics.
+
+        :return: Full width of the widest interval.
+        """
+        return max(statistics.getConfidenceIntervalWidth(self.confidenceLevel) for statistics in
+                   self.statisticsByMetric.values())
+
+    def getSummary(self):
+        """
+        Get a description of the mean and confidence interval of each metric.
+
+        :return: One line for each metric.
+        """
+        lines = []
+        for metric, statistics in self.statisticsByMetric.items():
+            lines.append("%-16s %.4f +/- %.4f (%d replicas)" % (
+                metric, statistics.mean, statistics.getConfidenceIntervalWidth(self.confidenceLevel) / 2,
+                statistics.count))
+        return "\n".join(lines)
+
+
+def getReplicaMetrics(adaptiveResults, conservativeResults):
+    """
+    Compute the metrics of a replica.
+
+    :param adaptiveResults:     FullResults of the run that chose m with the multi-armed bandit.
+    :param conservativeResults: FullResults of the run with the same seed that used the conservative m value throughout.
+
+    :return: Map of metric (REPLICATION_METRICS) to value.
+    """
+    adaptiveMetrics = adaptiveResults.getRoundMetrics()
+    conservativeMetrics = conservativeResults.getRoundMetrics()
+    return {
+        LATENCY_SAVINGS_METRIC: float(1.0 - (adaptiveMetrics.getAverageRoundLatency() /
+                                             conservativeMetrics.getAverageRoundLatency())),
+        FAILURE_RATE_METRIC: float(adaptiveMetrics.getFailureRate()),
+        PERCENT_SAFE_M_METRIC: float(adaptiveMetrics.getPercentSafeM()),
+    }
+
+
+def runReplica(superConfig, replicaSeed, conservativeM, resultQueue):
+    """
+    Run one replica: the experiment with the multi-armed bandit and with the conservative m value, both with the same
+    seed so that they see the same faults and consensus values. Run in its own process.
+
+    :param superConfig:     SuperConfig of the experiment.
+    :param replicaSeed:     Seed for the replica's random streams.
+    :param conservativeM:   M value to compare the multi-armed bandit against.
+    :param resultQueue:     Queue to put a tuple of the seed and the replica's metrics on.
+    """
+    with SimulationSession(superConfig.getRunConfig().numNodes) as session:
+        adaptiveResults = session.runSimulation(superConfig, randomSeed=replicaSeed)
+        conservativeResults = session.runSimulation(superConfig, conservativeM, replicaSeed)
+    resultQueue.put((replicaSeed, getReplicaMetrics(adaptiveResults, conservativeResults)))
+
+
+def runReplicas(superConfig, maxReplicas, numParallel, targetWidth, confidenceLevel=0.95, conservativeM=None,
+                seed=None):
+    """
+    Run replicas of an experiment in parallel until the confidence interval of every metric is narrower than the target
+    width or the maximum number of replicas have run. Replicas that are already running when the target is reached are
+    still included.
+
+    :param superConfig:     SuperConfig of the experiment.
+    :param maxReplicas:     Largest number of replicas to run.
+    :param numParallel:     Number of replicas to run at once. Each replica runs its own network of node processes.
+    :param targetWidth:     Full width of the confidence intervals at which no more replicas are started.
+    :param confidenceLevel: Confidence level of the intervals.
+    :param conservativeM:   M value to compare the multi-armed bandit against, or None for the largest possible m value.
+    :param seed:            Seed that the replica seeds are drawn from, or None to draw one.
+
+    :return: ReplicationResults.
+    """
+    if (conservativeM is None):
+        conservativeM = max(superConfig.getRunConfig().possibleMValues)
+    randomStreams = RandomStreams(seed)
+    print("Using replication seed " + str(randomStreams.seed))
+    replicaSeeds = randomStreams.getGenerator(REPLICATION_STREAM).integers(np.iinfo(np.int64).max,
+                                                                           size=maxReplicas).tolist()
+
+    replicationResults = ReplicationResults(confidenceLevel)
+    resultQueue = multiprocessing.Queue()
+    runningProcesses = {}
+    nextReplicaIdx = 0
+    while ((nextReplicaIdx < maxReplicas) or (len(runningProcesses) != 0)):
+        while ((not replicationResults.stoppedEarly) and (nextReplicaIdx < maxReplicas) and (
+                len(runningProcesses) < numParallel)):
+            replicaSeed = replicaSeeds[nextReplicaIdx]
+            replicaProcess = multiprocessing.Process(target=runReplica,
+                                                     args=(superConfig, replicaSeed, conservativeM, resultQueue))
+            replicaProcess.start()
+            runningProcesses[replicaSeed] = replicaProcess
+            nextReplicaIdx += 1
+        if (len(runningProcesses) == 0):
+            break
+
+        try:
+            replicaSeed, metrics = resultQueue.get(timeout=REPLICA_POLL_SEC)
+        except queue.Empty:
+            for replicaSeed, replicaProcess in runningProcesses.items():
+                if ((replicaProcess.exitcode is not None) and (replicaProcess.exitcode != 0)):
+                    print("Replica with seed " + str(replicaSeed) + " failed with exit code " + str(
+                        replicaProcess.exitcode))
+                    exit(1)
+            continue
+        runningProcesses.pop(replicaSeed).join()
+        replicationResults.addReplicaMetrics(replicaSeed, metrics)
+        print("Finished replica " + str(len(replicationResults.replicaSeeds)) + ", widest confidence interval " + str(
+            replicationResults.getWidestConfidenceInterval()))
+
+        if ((nextReplicaIdx < maxReplicas) and (len(replicationResults.replicaSeeds) >= MIN_REPLICAS_TO_STOP) and (
+                replicationResults.getWidestConfidenceInterval() <= targetWidth)):
+            replicationResults.stoppedEarly = True
+    return replicationResults
+
+
+if __name__ == "__main__":
+
+    multiprocessing.set_start_method('spawn')
+
+    if ((len(sys.argv) < 4) or (len(sys.argv) > 7)):
+        print("Arguments must be the config file, the results output file, the maximum number of replicas and "
+              "optionally the number of replicas to run at once, the target confidence interval width and the seed")
+        exit(1)
+    superConfigFile = sys.argv[1]
+    resultsOutputFile = sys.argv[2]
+    maxReplicas = int(sys.argv[3])
+    numParallel = int(sys.argv[4]) if (len(sys.argv) > 4) else 2
+    targetWidth = float(sys.argv[5]) if (len(sys.argv) > 5) else 0.05
+    seed = int(sys.argv[6]) if (len(sys.argv) > 6) else None
+
+    superConfig = readSuperConfig(superConfigFile)
+    replicationResults = runReplicas(superConfig, maxReplicas, numParallel, targetWidth, seed=seed)
+    print(replicationResults.getSummary())
+    if (replicationResults.stoppedEarly):
+        print("Stopped after " + str(len(replicationResults.replicaSeeds)) + " of " + str(
+            maxReplicas) + " replicas")
+    joblib.dump(replicationResults, resultsOutputFile)
+    print("Done with replications!")
@@ -0,0 +1,192 @@
+import math
+import numpy as np
+from fault_models import *
+from shared_memory_transport import *
+
+# Header fields of the tables: identifier of the round the tables were drawn for and the longest commanding general
+# chain they cover
+FAULT_TABLES_ROUND_ID = 0
+FAULT_TABLES_CHAIN_LENGTH = 1
+FAULT_TABLES_HEADER_FIELDS = 2
+
+
+def getMessagesPerLink(numNodes, chainLength):
+    """
+    Get the number of consensus messages that one node sends to another in a round of OM(m) with the given commanding
+    general chain length (the chain includes the sender).
+
+    The chain starts with the commanding general and never repeats a node or contains the receiver, so the nodes between
+    the commanding general and the sender are an ordered choice from the other numNodes - 3 nodes.
+
+    :param numNodes:    Number of nodes in the network.
+    :param chainLength: Length of the commanding general chain of the messages.
+
+    :return: Number of messages.
+    """
+    if (chainLength == 1):
+        return 1
+    return math.perm(max(numNodes - 3, 0), chainLength - 2)
+
+
+class RoundFaultTables:
+    """
+    Latency and Byzantine faults of every consensus message of a round, drawn with NumPy when the round starts and
+    stored in shared memory.
+
+    Every message of a round is identified by its sender, its receiver, the length of its commanding general chain and
+    how many messages with that chain length the sender sent to the receiver before it. The tables have a slot for each
+    of these holding the message's delay (NaN if the message is dropped) and whether it carries a lie, with the faulty
+    senders' strategy (see RoundFaultPlan) already applied. The network manager, or the sending node with direct peer
+    delivery, takes the next slot of the link for each message it sends, so no random numbers are drawn and no fault
+    decisions are made per message. Only the process that sends on a link takes its slots, so the slot counts are
+    kept by each process for itself.
+
+    The creating process (the network manager) fills the tables. Other processes get a copy with pickle, which attaches
+    to the same shared memory.
+    """
+
+    def __init__(self, numNodes, maxChainLength):
+        """
+        Create the tables (and the shared memory backing them).
+
+        :param numNodes:        Number of nodes in the network.
+        :param maxChainLength:  Longest commanding general chain that the tables have room for (largest m value + 1).
+        """
+        self.numNodes = numNodes
+        self.maxChainLength = maxChainLength
+        self.computeLayout()
+        self.sharedMemory = shared_memory.SharedMemory(create=True, size=self.numBytes)
+        self.ownsSharedMemory = True
+        self.attachViews()
+        self.header[:] = 0
+
+    def computeLayout(self):
+        """
+        Work out where the slots of each commanding general chain length are.
+        """
+        # Number of slots of each link for each chain length. Index 0 is unused so that it is indexed by chain length.
+        self.messagesPerLink = [0] + [getMessagesPerLink(self.numNodes, chainLength) for chainLength in
+                                      range(1, self.maxChainLength + 1)]
+        # First slot of each chain length, indexed by chain length, followed by the total number of slots
+        self.chainLengthOffsets = [0] + np.cumsum(
+            [(self.numNodes ** 2) * messagesPerLink for messagesPerLink in self.messagesPerLink]).tolist()
+        self.numSlots = self.chainLengthOffsets[-1]
+        self.numBytes = (FAULT_TABLES_HEADER_FIELDS * 8) + (self.numSlots * 8) + self.numSlots
+
+    def attachViews(self):
+        """
+        Set up the views onto the shared memory and start with no slots taken.
+        """
+        buffer = self.sharedMemory.buf
+        self.header = np.ndarray(FAULT_TABLES_HEADER_FIELDS, dtype=np.int64, buffer=buffer)
+        delaysOffset = FAULT_TABLES_HEADER_FIELDS * 8
+        self.delays = np.ndarray(self.numSlots, dtype=np.float64, buffer=buffer, offset=delaysOffset)
+        self.lies = np.ndarray(self.numSlots, dtype=bool, buffer=buffer, offset=delaysOffset + (self.numSlots * 8))
+        # Map of the first slot of each link (sender, receiver and chain length) to the number of its slots taken
+        self.takenSlots = {}
+        self.roundId = None
+        self.filledChainLength = 0
+
+    def __getstate__(self):
+        # Only the name is sent to the other process, which attaches to the same block of shared memory
+        return (self.sharedMemory.name, self.numNodes, self.maxChainLength)
+
+    def __setstate__(self, state):
+        sharedMemoryName, self.numNodes, self.maxChainLength = state
+        self.computeLayout()
+        self.sharedMemory = attachSharedMemory(sharedMemoryName)
+        self.ownsSharedMemory = False
+        self.attachViews()
+
+    def fillRound(self, roundId, faultPlan, maxChainLength, networkLatencyConfig, dropMessagePercent,
+                  randomGenerator):
+        """
+        Draw the faults and latency of every message of a round.
+
+        :param roundId:                 Identifier of the round.
+        :param faultPlan:               RoundFaultPlan of the round.
+        :param maxChainLength:          Longest commanding general chain of the round (largest m value + 1). Must be
+                                        at most the tables' maxChainLength.
+        :param networkLatencyConfig:    Configuration for the network latency.
+        :param dropMessagePercent:      Fraction (0 to 1) of a faulty node's relayed messages that should be dropped.
+        :param randomGenerator:         numpy Generator to draw with.
+        """
+        numNodes = self.numNodes
+        isFaultySender = faultPlan.isFaulty[:, None, None]
+        hasFaultyNodes = bool(faultPlan.isFaulty.any())
+        for chainLength in range(1, maxChainLength + 1):
+            blockShape = (numNodes, numNodes, self.messagesPerLink[chainLength])
+            blockSlots = slice(self.chainLengthOffsets[chainLength], self.chainLengthOffsets[chainLength + 1])
+            # The same bounded normal distribution as sampleMessageDelay
+            delays = np.clip(randomGenerator.normal(networkLatencyConfig.averageLatencyMs,
+                                                    networkLatencyConfig.latencyStdDevMs, size=blockShape), 0,
+                             networkLatencyConfig.maxLatencyMs)
+            if (not hasFaultyNodes):
+                self.delays[blockSlots] = delays.ravel()
+                self.lies[blockSlots] = False
+                continue
+
+            # The decisions of RoundFaultPlan.applyFaults and shouldDropMessage, for every message at once
+            isDropped = (chainLength >= faultPlan.crashChainLength)[:, None, None]
+            if ((chainLength > 1) and (dropMessagePercent > 0)):
+                isDropped = isDropped | (randomGenerator.random(blockShape) < dropMessagePercent)
+            if (faultPlan.strategy == RANDOM_FAULT_STRATEGY):
+                isLie = randomGenerator.random(blockShape) < 0.5
+            else:
+                isLie = faultPlan.liesTo[:, :, None]
+            delays = np.where(faultPlan.delaysTo[:, :, None], faultPlan.maxLatencyMs, delays)
+            delays = np.where(isFaultySender & isDropped, np.nan, delays)
+            self.delays[blockSlots] = delays.ravel()
+            self.lies[blockSlots] = np.broadcast_to(isFaultySender & isLie, blockShape).ravel()
+
+        self.header[FAULT_TABLES_ROUND_ID] = roundId
+        self.header[FAULT_TABLES_CHAIN_LENGTH] = maxChainLength
+        self.startRound(roundId)
+
+    def startRound(self, roundId):
+        """
+        Start taking slots for a round.
+
+        :param roundId: Identifier of the round that is starting. If the tables weren't filled for it, no slots are
+                        taken in the round.
+        """
+        self.takenSlots.clear()
+        self.roundId = roundId
+        isFilledForRound = int(self.header[FAULT_TABLES_ROUND_ID]) == roundId
+        self.filledChainLength = int(self.header[FAULT_TABLES_CHAIN_LENGTH]) if isFilledForRound else 0
+
+    def takeMessageFaults(self, sender, dest, chainLength):
+        """
+        Take the next slot of a link for a message.
+
+        :param sender:      Node number of the sender.
+        :param dest:        Node number of the receiver.
+        :param chainLength: Length of the message's commanding general chain.
+
+        :return: Tuple of the delay in milliseconds before delivering the message (None if it is dropped) and True if
+        it carries a lie (see RoundFaultPlan.getLieContent), or None if the tables have no slot left for the message.
+        """
+        if (chainLength > self.filledChainLength):
+            return None
+        messagesPerLink = self.messagesPerLink[chainLength]
+        linkStart = self.chainLengthOffsets[chainLength] + (((sender * self.numNodes) + dest) * messagesPerLink)
+        takenSlots = self.takenSlots.get(linkStart, 0)
+        if (takenSlots == messagesPerLink):
+            return None
+        self.takenSlots[linkStart] = takenSlots + 1
+        delayMs = float(self.delays[linkStart + takenSlots])
+        if (math.isnan(delayMs)):
+            return None, False
+        return delayMs, bool(self.lies[linkStart + takenSlots])
+
+    def close(self):
+        """
+        Release this process's mapping of the shared memory. The creating process also removes the shared memory.
+        """
+        if (self.header is None):
+            return
+        # The shared memory can't be closed while views onto it exist
+        self.header, self.delays, self.lies = None, None, None
+        self.sharedMemory.close()
+        if (self.ownsSharedMemory):
+            self.sharedMemory.unlink()
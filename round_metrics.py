@@ -0,0 +1,304 @@
+from online_statistics import *
+from multiarmed_bandit_executor import getRoundReward, MAX_REWARDED_LATENCY_MS
+
+# Number of most recent rounds of each m value that the windowed statistics cover
+DEFAULT_METRICS_WINDOW_SIZE = 100
+
+# Latency quantiles shown in progress and reports
+REPORTED_LATENCY_QUANTILES = [0.5, 0.95, 0.99]
+
+
+class ArmMetrics:
+    """
+    Statistics of the rounds run with one m value, over the whole experiment and over its most recent rounds.
+    """
+
+    def __init__(self, windowSize):
+        """
+        Initialize the statistics.
+
+        :param windowSize:  Number of most recent rounds that the windowed statistics cover.
+        """
+        self.numRounds = 0
+        self.numFailures = 0
+        # Latency per value agreed on (see SingleRoundResults.getLatencyPerValue), over the whole experiment
+        self.latencyStatistics = RunningStatistics()
+        self.latencyDigest = TDigest()
+        # Latency per value and failure (1 if the round failed, 0 if not) of the most recent rounds
+        self.windowLatencies = SlidingWindowStatistics(windowSize)
+        self.windowFailures = SlidingWindowStatistics(windowSize)
+        # Sum of the latency per value over every round, capped like the multi-armed bandit's latency reward
+        self.cappedLatencyTotal = 0.0
+        # Map of the true number of faulty nodes to the number of rounds run with it and how many of them failed
+        self.roundsByFaultyCount = {}
+        self.failuresByFaultyCount = {}
+
+    def addRound(self, latencyPerValue, didFail, trueFaultyNodesCount):
+        """
+        Add a round run with the m value.
+
+        :param latencyPerValue:         Latency of the round per value agreed on, in milliseconds.
+        :param didFail:                 True if the non-faulty nodes didn't agree in the round.
+        :param trueFaultyNodesCount:    Number of faulty nodes in the round.
+        """
+        self.numRounds += 1
+        self.numFailures += int(didFail)
+        self.cappedLatencyTotal += min(latencyPerValue, MAX_REWARDED_LATENCY_MS)
+        self.roundsByFaultyCount[trueFaultyNodesCount] = self.roundsByFaultyCount.get(trueFaultyNodesCount, 0) + 1
+        self.failuresByFaultyCount[trueFaultyNodesCount] = self.failuresByFaultyCount.get(trueFaultyNodesCount,
+                                                                                         0) + int(didFail)
+        self.latencyStatistics.addValue(latencyPerValue)
+        self.latencyDigest.addValue(latencyPerValue)
+        self.windowLatencies.addValue(latencyPerValue)
+        self.windowFailures.addValue(float(didFail))
+
+    def getFailureRate(self):
+        return self.numFailures / self.numRounds
+
+    def getFailureRateWithFaultyCount(self, mValue, trueFaultyNodesCount):
+        """
+        Estimate the failure rate of the m value's rounds with the given number of faulty nodes.
+
+        :param mValue:                  The m value.
+        :param trueFaultyNodesCount:    Number of faulty nodes.
+
+        :return: Failure rate of the m value's rounds with that many faulty nodes. If it never ran with that many, 0 if
+        the m value tolerates them and 1 if it doesn't.
+        """
+        numRounds = self.roundsByFaultyCount.get(trueFaultyNodesCount, 0)
+        if (numRounds == 0):
+            return 0.0 if (mValue >= trueFaultyNodesCount) else 1.0
+        return self.failuresByFaultyCount[trueFaultyNodesCount] / numRounds
+
+
+class PeriodMetrics:
+    """
+    Statistics of the rounds since the multi-armed bandit last chose an m value (an observation period).
+    """
+
+    def __init__(self):
+        self.numRounds = 0
+        self.numFailures = 0
+        # M value of the period's rounds (of the last round, if it changed)
+        self.mValue = None
+        # Latency per value agreed on, over the rounds of the period
+        self.latencyStatistics = RunningStatistics()
+        self.latencyDigest = TDigest()
+        # Signals of faults seen in each round (see SingleRoundResults): the fraction of nodes that disagreed with the
+        # majority decision, the messages timed out per node and the spread of the nodes' latencies
+        self.disagreementStatistics = RunningStatistics()
+        self.timeoutStatistics = RunningStatistics()
+        self.latencySpreadStatistics = RunningStatistics()
+
+    def addRound(self, singleRoundResults, latencyPerValue, didFail):
+        """
+        Add a round of the period.
+
+        :param singleRoundResults:  SingleRoundResults of the round.
+        :param latencyPerValue:     Latency of the round per value agreed on, in milliseconds.
+        :param didFail:             True if the non-faulty nodes didn't agree in the round.
+        """
+        self.numRounds += 1
+        self.numFailures += int(didFail)
+        self.mValue = list(singleRoundResults.latenciesByNode.keys())[0]
+        self.latencyStatistics.addValue(latencyPerValue)
+        self.latencyDigest.addValue(latencyPerValue)
+        numNodes = singleRoundResults.getNumNodes()
+        self.disagreementStatistics.addValue(singleRoundResults.getDisagreeingNodesCount() / numNodes)
+        self.timeoutStatistics.addValue(singleRoundResults.getTimeoutCount() / numNodes)
+        self.latencySpreadStatistics.addValue(singleRoundResults.getLatencySpread())
+
+    def getFailureRate(self):
+        return (self.numFailures / self.numRounds) if (self.numRounds > 0) else 0.0
+
+    def getAverageLatency(self):
+        return self.latencyStatistics.mean
+
+
+class RoundMetricsStream:
+    """
+    Statistics of an experiment, updated as each round's results come in (see FullResults.addRoundResults) so that the
+    multi-armed bandit, the progress shown while running and the final report all read them instead of going over every
+    round again.
+
+    Keeps, for each m value, the latency per value agreed on (mean and quantiles) and the failure rate over the whole
+    experiment and over its most recent rounds, and the statistics of the current observation period. Regret is
+    measured in the multi-armed bandit's reward per round (see getRoundReward) against the best fixed m value in
+    hindsight (see getBestFixedM).
+    """
+
+    def __init__(self, windowSize=DEFAULT_METRICS_WINDOW_SIZE):
+        """
+        Initialize the stream.
+
+        :param windowSize:  Number of most recent rounds of each m value that the windowed statistics cover.
+        """
+        self.windowSize = windowSize
+        # ArmMetrics for each m value run so far
+        self.metricsByM = {}
+        self.numRounds = 0
+        self.numFailures = 0
+        # Number of rounds in which the m value was at least the true number of faulty nodes
+        self.numSafeRounds = 0
+        # Number of rounds with each true number of faulty nodes
+        self.roundsByFaultyCount = {}
+        # Sum of the capped latency per value (see ArmMetrics.cappedLatencyTotal) over every round that didn't fail
+        self.successCappedLatencyTotal = 0.0
+        # Sums over every round of the latency per value agreed on, the round latency and the values committed (agreed
+        # on in rounds that didn't fail)
+        self.totalLatencyPerValue = 0.0
+        self.totalRoundLatency = 0.0
+        self.committedValues = 0
+        self.periodMetrics = PeriodMetrics()
+
+    def addRound(self, singleRoundResults, trueFaultyNodesCount):
+        """
+        Add the results of a round.
+
+        :param singleRoundResults:      SingleRoundResults of the round. The latency and failure of its first m value
+                                        are used (see SingleRoundResults.getRoundLatency).
+        :param trueFaultyNodesCount:    Number of faulty nodes in the round.
+        """
+        mValue = list(singleRoundResults.latenciesByNode.keys())[0]
+        latencyPerValue = singleRoundResults.getLatencyPerValue()
+        didFail = bool(list(singleRoundResults.didFail.values())[0])
+
+        if (mValue not in self.metricsByM):
+            self.metricsByM[mValue] = ArmMetrics(self.windowSize)
+        self.metricsByM[mValue].addRound(latencyPerValue, didFail, trueFaultyNodesCount)
+        self.periodMetrics.addRound(singleRoundResults, latencyPerValue, didFail)
+
+        self.numRounds += 1
+        self.numFailures += int(didFail)
+        self.numSafeRounds += int(mValue >= trueFaultyNodesCount)
+        self.roundsByFaultyCount[trueFaultyNodesCount] = self.roundsByFaultyCount.get(trueFaultyNodesCount, 0) + 1
+        if (not didFail):
+            self.successCappedLatencyTotal += min(latencyPerValue, MAX_REWARDED_LATENCY_MS)
+        self.totalLatencyPerValue += latencyPerValue
+        self.totalRoundLatency += singleRoundResults.getRoundLatency()
+        if (not didFail):
+            self.committedValues += singleRoundResults.batchSize
+
+    def takePeriodMetrics(self):
+        """
+        Get the statistics of the observation period that just ended and start a new one.
+
+        :return: PeriodMetrics of the rounds since this was last called.
+        """
+        periodMetrics = self.periodMetrics
+        self.periodMetrics = PeriodMetrics()
+        return periodMetrics
+
+    def getExpectedRoundReward(self, mValue, multiArmedBanditConfig):
+        """
+        Estimate the mean reward per round (see getRoundReward) the m value would have earned if it had run every round
+        of the experiment. Its failure rate is estimated separately for each true number of faulty nodes (see
+        ArmMetrics.getFailureRateWithFaultyCount) and weighted by how many rounds had that many, so an m value that
+        only ran while there were few faulty nodes isn't credited with their low failure rate everywhere.
+
+        :param mValue:                  The m value.
+        :param multiArmedBanditConfig:  Configuration of the multi-armed bandit, for its rewards.
+
+        :return: Expected reward per round.
+        """
+        armMetrics = self.metricsByM[mValue]
+        failureRate = sum(armMetrics.getFailureRateWithFaultyCount(mValue, trueFaultyNodesCount) * numRounds for
+                          trueFaultyNodesCount, numRounds in self.roundsByFaultyCount.items()) / self.numRounds
+        latencyReward = getRoundReward(armMetrics.cappedLatencyTotal / armMetrics.numRounds, False,
+                                       multiArmedBanditConfig)
+        return (failureRate * multiArmedBanditConfig.failure_penalty) + ((1 - failureRate) * latencyReward)
+
+    def getBestFixedM(self, multiArmedBanditConfig):
+        """
+        Get the m value that would have earned the most reward if it had run every round (see getExpectedRoundReward).
+
+        :param multiArmedBanditConfig:  Configuration of the multi-armed bandit, for its rewards.
+
+        :return: Best m value, or None if no rounds have been added.
+        """
+        if (len(self.metricsByM) == 0):
+            return None
+        return max(self.metricsByM, key=lambda mValue: self.getExpectedRoundReward(mValue, multiArmedBanditConfig))
+
+    def getRegret(self, multiArmedBanditConfig):
+        """
+        Get how much less reward the experiment earned than the best fixed m value would have (see getBestFixedM).
+        Negative where the experiment did better.
+
+        :param multiArmedBanditConfig:  Configuration of the multi-armed bandit, for its rewards.
+
+        :return: Reward lost, summed over every round.
+        """
+        bestMValue = self.getBestFixedM(multiArmedBanditConfig)
+        if (bestMValue is None):
+            return 0.0
+        numSuccesses = self.numRounds - self.numFailures
+        # Sum of getRoundReward over every round
+        totalReward = (self.numFailures * multiArmedBanditConfig.failure_penalty) + (
+                numSuccesses * multiArmedBanditConfig.lat_rew_bias) - (
+                self.successCappedLatencyTotal * multiArmedBanditConfig.latency_scale)
+        return (self.numRounds * self.getExpectedRoundReward(bestMValue, multiArmedBanditConfig)) - totalReward
+
+    def getFailureRate(self):
+        return (self.numFailures / self.numRounds) if (self.numRounds > 0) else 0.0
+
+    def getAverageRoundLatency(self):
+        return (self.totalRoundLatency / self.numRounds) if (self.numRounds > 0) else 0.0
+
+    def getPercentSafeM(self):
+        return (self.numSafeRounds / self.numRounds) if (self.numRounds > 0) else 0.0
+
+    def getCommittedValuesPerSecond(self):
+        """
+        Get the throughput of the experiment: the number of values agreed on in rounds that didn't fail, divided by the
+        total latency of all rounds.
+
+        :return: Committed values per second, or 0 if no rounds were run.
+        """
+        if (self.totalRoundLatency == 0):
+            return 0
+        return self.committedValues / (self.totalRoundLatency / 1000.0)
+
+    def getProgressSummary(self, multiArmedBanditConfig):
+        """
+        Get a short description of the experiment so far, with the recent statistics of each m value.
+
+        :param multiArmedBanditConfig:  Configuration of the multi-armed bandit, for the regret.
+
+        :return: One line for the experiment and one for each m value.
+        """
+        lines = ["%d rounds  failure rate %.3f  safe m %.3f  regret %.3f reward per round (best fixed m %s)" % (
+            self.numRounds, self.getFailureRate(), self.getPercentSafeM(),
+            self.getRegret(multiArmedBanditConfig) / self.numRounds, self.getBestFixedM(multiArmedBanditConfig))]
+        for mValue in sorted(self.metricsByM, key=str):
+            armMetrics = self.metricsByM[mValue]
+            lines.append("  m=%-4s last %3d rounds: latency mean %8.2f ms  p95 %8.2f ms  failure rate %.3f" % (
+                mValue, armMetrics.windowLatencies.getCount(), armMetrics.windowLatencies.getMean(),
+                armMetrics.windowLatencies.getQuantile(0.95), armMetrics.windowFailures.getMean()))
+        return "\n".join(lines)
+
+    def getReport(self, multiArmedBanditConfig):
+        """
+        Get a description of the whole experiment, with the statistics of each m value.
+
+        :param multiArmedBanditConfig:  Configuration of the multi-armed bandit, for the regret.
+
+        :return: Lines of the report.
+        """
+        regret = self.getRegret(multiArmedBanditConfig)
+        lines = ["Rounds: %d" % self.numRounds,
+                 "Failure rate: %.4f" % self.getFailureRate(),
+                 "Percent of rounds where m was sufficiently conservative: %.4f" % self.getPercentSafeM(),
+                 "Committed values per second: %.2f" % self.getCommittedValuesPerSecond(),
+                 "Best fixed m: %s" % self.getBestFixedM(multiArmedBanditConfig),
+                 "Regret vs best fixed m: %.2f reward in total, %.4f per round" % (
+                     regret, (regret / self.numRounds) if (self.numRounds > 0) else 0.0)]
+        quantileHeader = "".join("%10s" % ("p" + str(int(quantile * 100))) for quantile in REPORTED_LATENCY_QUANTILES)
+        lines.append("%6s %8s %10s%s %10s" % ("m", "rounds", "mean", quantileHeader, "failures"))
+        for mValue in sorted(self.metricsByM, key=str):
+            armMetrics = self.metricsByM[mValue]
+            quantiles = "".join("%10.2f" % armMetrics.latencyDigest.getQuantile(quantile) for quantile in
+                                REPORTED_LATENCY_QUANTILES)
+            lines.append("%6s %8d %10.2f%s %10.4f" % (mValue, armMetrics.numRounds, armMetrics.latencyStatistics.mean,
+                                                      quantiles, armMetrics.getFailureRate()))
+        return "\n".join(lines)
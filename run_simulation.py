@@ -1,23 +1,30 @@
 import sys
 from byzantine_mab_configs import *
 from network_manager import *
+from async_network_manager import *
 from multiarmed_bandit_executor import *
-import random
+from random_streams import *
+from consensus_values import *
+from fault_schedules import *
+from node_worker_pool import *
 import joblib
 from byzantine_mab_results import *
 
 
-def getNextConsensusValue():
+def getNextConsensusValue(randomGenerator, valueSpace):
     """
     Get the next value that we want the nodes to agree upon. In the case of a loyal general, this will be what the
     generals sends out.
 
+    :param randomGenerator: numpy Generator to draw the value from.
+    :param valueSpace:      ConsensusValueSpace to draw the value from.
+
     :return: Next value that the nodes should agree upon.
     """
-    return bool(random.getrandbits(1))
+    return valueSpace.sampleValue(randomGenerator)
 
 
-def getInitialFaultToleranceValue(possibleMValues, useCentralizedMab, minMValueMargin):
+def getInitialFaultToleranceValue(possibleMValues, useCentralizedMab, minMValueMargin, randomGenerator):
     """
     Get the initial fault tolerance value(s) to use. Number of faulty nodes that the consensus algorithm should
     tolerate. In the centralized case, this returns one value. In the decentralized case, returns a tuple of 2 m values
@@ -28,6 +35,7 @@ def getInitialFaultToleranceValue(possibleMValues, useCentralizedMab, minMValueM
                                 (need 2 values).
     :param minMValueMargin:     Minimum difference between the m values returned in the distributed case. Ignored in
                                 the centralized case.
+    :param randomGenerator:     numpy Generator to draw the value(s) from.
 
     :return: Initial m value(s) that the consensus algorithm should use. Single value in the centralized case, tuple of
     2 values in the decentralized case.
@@ -36,17 +44,55 @@ def getInitialFaultToleranceValue(possibleMValues, useCentralizedMab, minMValueM
     # TODO do we just want random or do we want to choose the most conservative to start?
     # Maybe this should be part of the multi-armed bandit decider instead
     if (useCentralizedMab):
-        return random.choice(possibleMValues)
+        return possibleMValues[randomGenerator.integers(len(possibleMValues))]
     else:
         # TODO need to choose 2 values
         pass
 
 
-def runSimulation(superConfig, fixedM=None):
+def createSingleRoundResults(latencies, consensuses, currentFaultyNodes, trueConsensusValue, batchSize=1,
+                             timeoutsByNode=None):
+    """
+    Create the results for a round of consensus from the latencies and decisions reported by the nodes.
+
+    :param latencies:           Map of m-value to map of node # to latency experienced.
+    :param consensuses:         Map of m-value to map of node # to the decision reached.
+    :param currentFaultyNodes:  Nodes that were faulty in the round (their decisions don't count towards failure).
+    :param trueConsensusValue:  Value that the general was given to send.
+    :param batchSize:           Number of values agreed on in the round.
+    :param timeoutsByNode:      Map of node # to the number of messages it timed out waiting for, if known.
+
+    :return: SingleRoundResults for the round.
+    """
+    # Get the individual values reached by the nodes -- if they came to the same consensus, this should have only
+    # 1 entry
+    decisionsSet = {}
+    for mVal, decisionsForM in consensuses.items():
+        decisionsSetForM = []
+        for nodeNum, decision in decisionsForM.items():
+            if not (nodeNum in currentFaultyNodes):
+                decisionsSetForM.append(decision)
+        decisionsSet[mVal] = set(decisionsSetForM)
+
+    # We only care if consensus wasn't reached, rather than if the consensus was wrong (TODO I think...?)
+    didFail = {m_val: (len(decisionsSet[m_val]) > 1) for m_val in decisionsSet.keys()}
+
+    singleRoundResults = SingleRoundResults(latencies, consensuses, trueConsensusValue, didFail)
+    singleRoundResults.batchSize = batchSize
+    singleRoundResults.timeoutsByNode = timeoutsByNode
+    return singleRoundResults
+
+
+def runSimulation(superConfig, fixedM=None, randomSeed=None, nodeWorkerPool=None):
     """
     Run the simulation and get results.
 
     :param superConfig: SuperConfig object that provides access to all configuration parameters
+    :param fixedM:      M value to use in every round instead of choosing it with the multi-armed bandit, or None.
+    :param randomSeed:  Seed for the run's random streams, overriding the run config's randomSeed (e.g. for replicas of
+                        the same config, see replication_harness), or None to use the run config's.
+    :param nodeWorkerPool:  NodeWorkerPool to run the nodes on (see SimulationSession), or None to start a process for
+                            each node.
 
     :return: Results (FullResults) for the experiment
     """
@@ -63,31 +109,47 @@ def runSimulation(superConfig, fixedM=None):
     # will be the same for each consensus round in the observation period.
     roundsPerObservationPeriod = roundConfig.roundsPerObservationPeriod
 
+    # Derive every random stream used in the run from a single seed, so the run can be repeated exactly
+    randomStreams = RandomStreams(runConfig.randomSeed if (randomSeed is None) else randomSeed)
+    print("Using random seed " + str(randomStreams.seed))
+    consensusValueRandom = randomStreams.getGenerator(CONSENSUS_VALUE_STREAM)
+    valueSpace = createConsensusValueSpace(runConfig.consensusValueType, runConfig.consensusValueDomainSize,
+                                           runConfig.consensusValuePayloadLength, runConfig.consensusBatchSize)
+
     # Initialize the full results
     fullResults = FullResults()
+    fullResults.randomSeed = randomStreams.seed
 
     consensusFaultToleranceValue = getInitialFaultToleranceValue(runConfig.possibleMValues,
                                                                  runConfig.useCentralizedMultiArmedBandit,
-                                                                 distributedMABConfig.minMValueMargin)
+                                                                 distributedMABConfig.minMValueMargin,
+                                                                 consensusValueRandom)
     if (fixedM != None):
         print("Using fixed m value " + str(fixedM))
         consensusFaultToleranceValue = fixedM
 
     # Create nodes and make network
-    networkManager = NetworkManager(networkLatencyConfig, runConfig.numNodes,
-                                    byzantineErrorConfig.defaultConsensusValue,
-                                    consensusFaultToleranceValue, byzantineErrorConfig.percentDropMessage,
-                                    runConfig.useCentralizedMultiArmedBandit, runConfig.sleepBetweenNodeProcessingMs)
+    networkManagerClass = AsyncNetworkManager if runConfig.useAsyncNetworkManager else NetworkManager
+    networkManager = networkManagerClass(networkLatencyConfig, runConfig.numNodes,
+                                         byzantineErrorConfig.defaultConsensusValue,
+                                         consensusFaultToleranceValue, byzantineErrorConfig.percentDropMessage,
+                                         runConfig.useCentralizedMultiArmedBandit,
+                                         runConfig.sleepBetweenNodeProcessingMs, runConfig.messageTransport,
+                                         runConfig.useDirectPeerDelivery, runConfig.enablePhaseInstrumentation,
+                                         runConfig.messageTraceFile, randomStreams,
+                                         byzantineErrorConfig.faultStrategy, byzantineErrorConfig.faultySetPolicy,
+                                         valueSpace, nodeWorkerPool, runConfig.precomputeRoundFaults)
 
     # Get the number of consensus rounds to run for
     numConsensusRounds = runConfig.numConsensusRounds
 
-    # Initialize the true number of faults to 0
+    # True number of faulty nodes in each round
+    trueFaultyCounts = getTrueFaultyCounts(byzantineErrorConfig.consensusRoundToSetMValue, numConsensusRounds)
     trueFaultsValue = 0
 
     # (Only used in the centralized case) Create the multi-armed bandit executor that will be used to decide the fault
     # tolerance of the consensus algorithm
-    multiArmedBanditExecutor = MultiArmedBanditExecutor(runConfig.possibleMValues, multiArmedBanditConfig)
+    multiArmedBanditExecutor = createMultiArmedBanditExecutor(runConfig.possibleMValues, multiArmedBanditConfig)
 
     networkManager.changeNumFaultyNodes(trueFaultsValue)
 
@@ -96,15 +158,15 @@ def runSimulation(superConfig, fixedM=None):
         print("Consensus run " + str(i + 1) + "/" + str(numConsensusRounds))
         # Change the number of actual faulty nodes if the config says that a new faulty node count should be changed
         # in this round
-        if (i in byzantineErrorConfig.consensusRoundToSetMValue.keys()):
-            trueFaultsValue = byzantineErrorConfig.consensusRoundToSetMValue[i]
-            networkManager.changeNumFaultyNodes(byzantineErrorConfig.consensusRoundToSetMValue[i])
+        if (trueFaultyCounts[i] != trueFaultsValue):
+            trueFaultsValue = int(trueFaultyCounts[i])
+            networkManager.changeNumFaultyNodes(trueFaultsValue)
 
         # Set the nodes that should exhibit byzantine error in the next consensus round
         networkManager.updateFaultyNodes()
 
         # Get the true consensus value that should be passed around
-        trueConsensusValue = getNextConsensusValue()
+        trueConsensusValue = getNextConsensusValue(consensusValueRandom, valueSpace)
 
         # Trigger the nodes to start a consensus round
         # Latencies is map of m-value to map of node # to latency experienced
@@ -113,33 +175,23 @@ def runSimulation(superConfig, fixedM=None):
         latencies, consensuses, currentFaultyNodes = networkManager.startConsensusAndGetNodeLatenciesAndDecisions(
             trueConsensusValue)
 
-        # Get the individual values reached by the nodes -- if they came to the same consensus, this should have only
-        # 1 entry
-        decisionsSet = {}
-        for mVal, decisionsForM in consensuses.items():
-            decisionsSetForM = []
-            for nodeNum, decision in decisionsForM.items():
-                if not (nodeNum in currentFaultyNodes):
-                    decisionsSetForM.append(decision)
-            decisionsSet[mVal] = set(decisionsSetForM)
-
-        # We only care if consensus wasn't reached, rather than if the consensus was wrong (TODO I think...?)
-        didFail = {m_val: (len(decisionsSet[m_val]) > 1) for m_val in decisionsSet.keys()}
-
         # Update the results with the data from the most recent round
-        resultsForRound = SingleRoundResults(latencies, consensuses, trueConsensusValue, didFail)
-        fullResults.addRoundResults(resultsForRound, trueFaultsValue, consensusFaultToleranceValue)
+        resultsForRound = createSingleRoundResults(latencies, consensuses, currentFaultyNodes, trueConsensusValue,
+                                                   valueSpace.batchSize, networkManager.lastRoundTimeoutCounts)
+        fullResults.addRoundResults(resultsForRound, trueFaultsValue, consensusFaultToleranceValue,
+                                    networkManager.lastRoundPhaseStats)
 
         # If we've run the specified number of consensus rounds in the observation period, choose new m value(s) and
         # switch to a new observation period
         if (fixedM == None):
             if (((i + 1) % roundsPerObservationPeriod) == 0):
-                resultsSinceLastDecision = fullResults.getAndResetResultsSinceLastDecision()
+                periodMetrics = fullResults.roundMetrics.takePeriodMetrics()
+                print(fullResults.roundMetrics.getProgressSummary(multiArmedBanditConfig))
 
                 if (runConfig.useCentralizedMultiArmedBandit):
                     # If using a centralized controller, get the next value of m to use and update the nodes to use this
                     # value
-                    consensusFaultToleranceValue = multiArmedBanditExecutor.getNextValueOfM(resultsSinceLastDecision)
+                    consensusFaultToleranceValue = multiArmedBanditExecutor.getNextValueOfM(periodMetrics)
 
                     print("Adjusting consensus fault tolerance value to " + str(consensusFaultToleranceValue))
                     networkManager.setConsensusTolerance(consensusFaultToleranceValue)
@@ -149,9 +201,73 @@ def runSimulation(superConfig, fixedM=None):
 
     networkManager.shutdown()
 
+    print(fullResults.roundMetrics.getReport(multiArmedBanditConfig))
     return fullResults
 
 
+class SimulationSession:
+    """
+    Runs any number of experiments on the same node processes (a NodeWorkerPool), so that a sweep of short experiments
+    doesn't start a process per node per experiment. The experiments can use different node counts, m values, latency
+    configs and protocols.
+
+    Use as a context manager:
+
+        with SimulationSession() as session:
+            for superConfig in superConfigs:
+                fullResults = session.runSimulation(superConfig)
+    """
+
+    def __init__(self, numWorkers=0):
+        """
+        Create the session. The worker processes are started by the first experiment that needs them.
+
+        :param numWorkers:  Number of workers to start with the pool (e.g. the largest node count of a sweep, so the
+                            pool never has to grow).
+        """
+        self.numWorkers = numWorkers
+        self.nodeWorkerPool = None
+
+    def getNodeWorkerPool(self, messageTransport):
+        """
+        Get the pool for the given transport, replacing the current pool if it uses a different one.
+
+        :param messageTransport:    Transport used by the next experiment.
+
+        :return: NodeWorkerPool.
+        """
+        if ((self.nodeWorkerPool is not None) and (self.nodeWorkerPool.messageTransport != messageTransport)):
+            self.nodeWorkerPool.close()
+            self.nodeWorkerPool = None
+        if (self.nodeWorkerPool is None):
+            self.nodeWorkerPool = NodeWorkerPool(self.numWorkers, messageTransport)
+        return self.nodeWorkerPool
+
+    def runSimulation(self, superConfig, fixedM=None, randomSeed=None):
+        """
+        Run an experiment on the session's workers. Takes the same arguments as runSimulation.
+
+        :return: Results (FullResults) for the experiment
+        """
+        nodeWorkerPool = self.getNodeWorkerPool(superConfig.getRunConfig().messageTransport)
+        return runSimulation(superConfig, fixedM, randomSeed, nodeWorkerPool)
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        if (self.nodeWorkerPool is not None):
+            self.nodeWorkerPool.close()
+            self.nodeWorkerPool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+
 if __name__ == "__main__":
 
     multiprocessing.set_start_method('spawn')
@@ -167,7 +283,7 @@ if __name__ == "__main__":
         fixedM = int(sys.argv[3])
 
     # Read the configuration parameters
-    superConfig = readSuperConfigYaml(superConfigFile)
+    superConfig = readSuperConfig(superConfigFile)
 
     # Run the simulation and get the results
     fullResults = runSimulation(superConfig, fixedM)
@@ -0,0 +1,207 @@
+import pickle
+import queue
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Default number of fixed-size slots in each ring buffer
+DEFAULT_RING_SLOT_COUNT = 16384
+
+# Default size of each slot in bytes. Encoded ConsensusMessages are well under this, so nearly every message takes up a
+# single slot. Larger messages take up as many consecutive slots as needed.
+DEFAULT_RING_SLOT_SIZE = 256
+
+# The header holds the read index (number of slots consumed) and the write index (number of slots produced)
+RING_HEADER_SIZE = 16
+READ_INDEX = 0
+WRITE_INDEX = 1
+
+# Each message starts with its encoded length
+MESSAGE_LENGTH_FORMAT = "<I"
+MESSAGE_LENGTH_SIZE = struct.calcsize(MESSAGE_LENGTH_FORMAT)
+
+# Seconds to sleep between checks while waiting for room (put) or for a message (get)
+RING_POLL_INTERVAL_SEC = 0.0001
+
+
+def attachSharedMemory(sharedMemoryName):
+    """
+    Attach to shared memory created by another process. The creating process is responsible for removing it.
+
+    :param sharedMemoryName:    Name of the shared memory.
+
+    :return: multiprocessing.shared_memory.SharedMemory.
+    """
+    try:
+        return shared_memory.SharedMemory(name=sharedMemoryName, track=False)
+    except TypeError:
+        # Python < 3.13 has no way to skip the resource tracker when attaching
+        return shared_memory.SharedMemory(name=sharedMemoryName)
+
+
+class SharedMemoryRingBuffer:
+    """
+    Single-producer/single-consumer ring buffer in shared memory with the same put/get interface as the parts of
+    multiprocessing.Queue used by the network manager and nodes.
+
+    Messages are pickled straight into fixed-size slots of the shared buffer and unpickled straight out of it, so there
+    is no feeder thread and no pipe write. The producer only ever writes the write index and the consumer only ever
+    writes the read index, so no lock is needed as long as there is exactly one producer and one consumer.
+    """
+
+    def __init__(self, slotCount=DEFAULT_RING_SLOT_COUNT, slotSize=DEFAULT_RING_SLOT_SIZE):
+        """
+        Create the ring buffer (and the shared memory backing it).
+
+        :param slotCount:   Number of slots in the ring.
+        :param slotSize:    Size in bytes of each slot.
+        """
+        self.slotCount = slotCount
+        self.slotSize = slotSize
+        self.sharedMemory = shared_memory.SharedMemory(create=True, size=RING_HEADER_SIZE + (slotCount * slotSize))
+        self.ownsSharedMemory = True
+        self.attachViews()
+        self.indices[READ_INDEX] = 0
+        self.indices[WRITE_INDEX] = 0
+
+    def attachViews(self):
+        """
+        Set up the views onto the shared memory.
+        """
+        self.indices = self.sharedMemory.buf[:RING_HEADER_SIZE].cast("Q")
+        self.data = self.sharedMemory.buf[RING_HEADER_SIZE:]
+        self.capacityBytes = self.slotCount * self.slotSize
+
+    def __getstate__(self):
+        # Only the name is sent to the other process, which attaches to the same block of shared memory
+        return (self.sharedMemory.name, self.slotCount, self.slotSize)
+
+    def __setstate__(self, state):
+        sharedMemoryName, self.slotCount, self.slotSize = state
+        self.sharedMemory = attachSharedMemory(sharedMemoryName)
+        self.ownsSharedMemory = False
+        self.attachViews()
+
+    def getSlotsNeeded(self, numBytes):
+        """
+        Get the number of slots needed to hold a message.
+
+        :param numBytes:    Length of the encoded message.
+
+        :return: Number of consecutive slots the message (with its length prefix) takes up.
+        """
+        return -(-(MESSAGE_LENGTH_SIZE + numBytes) // self.slotSize)
+
+    def copyIntoRing(self, byteOffset, payload):
+        """
+        Copy bytes into the ring starting at the given offset, wrapping around the end of the buffer if needed.
+
+        :param byteOffset:  Offset into the data region to start writing at.
+        :param payload:     Bytes to write.
+        """
+        firstPartLength = min(len(payload), self.capacityBytes - byteOffset)
+        self.data[byteOffset:byteOffset + firstPartLength] = payload[:firstPartLength]
+        if (firstPartLength < len(payload)):
+            self.data[:len(payload) - firstPartLength] = payload[firstPartLength:]
+
+    def readFromRing(self, byteOffset, numBytes):
+        """
+        Get a view of (or, if the bytes wrap around the end of the buffer, a copy of) bytes in the ring.
+
+        :param byteOffset:  Offset into the data region to start reading at.
+        :param numBytes:    Number of bytes to read.
+
+        :return: Bytes-like object with the requested bytes.
+        """
+        if ((byteOffset + numBytes) <= self.capacityBytes):
+            return self.data[byteOffset:byteOffset + numBytes]
+        firstPartLength = self.capacityBytes - byteOffset
+        return bytes(self.data[byteOffset:]) + bytes(self.data[:numBytes - firstPartLength])
+
+    def put(self, obj, block=True, timeout=None):
+        """
+        Add a message to the ring.
+
+        :param obj:     Message to add.
+        :param block:   True if we should wait for space in the ring, false if we should fail right away when full.
+        :param timeout: Maximum seconds to wait for space (None to wait indefinitely). Only used if block is true.
+        """
+        payload = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        slotsNeeded = self.getSlotsNeeded(len(payload))
+        if (slotsNeeded > self.slotCount):
+            raise ValueError("Message of " + str(len(payload)) + " bytes does not fit in a ring buffer of " + str(
+                self.capacityBytes) + " bytes")
+
+        writeIndex = self.indices[WRITE_INDEX]
+        deadline = None if (timeout is None) else (time.monotonic() + timeout)
+        while ((writeIndex + slotsNeeded - self.indices[READ_INDEX]) > self.slotCount):
+            if ((not block) or ((deadline is not None) and (time.monotonic() >= deadline))):
+                raise queue.Full
+            time.sleep(RING_POLL_INTERVAL_SEC)
+
+        byteOffset = (writeIndex % self.slotCount) * self.slotSize
+        self.copyIntoRing(byteOffset, struct.pack(MESSAGE_LENGTH_FORMAT, len(payload)))
+        self.copyIntoRing((byteOffset + MESSAGE_LENGTH_SIZE) % self.capacityBytes, payload)
+        # Publish the message only after its bytes have been written
+        self.indices[WRITE_INDEX] = writeIndex + slotsNeeded
+
+    def put_nowait(self, obj):
+        self.put(obj, block=False)
+
+    def get(self, block=True, timeout=None):
+        """
+        Remove and return the oldest message in the ring.
+
+        :param block:   True if we should wait for a message, false if we should fail right away when empty.
+        :param timeout: Maximum seconds to wait for a message (None to wait indefinitely). Only used if block is true.
+
+        :return: The oldest message.
+        """
+        readIndex = self.indices[READ_INDEX]
+        deadline = None if (timeout is None) else (time.monotonic() + timeout)
+        while (readIndex == self.indices[WRITE_INDEX]):
+            if ((not block) or ((deadline is not None) and (time.monotonic() >= deadline))):
+                raise queue.Empty
+            time.sleep(RING_POLL_INTERVAL_SEC)
+
+        byteOffset = (readIndex % self.slotCount) * self.slotSize
+        (messageLength,) = struct.unpack(MESSAGE_LENGTH_FORMAT, self.readFromRing(byteOffset, MESSAGE_LENGTH_SIZE))
+        payloadView = self.readFromRing((byteOffset + MESSAGE_LENGTH_SIZE) % self.capacityBytes, messageLength)
+        msg = pickle.loads(payloadView)
+        if (isinstance(payloadView, memoryview)):
+            payloadView.release()
+        # Free the slots only after the message has been decoded
+        self.indices[READ_INDEX] = readIndex + self.getSlotsNeeded(messageLength)
+        return msg
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self):
+        return self.indices[READ_INDEX] == self.indices[WRITE_INDEX]
+
+    def releaseViews(self):
+        """
+        Release the views onto the shared memory (the shared memory can't be closed while they exist).
+        """
+        if (self.indices is not None):
+            self.indices.release()
+            self.data.release()
+            self.indices = None
+            self.data = None
+
+    def close(self):
+        """
+        Release this process's mapping of the shared memory. The creating process also removes the shared memory.
+        """
+        if (self.indices is None):
+            return
+        self.releaseViews()
+        self.sharedMemory.close()
+        if (self.ownsSharedMemory):
+            self.sharedMemory.unlink()
+
+    def __del__(self):
+        # Processes that only attached to the ring usually exit without closing it
+        if (getattr(self, "indices", None) is not None):
+            self.releaseViews()
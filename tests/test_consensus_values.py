@@ -0,0 +1,87 @@
+"""
+Tests for the majority aggregation of consensus values. Run from the repository root:
+
+    python -m unittest tests.test_consensus_values
+"""
+import itertools
+import unittest
+import numpy as np
+
+from consensus_values import *
+
+
+def getMajorityOfBooleans(tiebreakerValue, booleansList):
+    # The nodes' aggregation before other value types were supported
+    trueCount = booleansList.count(True)
+    falseCount = booleansList.count(False)
+
+    if (trueCount == falseCount):
+        return tiebreakerValue
+    return trueCount > falseCount
+
+
+class MajorityValueTest(unittest.TestCase):
+
+    def test_booleans_match_the_original_aggregation(self):
+        for numValues in range(8):
+            for values in itertools.product([False, True], repeat=numValues):
+                for tiebreakerValue in [False, True]:
+                    self.assertEqual(getMajorityValue(tiebreakerValue, list(values)),
+                                     getMajorityOfBooleans(tiebreakerValue, list(values)), str(values))
+
+    def test_boolean_tie_uses_the_tiebreaker(self):
+        self.assertIs(getMajorityValue(True, [True, False, False, True]), True)
+        self.assertIs(getMajorityValue(False, [True, False, False, True]), False)
+        self.assertEqual(getMajorityValue(np.True_, [False, True]), True)
+
+    def test_ints_need_a_strict_majority(self):
+        self.assertEqual(getMajorityValue(0, [3, 3, 1, 3, 2]), 3)
+        # 3 is the most common value but isn't held by more than half of the list
+        self.assertEqual(getMajorityValue(0, [3, 3, 1, 2]), 0)
+        self.assertEqual(getMajorityValue(5, [1, 1, 2, 2]), 5)
+        self.assertEqual(getMajorityValue(4, [2]), 2)
+
+    def test_bytes_need_a_strict_majority(self):
+        a, b, c = b"\x00" * 4, b"\x01" * 4, b"\xff" * 4
+        self.assertEqual(getMajorityValue(c, [a, b, a]), a)
+        self.assertEqual(getMajorityValue(c, [a, b, a, b]), c)
+        self.assertEqual(getMajorityValue(c, [a, b, c]), c)
+
+
+class MajorityOfBatchesTest(unittest.TestCase):
+
+    def checkMatchesEachPosition(self, tiebreakerBatch, batches):
+        expectedBatch = tuple(getMajorityValue(tiebreakerBatch[i], [batch[i] for batch in batches]) for i in
+                              range(len(tiebreakerBatch)))
+        self.assertEqual(getMajorityValue(tiebreakerBatch, batches), expectedBatch)
+
+    def test_boolean_batches(self):
+        # Majority true, majority false and a tie in different positions
+        batches = [(True, False, True), (True, False, False), (False, True, True), (True, False, False)]
+        self.assertEqual(getMajorityValue((False, True, True), batches), (True, False, True))
+        self.assertEqual(getMajorityValue((False, True, False), batches), (True, False, False))
+        for i in range(20):
+            randomGenerator = np.random.default_rng(i)
+            batches = [tuple((randomGenerator.random(5) < 0.5).tolist()) for j in range(randomGenerator.integers(1, 8))]
+            self.checkMatchesEachPosition(tuple((randomGenerator.random(5) < 0.5).tolist()), batches)
+
+    def test_int_batches(self):
+        # A majority, no majority (the tiebreaker, larger than any value in the batches) and a tie
+        batches = [(2, 0, 1), (2, 1, 1), (2, 2, 0), (0, 3, 0)]
+        self.assertEqual(getMajorityValue((9, 9, 9), batches), (2, 9, 9))
+        for i in range(20):
+            randomGenerator = np.random.default_rng(i)
+            domainSize = int(randomGenerator.integers(2, 6))
+            batches = [tuple(randomGenerator.integers(domainSize, size=4).tolist()) for j in
+                       range(randomGenerator.integers(1, 8))]
+            self.checkMatchesEachPosition(tuple(randomGenerator.integers(domainSize, size=4).tolist()), batches)
+
+    def test_bytes_batches(self):
+        a, b = b"\x00\x01", b"\x02\x03"
+        batches = [(a, b), (a, a), (b, b)]
+        self.assertEqual(getMajorityValue((b, a), batches), (a, b))
+        self.assertEqual(getMajorityValue((b, a), batches[:2]), (a, a))
+
+
+if __name__ == "__main__":
+    unittest.main()
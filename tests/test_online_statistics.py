@@ -0,0 +1,61 @@
+"""
+Tests for the streaming statistics. Run from the repository root:
+
+    python -m unittest tests.test_online_statistics
+"""
+import unittest
+import numpy as np
+
+from online_statistics import *
+
+
+class TDigestTest(unittest.TestCase):
+
+    def createDigest(self, values):
+        digest = TDigest()
+        for value in values:
+            digest.addValue(value)
+        return digest
+
+    def test_quantiles_match_numpy(self):
+        values = np.random.default_rng(1).lognormal(3, 0.5, 5000)
+        digest = self.createDigest(values)
+        for quantile in [0.5, 0.95, 0.99]:
+            # Fraction of the values below the estimate
+            estimatedQuantile = np.mean(values < digest.getQuantile(quantile))
+            self.assertAlmostEqual(estimatedQuantile, quantile, delta=0.005)
+
+    def test_scale_weights_leaves_quantiles_unchanged(self):
+        values = np.random.default_rng(2).normal(100, 20, 300)
+        digest = self.createDigest(values)
+        quantilesBefore = [digest.getQuantile(quantile) for quantile in [0.5, 0.95, 0.99]]
+        # Down to well below a total weight of 1
+        for i in range(12):
+            digest.scaleWeights(0.6)
+            quantilesAfter = [digest.getQuantile(quantile) for quantile in [0.5, 0.95, 0.99]]
+            for before, after in zip(quantilesBefore, quantilesAfter):
+                self.assertAlmostEqual(before, after, delta=0.02 * before)
+
+    def test_discounted_outlier_leaves_the_tail(self):
+        digest = self.createDigest([2400.0])
+        for i in range(10):
+            digest.scaleWeights(0.6)
+            for value in np.random.default_rng(i).normal(100, 5, 15):
+                digest.addValue(value)
+        self.assertLess(digest.getQuantile(0.99), 150)
+        self.assertLess(digest.getQuantile(0.5), 110)
+
+
+class SlidingWindowStatisticsTest(unittest.TestCase):
+
+    def test_window_keeps_most_recent_values(self):
+        window = SlidingWindowStatistics(3)
+        for value in [10, 1, 2, 3]:
+            window.addValue(value)
+        self.assertEqual(window.getCount(), 3)
+        self.assertAlmostEqual(window.getMean(), 2)
+        self.assertAlmostEqual(window.getQuantile(0.5), np.quantile([1, 2, 3], 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Tests for the precomputed round fault tables. Run from the repository root:
+
+    python -m unittest tests.test_round_fault_tables
+"""
+import itertools
+import unittest
+
+from round_fault_tables import *
+
+
+def getOralMessagesChains(numNodes, mValue, commandingGeneral):
+    """
+    Enumerate the commanding general chains of a round of OM(m): every chain starts with the commanding general, never
+    repeats a node and has at most m + 1 nodes.
+
+    :return: List of chains (tuples).
+    """
+    otherNodes = [node for node in range(numNodes) if (node != commandingGeneral)]
+    chains = []
+    for chainLength in range(1, mValue + 2):
+        for relayers in itertools.permutations(otherNodes, chainLength - 1):
+            chains.append((commandingGeneral,) + relayers)
+    return chains
+
+
+class RoundFaultTablesTest(unittest.TestCase):
+
+    def checkTablesAreExact(self, numNodes, mValue, commandingGeneral):
+        tables = RoundFaultTables(numNodes, mValue + 1)
+        try:
+            # Every slot is delivered with no lie, so only the slot counting is exercised
+            tables.header[FAULT_TABLES_ROUND_ID] = 1
+            tables.header[FAULT_TABLES_CHAIN_LENGTH] = mValue + 1
+            tables.startRound(1)
+
+            # Every message of the round: the last node of its chain sends it to every node not in the chain
+            usedLinks = set()
+            for chain in getOralMessagesChains(numNodes, mValue, commandingGeneral):
+                for dest in range(numNodes):
+                    if (dest in chain):
+                        continue
+                    self.assertEqual(tables.takeMessageFaults(chain[-1], dest, len(chain)), (0.0, False),
+                                     "no slot for chain " + str(chain) + " to node " + str(dest))
+                    usedLinks.add((chain[-1], dest, len(chain)))
+
+            # Every link that carried messages has used up all of its slots
+            for sender, dest, chainLength in usedLinks:
+                self.assertIsNone(tables.takeMessageFaults(sender, dest, chainLength),
+                                  "slot left over for link " + str((sender, dest, chainLength)))
+        finally:
+            tables.close()
+
+    def test_every_message_has_exactly_one_slot(self):
+        for numNodes, mValue in [(4, 0), (4, 1), (4, 2), (5, 3), (7, 2), (10, 3)]:
+            for commandingGeneral in [0, numNodes - 1]:
+                with self.subTest(numNodes=numNodes, mValue=mValue, commandingGeneral=commandingGeneral):
+                    self.checkTablesAreExact(numNodes, mValue, commandingGeneral)
+
+    def test_messages_per_link(self):
+        self.assertEqual(getMessagesPerLink(7, 1), 1)
+        # Chains of length 3 between two relayers: the general, one of the other n - 3 nodes, then the sender
+        self.assertEqual(getMessagesPerLink(7, 3), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()